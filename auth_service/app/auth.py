@@ -3,7 +3,8 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from app.models import TokenData, UserInDB
-from app.database import get_user, verify_password
+from app.database import get_user, verify_password_async
+from app.metrics import CallbackGauge
 import logging
 
 # Configure logger
@@ -12,17 +13,18 @@ logger = logging.getLogger("auth_service")
 # In-memory token storage
 # Structure: {token: {"username": username, "role": role, "expiry": datetime}}
 tokens_db: Dict[str, dict] = {}
+CallbackGauge("tokens_db_size", "Tokens currently stored, including expired ones not yet cleaned up", lambda: len(tokens_db))
 
 # Token expiration time in minutes
 TOKEN_EXPIRE_MINUTES = 30
 
-def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
+async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
     """Verify username and password and return user if valid"""
     user = get_user(username)
     if not user:
         logger.warning(f"User not found: {username}")
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         logger.warning(f"Invalid password for user: {username}")
         return None
     return user
@@ -44,15 +46,13 @@ def create_access_token(username: str, role: str) -> str:
         "expiry": expiry
     }
     
-    logger.info(f"Created token for user: {username}, token value: {token[:10]}...")
+    logger.info(f"Created token for user: {username}")
     logger.info(f"Total tokens in DB: {len(tokens_db)}")
     return token
 
 def verify_token(token: str) -> Optional[dict]:
     """Verify token exists and not expired, return user data if valid"""
-    logger.info(f"Verifying token: {token[:10]}...")
-    logger.info(f"Total tokens in DB: {len(tokens_db)}")
-    logger.info(f"Known tokens: {[t[:10] for t in tokens_db.keys()]}")
+    logger.debug(f"Verifying token, total tokens in DB: {len(tokens_db)}")
     
     if token not in tokens_db:
         logger.warning("Token not found in database")
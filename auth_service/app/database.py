@@ -1,30 +1,71 @@
-from passlib.context import CryptContext
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from app.models import User, UserInDB, UserCreate
+from app.metrics import Gauge, Histogram
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context, created on first use because importing passlib is slow
+pwd_context = None
+
+# Threads running bcrypt for logins, so password checks do not block the event loop
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", 4))
+password_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+# Password check load, reported on /metrics
+bcrypt_queue_depth = Gauge("bcrypt_queue_depth", "Password checks waiting for a bcrypt worker")
+bcrypt_duration = Histogram("bcrypt_duration_seconds", "Time bcrypt spends on one password check")
 
 # In-memory user database
 users_db = {}
+# Set once the initial users exist, checked by /readyz
+users_ready = False
+
+# Initial users for testing, with pre-computed bcrypt hashes so startup does not hash
+# (passwords: admin123, secretary123 and agent123)
+SEED_USERS = [
+    {"username": "admin", "hashed_password": "$2b$12$Tw6USkR3Ms/UpZRP7RNjG.kXUQS6rXwmuNnDlko9aj.nicPB47E1C", "role": "admin"},
+    {"username": "secretary", "hashed_password": "$2b$12$HPqKIpypz5xL0vhp4YV9wuksMREaLIlnik4Inpzdj3j6M.CHykzLa", "role": "secretary"},
+    {"username": "agent", "hashed_password": "$2b$12$mB32/Hh2eBFlpAT7Wm0woOjjBBfKhTfrfzJeL2JRtsIbnX9PPwCpK", "role": "agent"},
+]
 
 # Add some initial users for testing
 def initialize_users():
-    users = [
-        UserCreate(username="admin", password="admin123", role="admin"),
-        UserCreate(username="secretary", password="secretary123", role="secretary"),
-        UserCreate(username="agent", password="agent123", role="agent")
-    ]
+    for record in SEED_USERS:
+        users_db[record["username"]] = UserInDB(**record).dict()
     
-    for user in users:
-        create_user(user)
+    global users_ready
+    users_ready = True
+
+
+def users_initialized() -> bool:
+    return users_ready
+
+
+def get_pwd_context():
+    global pwd_context
+    if pwd_context is None:
+        from passlib.context import CryptContext
+        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return pwd_context
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Check a password on the bcrypt pool"""
+    def check():
+        bcrypt_queue_depth.dec()
+        with bcrypt_duration.time():
+            return verify_password(plain_password, hashed_password)
+
+    bcrypt_queue_depth.inc()
+    return await asyncio.get_running_loop().run_in_executor(password_pool, check)
 
 
 def get_user(username: str) -> UserInDB:
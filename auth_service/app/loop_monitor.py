@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from typing import Optional
+from app.metrics import Counter, CallbackGauge, Histogram
+from app.logger import get_logger
+
+# The monitor is on by default, it only wakes up every LOOP_MONITOR_INTERVAL_MS
+LOOP_MONITOR_ENABLED = os.environ.get("LOOP_MONITOR_ENABLED", "1").lower() in ("1", "true", "yes")
+# How often the event loop is probed
+LOOP_MONITOR_INTERVAL_MS = float(os.environ.get("LOOP_MONITOR_INTERVAL_MS", 100))
+# A loop that does not respond for this long is blocked, and its stack is logged
+LOOP_BLOCK_THRESHOLD_MS = float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", 250))
+
+# Lag buckets in seconds
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Configure logger
+logger = get_logger("auth_service.loop_monitor")
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag and reports blocking calls.
+
+    A heartbeat task sleeps for a fixed interval and records how late it
+    wakes up. A watchdog thread watches the heartbeat; when the loop has not
+    answered for LOOP_BLOCK_THRESHOLD_MS it logs the stack of the loop thread
+    and the task that is running, once per blocking episode.
+    """
+
+    def __init__(self, interval_ms: float = LOOP_MONITOR_INTERVAL_MS, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+        self.interval = interval_ms / 1000.0
+        self.threshold = threshold_ms / 1000.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.last_beat = time.perf_counter()
+        self.last_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+        self.lag = Histogram("event_loop_lag_seconds", "How late the event loop runs a scheduled callback", buckets=LAG_BUCKETS)
+        self.blocked = Counter("event_loop_blocked_total", "Times the event loop was blocked longer than the threshold")
+        CallbackGauge("event_loop_lag_last_seconds", "Lag measured by the latest probe", lambda: self.last_lag)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """Start the heartbeat on the running loop and the watchdog thread"""
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.perf_counter()
+        self.stop_event.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+        logger.info(f"Event loop monitor started: interval={self.interval * 1000:.0f}ms, threshold={self.threshold * 1000:.0f}ms")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self.stop_event.set()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.watchdog.join()
+        self.watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.last_lag = max(0.0, now - expected)
+            self.lag.observe(self.last_lag)
+            self.last_beat = now
+
+    def _watch(self):
+        reported_beat = None
+        while not self.stop_event.wait(self.threshold / 2):
+            beat = self.last_beat
+            stalled = time.perf_counter() - beat - self.interval
+            if stalled < self.threshold or beat == reported_beat:
+                continue
+            # Report each blocking episode once
+            reported_beat = beat
+            self.blocked.inc()
+            self._report(stalled)
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+        task = asyncio.current_task(self.loop)
+        task_name = f"{task.get_name()} {task.get_coro()!r}" if task is not None else "none (callback or loop internals)"
+        logger.warning(
+            f"Event loop blocked for more than {stalled * 1000:.0f}ms\n"
+            f"Running task: {task_name}\n"
+            f"Loop thread stack (most recent call last):\n{stack}"
+        )
+
+
+# Shared monitor started by the service lifespan
+loop_monitor = LoopMonitor()
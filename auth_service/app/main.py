@@ -1,24 +1,36 @@
 import os
-from datetime import timedelta, datetime
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
+import time
+
+# Startup is timed from here, so the report includes importing the service's modules
+STARTUP_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 try:
     # First try relative imports for running as module
-    from app.models import Token, UserCreate, UserResponse, User, LoginRequest
-    from app.database import get_user, create_user, delete_user, initialize_users
+    from app.models import Token, UserCreate, UserResponse, LoginRequest
+    from app.database import get_user, create_user, delete_user, initialize_users, users_initialized
     from app.auth import authenticate_user, create_access_token, verify_token, cleanup_expired_tokens
-    from app.logger import get_logger, RequestResponseFilter
+    from app.logger import get_logger, start_log_writer, stop_log_writer
+    from app.request_logging import load_request_log_policy, RequestLoggingMiddleware
+    from app.metrics import MetricsMiddleware, render_metrics
+    from app.profiling import create_profiling_router
+    from app.loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+    from app.startup import StartupTimer, warm_imports
 except ImportError:
     # Fall back to direct imports for running directly
-    from models import Token, UserCreate, UserResponse, User, LoginRequest
-    from database import get_user, create_user, delete_user, initialize_users
+    from models import Token, UserCreate, UserResponse, LoginRequest
+    from database import get_user, create_user, delete_user, initialize_users, users_initialized
     from auth import authenticate_user, create_access_token, verify_token, cleanup_expired_tokens
-    from logger import get_logger, RequestResponseFilter
-import logging
-import uuid
-import json
+    from logger import get_logger, start_log_writer, stop_log_writer
+    from request_logging import load_request_log_policy, RequestLoggingMiddleware
+    from metrics import MetricsMiddleware, render_metrics
+    from profiling import create_profiling_router
+    from loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+    from startup import StartupTimer, warm_imports
 import asyncio
 
 # Create logs directory if it doesn't exist
@@ -27,8 +39,20 @@ os.makedirs("logs", exist_ok=True)
 # Define lifespan context manager for FastAPI startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize users on startup
-    initialize_users()
+    startup = StartupTimer(STARTUP_STARTED)
+    startup.mark("imports")
+    
+    # Write log records from the background thread
+    start_log_writer()
+    
+    # Watch the event loop for lag and blocking calls
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    startup.mark("monitoring")
+    
+    # Initialize users on startup, from pre-hashed records
+    with startup.phase("users"):
+        initialize_users()
     logger.info("Authentication Service started and users initialized")
     
     # Run token cleanup periodically
@@ -42,9 +66,15 @@ async def lifespan(app: FastAPI):
     # Start background task
     cleanup_task = asyncio.create_task(cleanup_loop())
     
+    startup.report("Authentication Service")
+    # Load the password hashing library in the background, it is only needed for logins
+    warmup_task = asyncio.create_task(warm_imports(["passlib.context", "passlib.handlers.bcrypt"]))
+    
     # Yield control back to FastAPI
     yield
     
+    warmup_task.cancel()
+    
     # Shutdown: Cancel the cleanup task
     if cleanup_task:
         cleanup_task.cancel()
@@ -53,6 +83,11 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
         logger.info("Authentication Service shutting down")
+    
+    await loop_monitor.stop()
+    
+    # Flush queued log records before exiting
+    stop_log_writer()
 
 # Create and configure the application
 app = FastAPI(
@@ -75,60 +110,45 @@ app.add_middleware(
 # Configure logger
 logger = get_logger("auth_service", "auth_service.log")
 
+# Decides which requests are logged and in how much detail
+request_log_policy = load_request_log_policy("/verify-token=errors,/api/auth/verify=errors,/healthz=off,/readyz=errors")
+
 # Middleware for request/response logging
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    request_id = str(uuid.uuid4())
-    client_host = request.client.host if request.client else "unknown"
-    
-    # Log request path and method without reading the body
-    port = os.environ.get("AUTHENTICATION_PORT", 8080)
-    
-    # Prepare request logging data
-    log_data = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "request_id": request_id,
-        "source": client_host,
-        "destination": f"auth_service:{port}{request.url.path}",
-        "method": request.method,
-        "path": request.url.path,
-        "query_params": dict(request.query_params),
-        "headers": dict(request.headers),
-    }
-    
-    # Print detailed request log to terminal
-    print(f"\n[AUTH-REQUEST] {datetime.utcnow().isoformat()} | {request.method} {request.url.path}")
-    print(f"  Source: {client_host}")
-    print(f"  Headers: {json.dumps(dict(request.headers), indent=2)}")
-    print(f"  Query params: {json.dumps(dict(request.query_params), indent=2)}")
-    
-    # Also log to file
-    logger.info(f"Request: {json.dumps(log_data)}")
-    
-    # Process the request without trying to read/reconstruct the body
-    response = await call_next(request)
-    
-    # Create a response log
-    response_log = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "request_id": request_id,
-        "statusCode": response.status_code,
-        "headers": dict(response.headers),
-    }
-    
-    # Print response log to terminal
-    print(f"[AUTH-RESPONSE] {datetime.utcnow().isoformat()} | Status: {response.status_code}")
-    print(f"  Headers: {json.dumps(dict(response.headers), indent=2)}")
-    
-    # Also log to file
-    logger.info(f"Response: {json.dumps(response_log)}")
-    
-    return response
+app.add_middleware(
+    RequestLoggingMiddleware,
+    logger=logger,
+    service="auth_service",
+    port=os.environ.get("AUTHENTICATION_PORT", 8080),
+    policy=request_log_policy
+)
+
+# Request latency and in-flight metrics
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: the initial users are loaded"""
+    checks = {"users": users_initialized()}
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
 
 # Authentication endpoints
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         logger.warning(f"Failed login attempt for user: {form_data.username}")
         raise HTTPException(
@@ -148,7 +168,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 # Also keep the original endpoint for backward compatibility
 @app.post("/api/auth/login", response_model=Token)
 async def login_for_access_token_legacy(login_data: LoginRequest):
-    user = authenticate_user(login_data.username, login_data.password)
+    user = await authenticate_user(login_data.username, login_data.password)
     if not user:
         logger.warning(f"Failed login attempt for user: {login_data.username}")
         raise HTTPException(
@@ -168,8 +188,7 @@ async def login_for_access_token_legacy(login_data: LoginRequest):
 @app.get("/api/auth/verify")
 async def verify_token_endpoint(token: str):
     """Verify if a token is valid and return role information"""
-    # Add debug logging
-    logger.info(f"Received verification request for token: {token[:10] if len(token) > 10 else token}...")
+    logger.debug("Received verification request")
     
     token_data = verify_token(token)
     if not token_data:
@@ -196,7 +215,7 @@ async def verify_token_standard(token: str = None, authorization: str = None):
         logger.warning("No token provided")
         return {"valid": False, "error": "No token provided"}
     
-    logger.info(f"Verifying token: {actual_token[:10] if len(actual_token) > 10 else actual_token}...")
+    logger.debug("Verifying token")
     token_data = verify_token(actual_token)
     
     if not token_data:
@@ -249,6 +268,20 @@ async def remove_user(username: str, token: str):
     logger.info(f"User deleted: {username}")
     return {"detail": "User deleted successfully"}
 
+def require_admin_token(token: str):
+    """Admin check for the profiling endpoints, using the same token parameter as user management"""
+    token_data = verify_token(token)
+    if not token_data or token_data["role"] != "admin":
+        logger.warning(f"Unauthorized profiling attempt")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can profile the service"
+        )
+    return token_data
+
+# Admin-only profiling endpoints, idle until a session is started
+app.include_router(create_profiling_router(require_admin_token))
+
 if __name__ == "__main__":
     import uvicorn
     # Get port from environment variable or use default 8080
@@ -0,0 +1,79 @@
+"""
+Run the Authentication Service on TCP and a Unix domain socket at once.
+
+uvicorn serves a single address per process, so this binds (or inherits)
+the sockets and hands them all to one uvicorn server. Co-located services
+can then verify tokens over the Unix socket, e.g.:
+    python -m app.serve --port 8080 --uds /tmp/auth_service.sock
+    AUTH_SERVICE_URL=unix:/tmp/auth_service.sock  (for the Transaction Service)
+"""
+
+import os
+import socket
+import argparse
+import uvicorn
+
+
+def bind_tcp(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def bind_unix(path: str, backlog: int) -> socket.socket:
+    """Listen on a Unix socket, replacing a stale socket file left by a previous run"""
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    # Only processes of the same user and group may call the service
+    os.chmod(path, 0o660)
+    sock.listen(backlog)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Authentication Service on TCP and/or a Unix socket")
+    parser.add_argument("--host", default="0.0.0.0", help="TCP address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("AUTHENTICATION_PORT", 8080)), help="TCP port, 0 to disable TCP")
+    parser.add_argument("--uds", help="also listen on this Unix socket path")
+    parser.add_argument("--fd", type=int, action="append", default=[], help="serve an inherited listening socket instead of binding (repeatable)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--loop", default="auto")
+    parser.add_argument("--http", default="auto")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--timeout-graceful-shutdown", type=int)
+    parser.add_argument("--limit-concurrency", type=int)
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+
+    if args.fd:
+        # Sockets bound by the supervisor
+        sockets = [socket.socket(fileno=fd) for fd in args.fd]
+    else:
+        sockets = []
+        if args.port:
+            sockets.append(bind_tcp(args.host, args.port, args.backlog))
+        if args.uds:
+            sockets.append(bind_unix(args.uds, args.backlog))
+    if not sockets:
+        parser.error("nothing to listen on: give --port, --uds or --fd")
+
+    config = uvicorn.Config(
+        "app.main:app",
+        loop=args.loop,
+        http=args.http,
+        timeout_keep_alive=args.timeout_keep_alive,
+        timeout_graceful_shutdown=args.timeout_graceful_shutdown,
+        limit_concurrency=args.limit_concurrency,
+        access_log=not args.no_access_log,
+    )
+    addresses = ", ".join(str(sock.getsockname()) for sock in sockets)
+    print(f"Starting Authentication Service on {addresses}")
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+if __name__ == "__main__":
+    main()
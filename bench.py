@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the services' hot paths, run in a single process.
+
+Both services are imported as in combined_service.py and requests go through
+an in-process ASGI client, so no sockets are opened. Results can be saved as
+a baseline and later runs compared against it, failing on regressions:
+    python bench.py
+    python bench.py --save bench_baseline.json
+    python bench.py --compare bench_baseline.json --tolerance 15
+    python bench.py --filter auth. --tokens 1000,10000
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+from contextlib import AsyncExitStack
+
+# The loop monitor would report the benchmark loops themselves as blocking calls
+os.environ.setdefault("LOOP_MONITOR_ENABLED", "0")
+
+# Live token counts for the token store benchmarks
+DEFAULT_TOKENS = "1000,10000,100000,1000000"
+# Rows per page for the conversion and validation benchmarks
+PAGE_SIZES = (20, 100)
+
+
+class Benchmark:
+    """
+    One timed operation. `setup` runs before each round and is not timed;
+    `func` is a plain function or a coroutine function taking no arguments.
+    """
+
+    def __init__(self, name: str, func, setup=None, is_async: bool = False):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.is_async = is_async
+
+
+class Runner:
+    def __init__(self, loop, min_time: float, rounds: int):
+        self.loop = loop
+        self.min_time = min_time
+        self.rounds = rounds
+
+    def time(self, benchmark: Benchmark, iterations: int) -> float:
+        if benchmark.setup:
+            benchmark.setup()
+        if benchmark.is_async:
+            return self.loop.run_until_complete(self.time_async(benchmark.func, iterations))
+        func = benchmark.func
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return time.perf_counter() - started
+
+    @staticmethod
+    async def time_async(func, iterations: int) -> float:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        return time.perf_counter() - started
+
+    def calibrate(self, benchmark: Benchmark) -> int:
+        """Iterations per round so that one round takes at least min_time (1, 2, 5, 10, 20, ...)"""
+        iterations = 1
+        while True:
+            for step in (1, 2, 5):
+                count = iterations * step
+                if self.time(benchmark, count) >= self.min_time:
+                    return count
+            iterations *= 10
+
+    def run(self, benchmark: Benchmark) -> dict:
+        iterations = self.calibrate(benchmark)
+        per_call = [self.time(benchmark, iterations) / iterations for _ in range(self.rounds)]
+        return {
+            "iterations": iterations,
+            "rounds": self.rounds,
+            "median_us": round(statistics.median(per_call) * 1e6, 3),
+            "min_us": round(min(per_call) * 1e6, 3),
+        }
+
+
+async def asgi_request(app, method: str, path: str, query: str = "", headers=None, body: bytes = b""):
+    """Call an ASGI app directly and return (status, body)"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+    request = {"type": "http.request", "body": body, "more_body": False}
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal request
+        message, request = request, {"type": "http.disconnect"}
+        return message
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def fill_tokens(tokens_db: dict, count: int):
+    """Replace the token store with `count` live tokens"""
+    tokens_db.clear()
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    for i in range(count):
+        tokens_db[f"{i:022d}|agent"] = {"username": f"user{i}", "role": "agent", "expiry": expiry}
+
+
+def quiet_console():
+    """Discard console log output, so the terminal does not dominate the timings; log files are still written"""
+    devnull = open(os.devnull, "w")
+    for module in ("auth_service_app.logger", "transaction_service_app.logger"):
+        for queue_handler in sys.modules[module].log_writer.queue_handlers:
+            for handler in queue_handler.targets:
+                if type(handler).__name__ == "BatchStreamHandler":
+                    handler.setStream(devnull)
+
+
+def build_benchmarks(token_counts) -> list:
+    import combined_service
+    from typing import List
+    from pydantic import TypeAdapter
+
+    auth = sys.modules["auth_service_app.auth"]
+    auth_database = sys.modules["auth_service_app.database"]
+    auth_main = combined_service.auth_main
+    transaction_main = combined_service.transaction_main
+    transaction_logger = sys.modules["transaction_service_app.logger"]
+    request_logging = sys.modules["transaction_service_app.request_logging"]
+    database = sys.modules["transaction_service_app.database"]
+    models = sys.modules["transaction_service_app.models"]
+
+    benchmarks = []
+
+    # Token store, at each number of live tokens
+    for count in token_counts:
+        known_token = f"{0:022d}|agent"
+        setup = lambda count=count: fill_tokens(auth.tokens_db, count)
+        benchmarks += [
+            Benchmark(f"auth.create_access_token[tokens={count}]", lambda: auth.create_access_token("agent", "agent"), setup),
+            Benchmark(f"auth.verify_token[tokens={count}]", lambda token=known_token: auth.verify_token(token), setup),
+            Benchmark(f"auth.cleanup_expired_tokens[tokens={count}]", auth.cleanup_expired_tokens, setup),
+        ]
+    admin_hash = auth_database.SEED_USERS[0]["hashed_password"]
+    benchmarks.append(Benchmark("auth.verify_password", lambda: auth_database.verify_password("admin123", admin_hash)))
+
+    # Log formatting of a response record, as done by the log writer thread
+    record = logging.LogRecord(
+        "transaction_service", logging.INFO, __file__, 0, "Response: %s",
+        (transaction_logger.LazyJson({"request_id": "0" * 32, "statusCode": 200, "duration_ms": 1.5, "headers": {"content-type": "application/json"}}),),
+        None,
+    )
+    benchmarks.append(Benchmark("logging.SafeFormatter.format", lambda: transaction_logger.formatter.format(record)))
+
+    # Request logging middleware around an app that does nothing, against the bare app
+    async def empty_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    logged_app = request_logging.RequestLoggingMiddleware(
+        empty_app,
+        logger=transaction_main.logger,
+        service="transaction_service",
+        port=8081,
+        policy=request_logging.RequestLogPolicy(mode="full"),
+    )
+    headers = {"user-agent": "bench", "accept": "application/json"}
+    benchmarks += [
+        Benchmark("middleware.bare", lambda: asgi_request(empty_app, "GET", "/api/transactions", headers=headers), is_async=True),
+        Benchmark("middleware.request_logging", lambda: asgi_request(logged_app, "GET", "/api/transactions", headers=headers), is_async=True),
+    ]
+
+    # Building and validating transaction pages, without the database
+    page_adapter = TypeAdapter(List[models.Transaction])
+    for size in PAGE_SIZES:
+        rows = [
+            database.TransactionModel(
+                id=i, customer=f"customer-{i}", timestamp=datetime.utcnow(), status=models.TransactionStatus.SUBMITTED,
+                vendor_id=f"vendor-{i % 10}", amount=100.0 + i,
+            )
+            for i in range(size)
+        ]
+        page = [transaction_main.transaction_to_dict(row) for row in rows]
+        benchmarks += [
+            Benchmark(f"transaction.transaction_to_dict[page={size}]", lambda rows=rows: [transaction_main.transaction_to_dict(row) for row in rows]),
+            Benchmark(f"transaction.validate_page[page={size}]", lambda page=page: page_adapter.dump_json(page_adapter.validate_python(page))),
+        ]
+
+    # Whole requests through each service's middleware stack, with one live token
+    token = "b" * 22 + "|admin"
+
+    def single_token():
+        fill_tokens(auth.tokens_db, 0)
+        auth.tokens_db[token] = {"username": "admin", "role": "admin", "expiry": datetime.utcnow() + timedelta(hours=1)}
+
+    benchmarks += [
+        Benchmark(
+            "asgi.auth.verify",
+            lambda: asgi_request(auth_main.app, "GET", "/api/auth/verify", query=f"token={token}"),
+            setup=single_token,
+            is_async=True,
+        ),
+        Benchmark(
+            "asgi.transaction.list",
+            lambda: asgi_request(transaction_main.app, "GET", "/api/transactions", query="limit=20", headers={"authorization": f"Bearer {token}"}),
+            setup=single_token,
+            is_async=True,
+        ),
+    ]
+    return benchmarks
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Names of benchmarks whose median grew by more than `tolerance` percent"""
+    regressions = []
+    print(f"\n{'benchmark':<50}{'baseline_us':>14}{'current_us':>14}{'change':>10}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<50}{'-':>14}{result['median_us']:>14}{'new':>10}")
+            continue
+        change = (result["median_us"] - before["median_us"]) / before["median_us"] * 100 if before["median_us"] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance:
+            flag = "  faster"
+        print(f"{name:<50}{before['median_us']:>14}{result['median_us']:>14}{change:>+9.1f}%{flag}")
+    missing = sorted(set(baseline) - set(results))
+    if missing:
+        print(f"\nNot run this time: {', '.join(missing)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the services' hot paths")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--tokens", default=DEFAULT_TOKENS, help=f"live token counts for the token store (default: {DEFAULT_TOKENS})")
+    parser.add_argument("--rounds", type=int, default=5, help="timed rounds per benchmark (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimum seconds per round (default: 0.1)")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline file, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed slowdown in percent for --compare (default: 10)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        baseline = {name: result for name, result in baseline.items() if args.filter in name}
+
+    # Imported from the repository, but logs go to a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    cwd = os.getcwd()
+    workdir = tempfile.TemporaryDirectory(prefix="bench-")
+    os.chdir(workdir.name)
+
+    benchmarks = build_benchmarks([int(count) for count in args.tokens.split(",") if count])
+    benchmarks = [benchmark for benchmark in benchmarks if args.filter in benchmark.name]
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    runner = Runner(loop, args.min_time, args.rounds)
+    results = {}
+    failed = {}
+    stack = AsyncExitStack()
+    combined_service = sys.modules["combined_service"]
+    quiet_console()
+    try:
+        # Both services start as they would in production, so the request benchmarks see a ready app
+        for app in (combined_service.auth_main.app, combined_service.transaction_main.app):
+            loop.run_until_complete(stack.enter_async_context(app.router.lifespan_context(app)))
+        quiet_console()
+
+        for benchmark in benchmarks:
+            try:
+                results[benchmark.name] = runner.run(benchmark)
+            except Exception as e:
+                failed[benchmark.name] = f"{type(e).__name__}: {e}"
+                print(f"{benchmark.name:<50}failed: {failed[benchmark.name]}")
+                continue
+            result = results[benchmark.name]
+            print(f"{benchmark.name:<50}{result['median_us']:>12} us  (min {result['min_us']}, {result['iterations']} x {result['rounds']})")
+    finally:
+        loop.run_until_complete(stack.aclose())
+        loop.close()
+        os.chdir(cwd)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.save}")
+
+    regressions = compare(results, baseline, args.tolerance) if baseline is not None else []
+    if regressions:
+        print(f"\n{len(regressions)} regressions beyond {args.tolerance}%: {', '.join(regressions)}")
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Run both services in a single process, for small and edge deployments.
+
+The Authentication Service answers on its usual port and the Transaction
+Service on its own, so clients see the same endpoints as with two processes.
+Tokens are verified by calling the Authentication Service's verify_token
+directly instead of over HTTP:
+    python combined_service.py
+    python combined_service.py --auth-port 8080 --transaction-port 8081
+"""
+
+import os
+import sys
+import socket
+import argparse
+import importlib
+from pathlib import Path
+
+import uvicorn
+
+# Get the script directory
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+AUTH_PORT = int(os.environ.get("AUTH_SERVICE_PORT", 8080))
+TRANSACTION_PORT = int(os.environ.get("TRANSACTION_SERVICE_PORT", 8081))
+
+
+def load_service(directory: str, alias: str):
+    """
+    Import <directory>/app/main.py and rename its "app" package to `alias`.
+    Both services name their package "app", so the first one has to move out
+    of the way before the second is imported. Modules bind their imports at
+    import time, so the renamed modules keep working.
+    """
+    path = str(SCRIPT_DIR / directory)
+    sys.path.insert(0, path)
+    try:
+        main = importlib.import_module("app.main")
+    finally:
+        sys.path.remove(path)
+    for name in [name for name in sys.modules if name == "app" or name.startswith("app.")]:
+        sys.modules[alias + name[len("app"):]] = sys.modules.pop(name)
+    return main
+
+
+class CombinedApp:
+    """
+    ASGI app dispatching each request by the port it arrived on, and running
+    the lifespans of both services
+    """
+
+    def __init__(self, auth_app, transaction_app, auth_port: int):
+        self.auth_app = auth_app
+        self.transaction_app = transaction_app
+        self.auth_port = auth_port
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        server = scope.get("server")
+        app = self.auth_app if server and server[1] == self.auth_port else self.transaction_app
+        await app(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        await receive()
+        started = False
+        try:
+            # The Authentication Service starts first and stops last
+            async with self.auth_app.router.lifespan_context(self.auth_app):
+                async with self.transaction_app.router.lifespan_context(self.transaction_app):
+                    await send({"type": "lifespan.startup.complete"})
+                    started = True
+                    await receive()
+        except Exception as e:
+            await send({"type": "lifespan.shutdown.failed" if started else "lifespan.startup.failed", "message": str(e)})
+            raise
+        await send({"type": "lifespan.shutdown.complete"})
+
+
+auth_main = load_service("auth_service", "auth_service_app")
+transaction_main = load_service("transaction_service", "transaction_service_app")
+
+# Verify tokens in this process instead of calling the Authentication Service over HTTP
+sys.modules["transaction_service_app.auth"].use_local_verifier(sys.modules["auth_service_app.auth"].verify_token)
+
+app = CombinedApp(auth_main.app, transaction_main.app, AUTH_PORT)
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run both services in one process")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--auth-port", type=int, default=AUTH_PORT)
+    parser.add_argument("--transaction-port", type=int, default=TRANSACTION_PORT)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--loop", default="auto")
+    parser.add_argument("--http", default="auto")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--timeout-graceful-shutdown", type=int)
+    parser.add_argument("--limit-concurrency", type=int)
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+
+    # Requests are routed by the port they arrive on
+    app.auth_port = args.auth_port
+    sockets = [bind(args.host, args.auth_port, args.backlog), bind(args.host, args.transaction_port, args.backlog)]
+    config = uvicorn.Config(
+        app,
+        loop=args.loop,
+        http=args.http,
+        timeout_keep_alive=args.timeout_keep_alive,
+        timeout_graceful_shutdown=args.timeout_graceful_shutdown,
+        limit_concurrency=args.limit_concurrency,
+        access_log=not args.no_access_log,
+    )
+    print(f"Starting combined services: Authentication on port {args.auth_port}, Transaction on port {args.transaction_port}")
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+if __name__ == "__main__":
+    main()
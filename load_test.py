@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Async load generator for the Transaction Service.
+
+Logs in real users, then drives a mix of transaction calls either at a
+target request rate (open loop) or with a fixed number of concurrent
+clients (closed loop). Reports throughput, errors and latency percentiles
+per endpoint; --json writes the same report with stable keys so two runs
+can be diffed. For example:
+    python load_test.py --rps 200 --duration 30
+    python load_test.py --concurrency 50 --mix create=50,detail=50 --json run.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter, deque
+
+import aiohttp
+
+# Default operation mix, as relative weights
+DEFAULT_MIX = "create=30,list=15,detail=25,update=10,result=10,results=10"
+# Operations of the mix, each a LoadTest method
+OPERATIONS = ("create", "list", "detail", "update", "result", "results")
+# Seed users allowed to call every transaction endpoint
+DEFAULT_USERS = "admin:admin123,agent:agent123"
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for entry in spec.split(","):
+        name, _, weight = entry.strip().partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}', choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+
+    def add(self, status, seconds: float):
+        self.latencies.append(seconds)
+        self.statuses[str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> dict:
+        count = len(self.latencies)
+        ordered = sorted(self.latencies)
+        summary = {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / count, 4) if count else 0.0,
+            "requests_per_second": round(count / elapsed, 2) if elapsed else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+            "mean_ms": round(sum(ordered) / count * 1000, 3) if count else 0.0,
+            "max_ms": round(ordered[-1] * 1000, 3) if count else 0.0,
+        }
+        for p in PERCENTILES:
+            summary[f"p{p}_ms"] = round(ordered[min(count - 1, int(count * p / 100))] * 1000, 3) if count else 0.0
+        return summary
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.random = random.Random(args.seed)
+        self.tokens = []
+        # Ids of transactions created by this run, used by the detail/update/result calls
+        self.transaction_ids = deque(maxlen=10000)
+        self.stats = {name: EndpointStats() for name in self.mix}
+        self.session = None
+        self.in_flight = 0
+
+    async def login(self):
+        """Log in every configured user through the Authentication Service"""
+        for entry in self.args.users.split(","):
+            username, _, password = entry.partition(":")
+            async with self.session.post(
+                f"{self.args.auth_url}/api/auth/login", json={"username": username, "password": password}
+            ) as response:
+                if response.status != 200:
+                    raise SystemExit(f"Login failed for {username}: HTTP {response.status} {await response.text()}")
+                self.tokens.append((await response.json())["access_token"])
+        print(f"Logged in {len(self.tokens)} users")
+
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.random.choice(self.tokens)}"}
+
+    def transaction_id(self):
+        return self.random.choice(self.transaction_ids) if self.transaction_ids else None
+
+    async def create(self):
+        body = {
+            "customer": f"customer-{self.random.randrange(1000)}",
+            "vendor_id": f"vendor-{self.random.randrange(100)}",
+            "amount": round(self.random.uniform(1, 5000), 2),
+        }
+        async with self.session.post(f"{self.args.transaction_url}/api/transactions", json=body, headers=self.headers()) as response:
+            if response.status == 201:
+                self.transaction_ids.append((await response.json())["id"])
+            else:
+                await response.read()
+            return response.status
+
+    async def list(self):
+        return await self.get(f"/api/transactions?limit={self.args.page_size}")
+
+    async def detail(self):
+        return await self.get(f"/api/transactions/{self.transaction_id()}")
+
+    async def results(self):
+        return await self.get(f"/api/transactions/{self.transaction_id()}/results")
+
+    async def update(self):
+        status = self.random.choice(["accepted", "rejected"])
+        url = f"{self.args.transaction_url}/api/transactions/{self.transaction_id()}?status={status}"
+        async with self.session.put(url, headers=self.headers()) as response:
+            await response.read()
+            return response.status
+
+    async def result(self):
+        body = {"is_fraudulent": self.random.random() < 0.1, "confidence": round(self.random.random(), 3)}
+        url = f"{self.args.transaction_url}/api/transactions/{self.transaction_id()}/results"
+        async with self.session.post(url, json=body, headers=self.headers()) as response:
+            await response.read()
+            return response.status
+
+    async def get(self, path: str):
+        async with self.session.get(f"{self.args.transaction_url}{path}", headers=self.headers()) as response:
+            await response.read()
+            return response.status
+
+    def pick(self) -> str:
+        names = list(self.mix)
+        name = self.random.choices(names, weights=[self.mix[n] for n in names])[0]
+        # Calls on existing transactions wait until one has been created, even if create is not in the mix
+        if name != "list" and name != "create" and not self.transaction_ids:
+            return "create"
+        return name
+
+    async def run_one(self, name: str, scheduled: float):
+        """One call; latency counts from the scheduled start, so a slow server cannot hide queueing"""
+        self.in_flight += 1
+        try:
+            status = await getattr(self, name)()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        finally:
+            self.in_flight -= 1
+        self.stats.setdefault(name, EndpointStats()).add(status, time.perf_counter() - scheduled)
+
+    async def open_loop(self, deadline: float):
+        interval = 1.0 / self.args.rps
+        next_start = time.perf_counter()
+        tasks = set()
+        while next_start < deadline:
+            now = time.perf_counter()
+            if now < next_start:
+                await asyncio.sleep(next_start - now)
+            if self.in_flight < self.args.max_in_flight:
+                task = asyncio.create_task(self.run_one(self.pick(), next_start))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            else:
+                self.stats.setdefault("skipped", EndpointStats()).add("max_in_flight", 0.0)
+            next_start += interval
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self, deadline: float):
+        async def client():
+            while time.perf_counter() < deadline:
+                await self.run_one(self.pick(), time.perf_counter())
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+
+    async def run(self) -> dict:
+        connector = aiohttp.TCPConnector(limit=self.args.max_in_flight if self.args.rps else self.args.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.args.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as self.session:
+            await self.login()
+            for _ in range(self.args.prefill):
+                await self.create()
+
+            mode = f"{self.args.rps} req/s" if self.args.rps else f"{self.args.concurrency} clients"
+            print(f"Running {self.args.duration}s at {mode}...")
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            if self.args.rps:
+                await self.open_loop(deadline)
+            else:
+                await self.closed_loop(deadline)
+            elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        total = EndpointStats()
+        for name, stats in self.stats.items():
+            if name == "skipped":
+                continue
+            total.latencies += stats.latencies
+            total.statuses.update(stats.statuses)
+            total.errors += stats.errors
+        return {
+            "config": {
+                "mode": "rps" if self.args.rps else "concurrency",
+                "rps": self.args.rps,
+                "concurrency": None if self.args.rps else self.args.concurrency,
+                "duration_seconds": self.args.duration,
+                "mix": self.mix,
+                "seed": self.args.seed,
+            },
+            "elapsed_seconds": round(elapsed, 3),
+            "total": total.summary(elapsed),
+            "endpoints": {name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())},
+        }
+
+
+def print_report(report: dict):
+    columns = ["requests", "requests_per_second", "errors", "mean_ms"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+    headers = ["requests", "req/s", "errors", "mean_ms"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    width = max(len(name) for name, _ in rows)
+    print()
+    print("".ljust(width + 2) + "".join(header.rjust(11) for header in headers))
+    for name, summary in rows:
+        print(f"  {name.ljust(width)}" + "".join(str(summary[column]).rjust(11) for column in columns))
+    statuses = ", ".join(f"{status}: {count}" for status, count in report["total"]["statuses"].items())
+    print(f"\nStatuses: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Transaction Service")
+    parser.add_argument("--auth-url", default="http://localhost:8080")
+    parser.add_argument("--transaction-url", default="http://localhost:8081")
+    parser.add_argument("--users", default=DEFAULT_USERS, help="comma separated username:password pairs to log in")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default: {DEFAULT_MIX})")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rps", type=float, help="target request rate (open loop)")
+    load.add_argument("--concurrency", type=int, default=10, help="concurrent clients (closed loop, default: 10)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run (default: 30)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="open loop: requests in flight before new ones are skipped")
+    parser.add_argument("--prefill", type=int, default=20, help="transactions created before the run starts")
+    parser.add_argument("--page-size", type=int, default=20, help="limit of the list calls")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the operation sequence")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.json:
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if args.json == "-":
+            print(output)
+        else:
+            with open(args.json, "w") as f:
+                f.write(output + "\n")
+            print(f"Report written to {args.json}")
+    if report["total"]["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Latency, throughput and status statistics from the services' request logs.
+
+Reads the Request:/Response: records written by the request logging
+middleware, rotated files included, and joins them by request id. Files are
+streamed line by line and latencies go into fixed-size histograms, so memory
+does not grow with the size of the logs. For example:
+    python log_stats.py
+    python log_stats.py --bucket 300 --top 10
+    python log_stats.py transaction_service/logs/transaction_service.log --json
+"""
+
+import re
+import sys
+import json
+import math
+import glob
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from collections import Counter, OrderedDict, defaultdict
+
+# Default log files written by both services
+DEFAULT_PATTERNS = [
+    "auth_service/logs/auth_service.log*",
+    "transaction_service/logs/transaction_service.log*",
+]
+
+# Histogram buckets grow by 2%, which bounds the error of the percentiles
+BUCKET_GROWTH = 1.02
+LOG_GROWTH = math.log(BUCKET_GROWTH)
+# Latencies below this are counted in the first bucket
+MIN_LATENCY_MS = 0.01
+
+# Log timestamps are naive UTC
+EPOCH = datetime(1970, 1, 1)
+
+# Path segments replaced by {id}, so /api/transactions/42 and /api/transactions/43 are one path
+ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{32,36}|[0-9a-fA-F]{16,})$")
+
+PERCENTILES = (50, 90, 95, 99)
+
+decoder = json.JSONDecoder()
+
+
+class LatencyHistogram:
+    """Log-bucketed latencies: exact count, min, max and mean, percentiles within 2%"""
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, ms: float):
+        self.buckets[int(math.log(max(ms, MIN_LATENCY_MS) / MIN_LATENCY_MS) / LOG_GROWTH)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = min(self.min, ms)
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Upper edge of the bucket, capped by the largest value seen
+                return min(MIN_LATENCY_MS * BUCKET_GROWTH ** (index + 1), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        summary = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min, 3) if self.count else 0.0,
+            "max_ms": round(self.max, 3),
+        }
+        for p in PERCENTILES:
+            summary[f"p{p}_ms"] = round(self.percentile(p), 3)
+        return summary
+
+
+class Stats:
+    """Requests, statuses and latencies of one path or one time bucket"""
+    __slots__ = ("requests", "statuses", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.latency = LatencyHistogram()
+
+    def add(self, status_code: int, duration_ms):
+        self.requests += 1
+        self.statuses[f"{status_code // 100}xx"] += 1
+        if duration_ms is not None:
+            self.latency.add(duration_ms)
+
+    def summary(self) -> dict:
+        return {"requests": self.requests, "statuses": dict(sorted(self.statuses.items())), **self.latency.summary()}
+
+
+def log_files(paths):
+    """Log files oldest first: service.log.5 ... service.log.1, then service.log"""
+    def rotation(path):
+        suffix = path.rsplit(".log", 1)[-1].lstrip(".")
+        return (path.rsplit(".log", 1)[0], -int(suffix) if suffix.isdigit() else 0)
+    return sorted(set(paths), key=rotation)
+
+
+def parse_record(line: str):
+    """("Request" or "Response", record) for a request log line, or None"""
+    for kind in ("Response", "Request"):
+        start = line.find(f" - {kind}: {{")
+        if start != -1:
+            try:
+                record, _ = decoder.raw_decode(line, start + len(kind) + 5)
+            except json.JSONDecodeError:
+                return None
+            return kind, record
+    return None
+
+
+def normalize_path(path: str) -> str:
+    return "/".join("{id}" if ID_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+def parse_time(value: str):
+    """Log timestamps as naive UTC, the form the services write"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class LogAnalyzer:
+    """
+    Joins request and response records by request id. Requests waiting for
+    their response are kept up to max_pending, the oldest are dropped beyond.
+    """
+
+    def __init__(self, bucket_seconds: int, max_pending: int):
+        self.bucket_seconds = bucket_seconds
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.paths = defaultdict(Stats)
+        self.buckets = defaultdict(Stats)
+        self.total = Stats()
+        self.unmatched_requests = 0
+        self.unmatched_responses = 0
+        self.first = None
+        self.last = None
+
+    def read(self, path: str, service: str):
+        with open(path, errors="replace") as f:
+            for line in f:
+                # Cheap check before looking for a record
+                if "Re" not in line:
+                    continue
+                parsed = parse_record(line)
+                if parsed is None:
+                    continue
+                kind, record = parsed
+                if kind == "Request":
+                    self.add_request(service, record)
+                else:
+                    self.add_response(service, record)
+
+    def add_request(self, service: str, record: dict):
+        key = (service, record.get("request_id"))
+        self.pending[key] = (
+            f"{service} {record.get('method', '?')} {normalize_path(record.get('path', '?'))}",
+            parse_time(record.get("timestamp")),
+        )
+        if len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+            self.unmatched_requests += 1
+
+    def add_response(self, service: str, record: dict):
+        request = self.pending.pop((service, record.get("request_id")), None)
+        if request is None:
+            self.unmatched_responses += 1
+            return
+        label, received_at = request
+        timestamp = parse_time(record.get("timestamp"))
+        duration_ms = record.get("duration_ms")
+        if duration_ms is None and timestamp is not None and received_at is not None:
+            # Logs written before durations were recorded
+            duration_ms = (timestamp - received_at).total_seconds() * 1000
+        status_code = int(record.get("statusCode", 0))
+
+        self.paths[label].add(status_code, duration_ms)
+        self.total.add(status_code, duration_ms)
+        if timestamp is not None:
+            # Naive timestamps are UTC, not local time
+            epoch = (timestamp - EPOCH).total_seconds()
+            self.buckets[int(epoch // self.bucket_seconds) * self.bucket_seconds].add(status_code, duration_ms)
+            self.first = epoch if self.first is None else min(self.first, epoch)
+            self.last = epoch if self.last is None else max(self.last, epoch)
+
+    def report(self, top: int) -> dict:
+        elapsed = (self.last - self.first) if self.first is not None else 0
+        paths = sorted(self.paths.items(), key=lambda item: item[1].requests, reverse=True)[:top]
+        return {
+            "total": {
+                **self.total.summary(),
+                "requests_per_second": round(self.total.requests / elapsed, 3) if elapsed > 0 else None,
+                "unmatched_requests": self.unmatched_requests + len(self.pending),
+                "unmatched_responses": self.unmatched_responses,
+            },
+            "paths": {label: stats.summary() for label, stats in paths},
+            "buckets": {
+                (EPOCH + timedelta(seconds=start)).isoformat(): {
+                    **stats.summary(),
+                    "requests_per_second": round(stats.requests / self.bucket_seconds, 3),
+                }
+                for start, stats in sorted(self.buckets.items())
+            },
+        }
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    if not rows:
+        print("  (none)")
+        return
+    label_width = max(len(label) for label, _ in rows)
+    columns = ["requests", "2xx", "4xx", "5xx", "mean_ms"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+    print("  " + "".ljust(label_width) + "".join(column.rjust(10) for column in columns))
+    for label, summary in rows:
+        values = [summary["requests"]] + [summary["statuses"].get(status, 0) for status in ("2xx", "4xx", "5xx")]
+        values += [f"{summary[column]:.1f}" for column in columns[4:]]
+        print("  " + label.ljust(label_width) + "".join(str(value).rjust(10) for value in values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency percentiles, throughput and status mix from the request logs")
+    parser.add_argument("files", nargs="*", help="log files (default: the logs of both services, rotated files included)")
+    parser.add_argument("--bucket", type=int, default=60, help="time bucket in seconds (default: 60)")
+    parser.add_argument("--top", type=int, default=20, help="show the N busiest paths (default: 20)")
+    parser.add_argument("--max-pending", type=int, default=100000, help="requests kept while waiting for their response")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    root = Path(__file__).resolve().parent
+    paths = log_files(args.files or [path for pattern in DEFAULT_PATTERNS for path in glob.glob(str(root / pattern))])
+    if not paths:
+        print("No log files found. Start the services and send some requests first.")
+        sys.exit(1)
+
+    analyzer = LogAnalyzer(args.bucket, args.max_pending)
+    for path in paths:
+        # Request ids are joined within one service: auth_service.log.1 -> auth_service
+        analyzer.read(path, Path(path).name.split(".log")[0])
+    report = analyzer.report(args.top)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    total = report["total"]
+    rate = f"{total['requests_per_second']} req/s" if total["requests_per_second"] is not None else "n/a"
+    print(f"{total['requests']} requests in {len(paths)} log files, {rate}")
+    print(f"Unmatched: {total['unmatched_requests']} requests, {total['unmatched_responses']} responses")
+    print_table("Overall", [("all", total)])
+    print_table(f"Busiest paths (top {args.top})", list(report["paths"].items()))
+    print_table(f"Per {args.bucket}s bucket", list(report["buckets"].items()))
+
+
+if __name__ == "__main__":
+    main()
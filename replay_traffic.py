@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Replay the traffic recorded in the services' request logs against a running stack.
+
+Requests are read from the Request:/Response: records of the request logging
+middleware and sent again with their original spacing, optionally sped up.
+Recorded tokens are replaced by fresh ones of the same role, minted by logging
+in. The report compares the replayed latencies and statuses per path with the
+recorded ones. For example:
+    python replay_traffic.py
+    python replay_traffic.py --speed 10 --json replay.json
+    python replay_traffic.py transaction_service/logs/transaction_service.log --since 2025-04-02T10:00:00
+"""
+
+import sys
+import json
+import glob
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime
+from collections import defaultdict
+
+import aiohttp
+
+from log_stats import DEFAULT_PATTERNS, PERCENTILES, LatencyHistogram, log_files, parse_record, normalize_path, parse_time
+
+# Users logged in to mint tokens, one per role
+DEFAULT_USERS = "admin:admin123,secretary:secretary123,agent:agent123"
+
+# Headers not copied from the recording: set by the client, or identifying the original request
+SKIPPED_HEADERS = {"host", "content-length", "connection", "transfer-encoding", "x-request-id", "traceparent"}
+
+# Endpoints that log in, replayed with the configured users since request bodies are not recorded
+LOGIN_PATHS = {"/api/auth/login", "/token"}
+
+
+class RecordedRequest:
+    __slots__ = ("service", "time", "method", "path", "query", "headers", "status", "duration_ms")
+
+    def __init__(self, service: str, record: dict, received_at: datetime):
+        self.service = service
+        self.time = received_at
+        self.method = record.get("method", "GET")
+        self.path = record.get("path", "/")
+        self.query = record.get("query_params") or {}
+        self.headers = record.get("headers") or {}
+        self.status = None
+        self.duration_ms = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.service} {self.method} {normalize_path(self.path)}"
+
+
+def load_requests(paths, since=None, until=None, include_internal=False) -> list:
+    """Recorded requests with their original status and duration, oldest first"""
+    requests = []
+    pending = {}
+    for path in paths:
+        service = Path(path).name.split(".log")[0]
+        with open(path, errors="replace") as f:
+            for line in f:
+                if "Re" not in line:
+                    continue
+                parsed = parse_record(line)
+                if parsed is None:
+                    continue
+                kind, record = parsed
+                key = (service, record.get("request_id"))
+                if kind == "Request":
+                    received_at = parse_time(record.get("timestamp"))
+                    if received_at is None or (since and received_at < since) or (until and received_at > until):
+                        continue
+                    # Calls between the services carry a traceparent, they are replayed by the calling request
+                    if not include_internal and "traceparent" in (record.get("headers") or {}):
+                        continue
+                    request = RecordedRequest(service, record, received_at)
+                    pending[key] = request
+                    requests.append(request)
+                else:
+                    request = pending.pop(key, None)
+                    if request is not None:
+                        request.status = record.get("statusCode")
+                        request.duration_ms = record.get("duration_ms")
+    requests.sort(key=lambda request: request.time)
+    return requests
+
+
+class PathStats:
+    """Recorded and replayed latencies and statuses of one path"""
+
+    def __init__(self):
+        self.recorded = LatencyHistogram()
+        self.replayed = LatencyHistogram()
+        self.recorded_statuses = defaultdict(int)
+        self.replayed_statuses = defaultdict(int)
+        self.mismatches = 0
+        self.errors = 0
+
+    def summary(self) -> dict:
+        recorded = self.recorded.summary()
+        replayed = self.replayed.summary()
+        summary = {
+            "requests": replayed["count"] + self.errors,
+            "errors": self.errors,
+            "status_mismatches": self.mismatches,
+            "recorded_statuses": dict(sorted(self.recorded_statuses.items())),
+            "replayed_statuses": dict(sorted(self.replayed_statuses.items())),
+        }
+        for p in PERCENTILES:
+            summary[f"recorded_p{p}_ms"] = recorded[f"p{p}_ms"]
+            summary[f"replayed_p{p}_ms"] = replayed[f"p{p}_ms"]
+        return summary
+
+
+class Replayer:
+    def __init__(self, args):
+        self.args = args
+        self.urls = {"auth_service": args.auth_url.rstrip("/"), "transaction_service": args.transaction_url.rstrip("/")}
+        self.users = [entry.partition(":")[::2] for entry in args.users.split(",") if entry]
+        self.random = random.Random(args.seed)
+        # Fresh tokens by role, and the recorded tokens already mapped to them
+        self.role_tokens = {}
+        self.token_map = {}
+        self.stats = defaultdict(PathStats)
+        self.lag = LatencyHistogram()
+        self.skipped = 0
+        self.in_flight = 0
+        self.session = None
+
+    async def login(self):
+        for username, password in self.users:
+            async with self.session.post(
+                f"{self.urls['auth_service']}/api/auth/login", json={"username": username, "password": password}
+            ) as response:
+                if response.status != 200:
+                    raise SystemExit(f"Login failed for {username}: HTTP {response.status} {await response.text()}")
+                token = (await response.json())["access_token"]
+            self.role_tokens.setdefault(token.rsplit("|", 1)[-1], token)
+        print(f"Minted tokens for roles: {', '.join(sorted(self.role_tokens))}")
+
+    def fresh_token(self, token: str, request: RecordedRequest) -> str:
+        """The replacement for a recorded token. Tokens that were rejected stay as they are."""
+        if request.status == 401:
+            return token
+        if token not in self.token_map:
+            role = token.rsplit("|", 1)[-1] if "|" in token else None
+            self.token_map[token] = self.role_tokens.get(role) or next(iter(self.role_tokens.values()))
+        return self.token_map[token]
+
+    def body(self, request: RecordedRequest):
+        """Request bodies are not recorded: log in with a configured user, or build a valid payload"""
+        path = normalize_path(request.path)
+        if request.path in LOGIN_PATHS:
+            username, password = self.random.choice(self.users)
+            if request.path == "/token":
+                return {"data": {"username": username, "password": password}}
+            return {"json": {"username": username, "password": password}}
+        if request.method == "POST" and path == "/api/transactions":
+            return {"json": {
+                "customer": f"customer-{self.random.randrange(1000)}",
+                "vendor_id": f"vendor-{self.random.randrange(100)}",
+                "amount": round(self.random.uniform(1, 5000), 2),
+            }}
+        if request.method == "POST" and path == "/api/transactions/{id}/results":
+            return {"json": {"is_fraudulent": self.random.random() < 0.1, "confidence": round(self.random.random(), 3)}}
+        return {}
+
+    def prepare(self, request: RecordedRequest):
+        headers = {}
+        for name, value in request.headers.items():
+            if name.lower() in SKIPPED_HEADERS:
+                continue
+            if name.lower() == "authorization" and value.startswith("Bearer "):
+                value = f"Bearer {self.fresh_token(value[7:], request)}"
+            headers[name] = value
+        query = dict(request.query)
+        if "token" in query:
+            query["token"] = self.fresh_token(query["token"], request)
+        return headers, query
+
+    async def send(self, request: RecordedRequest, scheduled: float):
+        headers, query = self.prepare(request)
+        body = self.body(request)
+        if "json" in body or "data" in body:
+            headers = {name: value for name, value in headers.items() if name.lower() != "content-type"}
+        stats = self.stats[request.label]
+        self.in_flight += 1
+        sent = time.perf_counter()
+        self.lag.add((sent - scheduled) * 1000)
+        try:
+            async with self.session.request(
+                request.method, self.urls[request.service] + request.path, params=query, headers=headers, **body
+            ) as response:
+                # Time to the response headers, as recorded by the middleware
+                elapsed = time.perf_counter() - sent
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            stats.errors += 1
+            return
+        finally:
+            self.in_flight -= 1
+        stats.replayed.add(elapsed * 1000)
+        stats.replayed_statuses[str(status)] += 1
+        if request.status is not None and status // 100 != request.status // 100:
+            stats.mismatches += 1
+
+    async def run(self, requests: list) -> float:
+        connector = aiohttp.TCPConnector(limit=self.args.max_in_flight)
+        timeout = aiohttp.ClientTimeout(total=self.args.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as self.session:
+            await self.login()
+            for request in requests:
+                stats = self.stats[request.label]
+                if request.duration_ms is not None:
+                    stats.recorded.add(request.duration_ms)
+                if request.status is not None:
+                    stats.recorded_statuses[str(request.status)] += 1
+
+            first = requests[0].time
+            span = (requests[-1].time - first).total_seconds()
+            print(f"Replaying {len(requests)} requests recorded over {span:.1f}s at {self.args.speed}x ({span / self.args.speed:.1f}s)...")
+            tasks = set()
+            started = time.perf_counter()
+            for request in requests:
+                scheduled = started + (request.time - first).total_seconds() / self.args.speed
+                now = time.perf_counter()
+                if now < scheduled:
+                    await asyncio.sleep(scheduled - now)
+                if self.in_flight >= self.args.max_in_flight:
+                    self.skipped += 1
+                    continue
+                task = asyncio.create_task(self.send(request, scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+            return time.perf_counter() - started
+
+    def report(self, elapsed: float, requests: list) -> dict:
+        return {
+            "config": {"speed": self.args.speed, "requests": len(requests), "seed": self.args.seed},
+            "elapsed_seconds": round(elapsed, 3),
+            "skipped": self.skipped,
+            "schedule_lag_ms": self.lag.summary(),
+            "paths": {label: stats.summary() for label, stats in sorted(self.stats.items())},
+        }
+
+
+def print_report(report: dict):
+    rows = list(report["paths"].items())
+    width = max(len(label) for label, _ in rows)
+    columns = ["requests", "errors", "mismatch"] + [f"p{p} rec/rep ms" for p in PERCENTILES if p != 90]
+    print()
+    print("  " + "".ljust(width) + "".join(column.rjust(18 if "/" in column else 10) for column in columns))
+    for label, summary in rows:
+        values = [str(summary["requests"]).rjust(10), str(summary["errors"]).rjust(10), str(summary["status_mismatches"]).rjust(10)]
+        for p in PERCENTILES:
+            if p == 90:
+                continue
+            values.append(f"{summary[f'recorded_p{p}_ms']:.1f}/{summary[f'replayed_p{p}_ms']:.1f}".rjust(18))
+        print("  " + label.ljust(width) + "".join(values))
+    lag = report["schedule_lag_ms"]
+    print(f"\nSchedule lag: p50 {lag['p50_ms']}ms, p99 {lag['p99_ms']}ms, max {lag['max_ms']}ms")
+    if report["skipped"]:
+        print(f"Skipped {report['skipped']} requests at the in-flight limit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded request logs against a running stack")
+    parser.add_argument("files", nargs="*", help="log files (default: the logs of both services, rotated files included)")
+    parser.add_argument("--auth-url", default="http://localhost:8080")
+    parser.add_argument("--transaction-url", default="http://localhost:8081")
+    parser.add_argument("--users", default=DEFAULT_USERS, help="comma separated username:password pairs used to mint tokens")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay rate relative to the recording (default: 1)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only replay requests recorded from this time (ISO format)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="only replay requests recorded until this time (ISO format)")
+    parser.add_argument("--limit", type=int, help="replay at most this many requests")
+    parser.add_argument("--include-internal", action="store_true", help="also replay calls the services made to each other")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="requests in flight before new ones are skipped")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the synthesized request bodies")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON ('-' for stdout)")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    root = Path(__file__).resolve().parent
+    paths = log_files(args.files or [path for pattern in DEFAULT_PATTERNS for path in glob.glob(str(root / pattern))])
+    requests = load_requests(paths, args.since, args.until, args.include_internal)[:args.limit]
+    if not requests:
+        print("No recorded requests found. Run the services with REQUEST_LOG_MODE=full first.")
+        sys.exit(1)
+
+    replayer = Replayer(args)
+    elapsed = asyncio.run(replayer.run(requests))
+    report = replayer.report(elapsed, requests)
+    print_report(report)
+    if args.json:
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if args.json == "-":
+            print(output)
+        else:
+            with open(args.json, "w") as f:
+                f.write(output + "\n")
+            print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
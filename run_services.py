@@ -7,10 +7,13 @@ Works on Windows, macOS, and Linux
 import os
 import sys
 import time
+import argparse
+import importlib.util
 import signal
 import subprocess
 import socket
 import platform
+import threading
 import psutil
 from pathlib import Path
 
@@ -31,6 +34,43 @@ TRANSACTION_PORT = 8081
 # Get the script directory
 SCRIPT_DIR = Path(__file__).resolve().parent
 
+# Supervisor mode: seconds a stopping service gets to finish its in-flight requests
+DRAIN_TIMEOUT = int(os.environ.get("SERVICE_DRAIN_TIMEOUT", 20))
+# Longest wait before restarting a crashed service, the wait doubles from 1 second
+RESTART_BACKOFF_MAX = float(os.environ.get("SERVICE_RESTART_BACKOFF_MAX", 30))
+# A service that ran this long before crashing is restarted without waiting
+STABLE_SECONDS = 60
+SUPERVISOR_PID_FILE = "supervisor.pid"
+
+# Server settings per profile. Development runs each service's own entry point
+# (single worker with the file-watching reloader), production runs uvicorn directly.
+PROFILES = {
+    "development": {
+        "description": "single worker, auto-reload",
+    },
+    "production": {
+        "description": "multiple workers, no reload",
+        # Transaction Service workers, defaults to one per CPU
+        "workers": int(os.environ.get("TRANSACTION_WORKERS", os.cpu_count() or 1)),
+        # Issued tokens live in the Authentication Service's memory, so a second
+        # worker would reject the tokens of the first one
+        "auth_workers": int(os.environ.get("AUTH_WORKERS", 1)),
+        # Pending connections the listening socket accepts
+        "backlog": int(os.environ.get("SERVER_BACKLOG", 2048)),
+        # Idle keep-alive connections are closed after this many seconds
+        "keep_alive": int(os.environ.get("SERVER_KEEP_ALIVE", 30)),
+        # Connections per worker before new requests get a 503
+        "limit_concurrency": int(os.environ.get("SERVER_LIMIT_CONCURRENCY", 1000)),
+    },
+}
+
+# Transaction Service features that keep their state in a single process: ingest log
+# ids and segments, and the archive job. Multiple workers are not allowed with them.
+SINGLE_PROCESS_FEATURES = [
+    name for name in ("INGEST_LOG_ENABLED", "ARCHIVE_ENABLED")
+    if os.environ.get(name, "0").lower() in ("1", "true", "yes")
+]
+
 def print_header(message):
     """Print a formatted header message"""
     print(f"\n{Colors.BOLD}{Colors.CYAN}=== {message} ==={Colors.END}\n")
@@ -52,35 +92,62 @@ def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('localhost', port)) == 0
 
-def kill_process_on_port(port):
-    """Kill the process using the specified port"""
-    print_warning(f"Port {port} is already in use.")
-    
-    for proc in psutil.process_iter(['pid', 'name', 'connections']):
+def find_port_owner(port):
+    """
+    PID of the process listening on a port, from a single query of the system
+    socket table instead of asking every process for its connections
+    """
+    try:
+        for conn in psutil.net_connections(kind='tcp'):
+            if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
+                if conn.pid is not None:
+                    return conn.pid
+                # Owner hidden from this user, look it up per process
+                return scan_port_owner(port)
+        return None
+    except psutil.AccessDenied:
+        # macOS only exposes the system socket table to root
+        return scan_port_owner(port)
+
+def scan_port_owner(port):
+    """Slow fallback: ask each process for its connections"""
+    for proc in psutil.process_iter(['pid']):
         try:
-            # Check for connections
             for conn in proc.connections(kind='inet'):
                 if conn.laddr.port == port:
-                    print_warning(f"Found process using port {port}: {proc.name()} (PID: {proc.pid})")
-                    print_warning(f"Stopping process...")
-                    try:
-                        proc.terminate()
-                        proc.wait(timeout=3)
-                        print_success("Process terminated")
-                        return True
-                    except:
-                        try:
-                            proc.kill()
-                            print_success("Process killed")
-                            return True
-                        except:
-                            print_error(f"Failed to kill process on port {port}")
-                            return False
+                    return proc.pid
         except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
             pass
+    return None
+
+def kill_process_on_port(port):
+    """Kill the process using the specified port"""
+    print_warning(f"Port {port} is already in use.")
     
-    print_warning(f"No process found using port {port}")
-    return False
+    pid = find_port_owner(port)
+    if pid is None:
+        print_warning(f"No process found using port {port}")
+        return False
+    
+    try:
+        proc = psutil.Process(pid)
+        print_warning(f"Found process using port {port}: {proc.name()} (PID: {proc.pid})")
+        print_warning(f"Stopping process...")
+        try:
+            proc.terminate()
+            proc.wait(timeout=3)
+            print_success("Process terminated")
+            return True
+        except psutil.TimeoutExpired:
+            proc.kill()
+            print_success("Process killed")
+            return True
+    except psutil.NoSuchProcess:
+        # Exited in the meantime
+        return True
+    except psutil.AccessDenied:
+        print_error(f"Failed to kill process on port {port}")
+        return False
 
 def ensure_logs_directory():
     """Create the logs directory if it doesn't exist"""
@@ -123,8 +190,8 @@ def activate_virtual_environment():
     
     print_success("Virtual environment activated")
 
-def start_service(name, working_dir, pid_file, cmd):
-    """Start a service and return its process"""
+def start_service(name, working_dir, pid_file, cmd, ready_url):
+    """Start a service, wait until it reports ready and return its process"""
     print_warning(f"Starting {name}...")
     
     service_dir = SCRIPT_DIR / working_dir
@@ -172,39 +239,355 @@ def start_service(name, working_dir, pid_file, cmd):
     with open(pid_file_path, 'w') as f:
         f.write(str(process.pid))
     
-    # Wait a moment for the service to start
-    time.sleep(3)
-    
-    # Check if process is still running
-    if process.poll() is None:
-        print_success(f"{name} started successfully (PID: {process.pid})")
+    # Wait until the service answers its readiness probe
+    started = time.monotonic()
+    if check_service_health(name, ready_url, process=process):
+        print_success(f"{name} started successfully in {time.monotonic() - started:.2f}s (PID: {process.pid})")
         return True, process.pid
     else:
-        print_error(f"{name} failed to start")
+        print_error(f"{name} failed to start, see {log_file}")
         return False, None
 
-def check_service_health(name, url, max_retries=5):
-    """Check if a service is healthy by accessing its health endpoint"""
+def fast_server_options():
+    """uvloop and httptools when they are installed (uvloop does not support Windows)"""
+    loop = "asyncio"
+    if platform.system() != "Windows" and importlib.util.find_spec("uvloop") is not None:
+        loop = "uvloop"
+    http = "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+    return loop, http
+
+def server_options(profile, backlog=True):
+    """uvicorn tuning options of a profile, none in development"""
+    if profile == "development":
+        return []
+    settings = PROFILES[profile]
+    loop, http = fast_server_options()
+    options = ["--loop", loop, "--http", http]
+    if backlog:
+        options += ["--backlog", str(settings["backlog"])]
+    # The request logging middleware already logs every request, uvicorn's access log is off
+    return options + [
+        "--timeout-keep-alive", str(settings["keep_alive"]),
+        "--limit-concurrency", str(settings["limit_concurrency"]),
+        "--no-access-log",
+    ]
+
+def service_command(profile, port, workers, uds=None):
+    """Command starting one service with the given profile"""
+    if uds:
+        # Single process serving TCP and the Unix socket (Authentication Service only)
+        return " ".join([f"{sys.executable} -m app.serve --port {port} --uds {uds}"] + server_options(profile))
+    if profile == "development":
+        return f"{sys.executable} -m app.main"
+    return " ".join(
+        [f"{sys.executable} -m uvicorn app.main:app --host 0.0.0.0 --port {port} --workers {workers}"] + server_options(profile)
+    )
+
+def print_profile(profile, auth_workers, trans_workers):
+    """Report the server settings the services are started with"""
+    settings = PROFILES[profile]
+    print_success(f"Profile: {profile} ({settings['description']})")
+    if profile == "development":
+        print(f"{Colors.GRAY}   - Workers: 1 per service, reload on file changes{Colors.END}")
+        return
+    loop, http = fast_server_options()
+    print(f"{Colors.GRAY}   - Workers: Authentication Service {auth_workers}, Transaction Service {trans_workers}{Colors.END}")
+    if SINGLE_PROCESS_FEATURES:
+        print(f"{Colors.GRAY}   - Transaction Service limited to 1 worker by {', '.join(SINGLE_PROCESS_FEATURES)}{Colors.END}")
+    print(f"{Colors.GRAY}   - Event loop: {loop}, HTTP parser: {http}{Colors.END}")
+    print(f"{Colors.GRAY}   - Backlog: {settings['backlog']}, keep-alive: {settings['keep_alive']}s, "
+          f"concurrency limit: {settings['limit_concurrency']} per worker{Colors.END}")
+    if loop != "uvloop" or http != "httptools":
+        print_warning("   Install uvloop and httptools (pip install 'uvicorn[standard]') for a faster event loop and HTTP parser")
+    if auth_workers > 1:
+        print_warning("   Tokens are kept in worker memory: with several Authentication Service workers, "
+                      "a token is only known to the worker that issued it")
+
+def check_service_health(name, url, timeout=30.0, process=None):
+    """
+    Poll a readiness endpoint with exponential backoff until it answers 200.
+    Gives up after `timeout` seconds, or as soon as `process` exits.
+    """
     import urllib.request
+    import urllib.error
     
-    print_warning(f"Checking if {name} is responding...")
+    print_warning(f"Waiting for {name} to become ready...")
     
-    for i in range(max_retries):
+    delay = 0.05
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            print_error(f"{name} exited with code {process.returncode}")
+            return False
         try:
             response = urllib.request.urlopen(url, timeout=2)
             if response.status == 200:
-                print_success(f"{name} is ready!")
                 return True
-        except Exception as e:
-            print_warning(f"Waiting for {name}... (Attempt {i+1}/{max_retries})")
-            time.sleep(2)
+        except urllib.error.HTTPError as e:
+            # 503 while dependencies are still starting
+            if e.code != 503:
+                print_warning(f"{name} readiness probe returned {e.code}")
+        except Exception:
+            # Not listening yet
+            pass
+        time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        delay = min(delay * 2, 1.0)
     
-    print_error(f"{name} is not responding after {max_retries} attempts")
+    print_error(f"{name} is not ready after {timeout:.0f}s")
     return False
 
+class SupervisedService:
+    """
+    One service run by the supervisor. The supervisor owns the listening
+    socket and hands it to each child, so connections queue in the socket
+    backlog instead of being refused while a child restarts.
+    """
+
+    def __init__(self, name, working_dir, pid_file, port, command, backlog, uds=None):
+        self.name = name
+        self.working_dir = working_dir
+        self.pid_file = pid_file
+        self.port = port
+        self.command = command
+        self.log_file = ensure_logs_directory() / f"{name.lower().replace(' ', '_')}.log"
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("0.0.0.0", port))
+        self.sock.listen(backlog)
+        self.sock.set_inheritable(True)
+        self.uds = uds
+        self.uds_sock = None
+        if uds:
+            if os.path.exists(uds):
+                os.unlink(uds)
+            self.uds_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.uds_sock.bind(uds)
+            os.chmod(uds, 0o660)
+            self.uds_sock.listen(backlog)
+            self.uds_sock.set_inheritable(True)
+        self.process = None
+        self.started_at = 0.0
+        self.backoff = 1.0
+        self.restart_at = None
+        self.restarts = 0
+
+    def spawn(self):
+        """Start a child on the shared socket; returns an event set once it serves requests"""
+        env = os.environ.copy()
+        env["AUTH_SERVICE_PORT"] = str(AUTH_PORT)
+        env["TRANSACTION_SERVICE_PORT"] = str(TRANSACTION_PORT)
+        fds = [self.sock.fileno()]
+        if self.uds_sock is not None:
+            # app.serve takes several sockets, uvicorn's command line only one
+            fds.append(self.uds_sock.fileno())
+            launcher = ["app.serve", "--fd", str(fds[0]), "--fd", str(fds[1])]
+        else:
+            launcher = ["uvicorn", "app.main:app", "--fd", str(fds[0])]
+        process = subprocess.Popen(
+            [sys.executable, "-m"] + launcher + self.command,
+            cwd=SCRIPT_DIR / self.working_dir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            pass_fds=fds
+        )
+        ready = threading.Event()
+        threading.Thread(target=self._copy_output, args=(process, ready), daemon=True).start()
+        with open(SCRIPT_DIR / self.pid_file, 'w') as f:
+            f.write(str(process.pid))
+        return process, ready
+
+    def _copy_output(self, process, ready):
+        """Append the child's output to the service log and watch for the end of startup"""
+        with open(self.log_file, 'ab') as log:
+            for line in process.stdout:
+                log.write(line)
+                log.flush()
+                if b"Application startup complete" in line:
+                    ready.set()
+
+    def start(self, timeout=60.0):
+        self.process, ready = self.spawn()
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        if not ready.wait(timeout) or self.process.poll() is not None:
+            print_error(f"{self.name} did not start, see {self.log_file}")
+            return False
+        print_success(f"{self.name} running on port {self.port} (PID: {self.process.pid})")
+        return True
+
+    def reload(self):
+        """Replace the child without dropping requests: start the new one, then drain the old one"""
+        old = self.process
+        self.process, ready = self.spawn()
+        self.started_at = time.monotonic()
+        if not ready.wait(60) or self.process.poll() is not None:
+            print_error(f"New {self.name} process did not start, keeping PID {old.pid}")
+            self.process.kill()
+            self.process = old
+            return
+        print_success(f"{self.name} reloaded (PID: {old.pid} -> {self.process.pid})")
+        drain(old, self.name)
+
+    def check(self, stopping):
+        """Schedule a restart if the child crashed, and perform it once the backoff has passed"""
+        if stopping or self.process is None:
+            return
+        now = time.monotonic()
+        if self.restart_at is None:
+            code = self.process.poll()
+            if code is None:
+                return
+            if now - self.started_at >= STABLE_SECONDS:
+                self.backoff = 1.0
+            print_error(f"{self.name} exited with code {code}, restarting in {self.backoff:.0f}s")
+            self.restart_at = now + self.backoff
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+        elif now >= self.restart_at:
+            self.restarts += 1
+            self.start()
+
+    def stop(self):
+        if self.process is not None:
+            drain(self.process, self.name)
+        self.sock.close()
+        if self.uds_sock is not None:
+            self.uds_sock.close()
+            os.unlink(self.uds)
+        pid_file_path = SCRIPT_DIR / self.pid_file
+        if pid_file_path.exists():
+            pid_file_path.unlink()
+
+def drain(process, name):
+    """SIGTERM: uvicorn stops accepting and finishes in-flight requests within DRAIN_TIMEOUT"""
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=DRAIN_TIMEOUT + 5)
+    except subprocess.TimeoutExpired:
+        print_warning(f"{name} (PID: {process.pid}) did not drain in time, killing it")
+        process.kill()
+        process.wait()
+
+def supervise(profile, auth_workers, trans_workers, auth_socket=None):
+    """
+    Keep both services running under this process. Crashed services are
+    restarted with backoff, SIGHUP reloads them one after the other without
+    dropping requests, SIGTERM or Ctrl+C drains them and exits.
+    """
+    if platform.system() == "Windows":
+        print_error("Supervisor mode needs a Unix system (services inherit the listening socket)")
+        sys.exit(1)
+    
+    backlog = PROFILES[profile].get("backlog", 2048)
+    # The supervisor restarts services, the reloader is never used here
+    drain_options = ["--timeout-graceful-shutdown", str(DRAIN_TIMEOUT)]
+    auth_options = drain_options + server_options(profile, backlog=False)
+    if not auth_socket:
+        auth_options += ["--workers", str(auth_workers)]
+    trans_options = drain_options + server_options(profile, backlog=False) + ["--workers", str(trans_workers)]
+    
+    services = [
+        SupervisedService("Authentication Service", "auth_service", "auth.pid", AUTH_PORT, auth_options, backlog, uds=auth_socket),
+        SupervisedService("Transaction Service", "transaction_service", "transaction.pid", TRANSACTION_PORT, trans_options, backlog),
+    ]
+    with open(SCRIPT_DIR / SUPERVISOR_PID_FILE, 'w') as f:
+        f.write(str(os.getpid()))
+    
+    state = {"stopping": False, "reload": False}
+    
+    def request_stop(signum, frame):
+        state["stopping"] = True
+    
+    def request_reload(signum, frame):
+        state["reload"] = True
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGHUP, request_reload)
+    
+    for service in services:
+        service.start()
+    print_success(f"Supervisor running (PID: {os.getpid()}). SIGHUP reloads the services, SIGTERM or Ctrl+C stops them.")
+    
+    while not state["stopping"]:
+        if state["reload"]:
+            state["reload"] = False
+            for service in services:
+                service.reload()
+        for service in services:
+            service.check(state["stopping"])
+        time.sleep(0.5)
+    
+    print_warning(f"Draining services (up to {DRAIN_TIMEOUT}s)...")
+    # Stop the Transaction Service first, its in-flight requests may still need the Authentication Service
+    for service in reversed(services):
+        service.stop()
+    (SCRIPT_DIR / SUPERVISOR_PID_FILE).unlink(missing_ok=True)
+    print_success("✅ All services stopped")
+
+def start_combined(profile):
+    """Start both services in one process (combined_service.py)"""
+    cmd = " ".join(
+        [f"{sys.executable} combined_service.py --auth-port {AUTH_PORT} --transaction-port {TRANSACTION_PORT}"]
+        + server_options(profile)
+    )
+    success, pid = start_service("Combined Services", ".", "combined.pid", cmd, f"http://localhost:{TRANSACTION_PORT}/readyz")
+    
+    print_header("Service Status")
+    if success:
+        print_success(f"✅ Authentication Service: Running on http://localhost:{AUTH_PORT}")
+        print_success(f"✅ Transaction Service: Running on http://localhost:{TRANSACTION_PORT}")
+        print(f"{Colors.GRAY}   - Both in process {pid}, tokens are verified in-process{Colors.END}")
+        print(f"{Colors.CYAN}   - To stop the services: python stop_services.py{Colors.END}")
+    else:
+        print_error("❌ Combined services failed to start. Check the logs for details.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the fraud detection services")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="development",
+                        help="server profile (default: development)")
+    parser.add_argument("--workers", type=int, help="Transaction Service workers in the production profile")
+    parser.add_argument("--auth-workers", type=int, help="Authentication Service workers in the production profile")
+    parser.add_argument("--supervise", action="store_true",
+                        help="stay in the foreground, restart crashed services and drain them on SIGTERM")
+    parser.add_argument("--combined", action="store_true",
+                        help="run both services in one process, verifying tokens without HTTP")
+    parser.add_argument("--auth-socket", default=os.environ.get("AUTH_SERVICE_SOCKET"),
+                        help="also serve the Authentication Service on this Unix socket and "
+                             "let the Transaction Service verify tokens through it")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     print_header("Starting Fraud Detection Services")
     
+    settings = PROFILES[args.profile]
+    auth_workers = args.auth_workers or settings.get("auth_workers", 1)
+    trans_workers = args.workers or settings.get("workers", 1)
+    if args.combined and (args.supervise or args.auth_socket):
+        print_error("--combined runs a single process and cannot be used with --supervise or --auth-socket")
+        sys.exit(1)
+    if args.combined:
+        # Everything runs on one event loop
+        auth_workers = trans_workers = 1
+    if SINGLE_PROCESS_FEATURES and trans_workers > 1:
+        # Each worker would allocate ingest log ids on its own and run its own archiver
+        print_warning(f"{', '.join(SINGLE_PROCESS_FEATURES)} only work in a single process, "
+                      f"starting 1 Transaction Service worker instead of {trans_workers}")
+        trans_workers = 1
+    if args.auth_socket:
+        if platform.system() == "Windows":
+            print_error("--auth-socket needs Unix domain sockets, which are not available on Windows")
+            sys.exit(1)
+        args.auth_socket = os.path.abspath(args.auth_socket)
+        # One process serves both the TCP port and the socket
+        auth_workers = 1
+    print_profile(args.profile, auth_workers, trans_workers)
+    if args.auth_socket:
+        print(f"{Colors.GRAY}   - Token verification over Unix socket {args.auth_socket}{Colors.END}")
+    
     # First stop any running services to avoid conflicts
     stop_script = SCRIPT_DIR / "stop_services.py"
     if stop_script.exists():
@@ -226,23 +609,36 @@ def main():
     # Set environment variables
     os.environ["AUTH_SERVICE_PORT"] = str(AUTH_PORT)
     os.environ["TRANSACTION_SERVICE_PORT"] = str(TRANSACTION_PORT)
+    if args.auth_socket:
+        # The Transaction Service reaches the Authentication Service through its socket
+        os.environ["AUTH_SERVICE_URL"] = f"unix:{args.auth_socket}"
+    
+    if args.combined:
+        start_combined(args.profile)
+        return
+    
+    if args.supervise:
+        supervise(args.profile, auth_workers, trans_workers, args.auth_socket)
+        return
     
     # Start Authentication Service
-    auth_cmd = f"{sys.executable} -m app.main"
+    auth_cmd = service_command(args.profile, AUTH_PORT, auth_workers, uds=args.auth_socket)
     auth_success, auth_pid = start_service(
         "Authentication Service", 
         "auth_service", 
         "auth.pid", 
-        auth_cmd
+        auth_cmd,
+        f"http://localhost:{AUTH_PORT}/readyz"
     )
     
     # Start Transaction Service
-    trans_cmd = f"{sys.executable} -m app.main"
+    trans_cmd = service_command(args.profile, TRANSACTION_PORT, trans_workers)
     trans_success, trans_pid = start_service(
         "Transaction Service", 
         "transaction_service", 
         "transaction.pid", 
-        trans_cmd
+        trans_cmd,
+        f"http://localhost:{TRANSACTION_PORT}/readyz"
     )
     
     # Display info about running services
@@ -75,8 +75,8 @@ def get_auth_token():
     print("\nGetting authentication token... ", end="", flush=True)
     
     auth_data = json.dumps({
-        "username": "johndoe",
-        "password": "password123"
+        "username": "admin",
+        "password": "admin123"
     }).encode('utf-8')
     
     headers = {
@@ -84,7 +84,7 @@ def get_auth_token():
     }
     
     try:
-        request = Request(f"{AUTH_URL}/token", data=auth_data, headers=headers, method="POST")
+        request = Request(f"{AUTH_URL}/api/auth/login", data=auth_data, headers=headers, method="POST")
         response = urlopen(request, timeout=5)
         
         if response.status == 200:
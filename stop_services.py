@@ -90,6 +90,34 @@ def stop_service_by_pid_file(service_name, pid_file):
             pass
         return False
 
+def stop_supervisor():
+    """Stop a supervisor started with run_services.py --supervise, which drains its services"""
+    pid_file_path = SCRIPT_DIR / "supervisor.pid"
+    if not pid_file_path.exists():
+        return False
+    
+    try:
+        pid = int(pid_file_path.read_text().strip())
+        process = psutil.Process(pid)
+        print_warning(f"Stopping service supervisor (PID: {pid}), waiting for in-flight requests...")
+        process.terminate()
+        # Services get SERVICE_DRAIN_TIMEOUT seconds to drain, plus time to exit
+        process.wait(timeout=int(os.environ.get("SERVICE_DRAIN_TIMEOUT", 20)) * 2 + 10)
+        print_success("Supervisor and its services stopped")
+        return True
+    except psutil.NoSuchProcess:
+        print_warning("Supervisor not running, removing stale PID file")
+    except psutil.TimeoutExpired:
+        print_error("Supervisor did not stop in time, stopping its services directly")
+    except Exception as e:
+        print_error(f"Error stopping supervisor: {e}")
+    
+    try:
+        pid_file_path.unlink()
+    except:
+        pass
+    return False
+
 def kill_python_service_processes():
     """Find and kill any Python processes related to our services"""
     print_warning("Checking for Python processes related to our services...")
@@ -154,12 +182,19 @@ def check_remaining_service_processes():
 def main():
     print_header("Stopping Fraud Detection Services")
     
+    # A supervisor would restart services stopped behind its back, stop it first
+    stop_supervisor()
+    
     # Stop Authentication Service
     auth_stopped = stop_service_by_pid_file("Authentication Service", "auth.pid")
     
     # Stop Transaction Service
     trans_stopped = stop_service_by_pid_file("Transaction Service", "transaction.pid")
     
+    # Stop both services when they run in one process (run_services.py --combined)
+    if (SCRIPT_DIR / "combined.pid").exists():
+        stop_service_by_pid_file("Combined Services", "combined.pid")
+    
     # Check for and kill any remaining service processes
     kill_python_service_processes()
     
@@ -174,7 +209,7 @@ def main():
         print_success("✅ All services stopped!")
     
     # Clean up any remaining PID files
-    for pid_file in ["auth.pid", "transaction.pid"]:
+    for pid_file in ["auth.pid", "transaction.pid", "combined.pid"]:
         pid_path = SCRIPT_DIR / pid_file
         if pid_path.exists():
             try:
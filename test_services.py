@@ -78,13 +78,43 @@ def test_http_endpoint(name, url, timeout=5):
         print_error(f"Error: {str(e)}")
         return False
 
+def wait_for_ready(name, url, timeout=15.0):
+    """Poll a readiness endpoint with exponential backoff until it answers 200"""
+    print(f"Waiting for {name}... ", end="", flush=True)
+    
+    delay = 0.05
+    started = time.monotonic()
+    deadline = started + timeout
+    last_error = None
+    while time.monotonic() < deadline:
+        try:
+            response = urlopen(Request(url), timeout=2)
+            if response.status == 200:
+                print_success(f"ready after {time.monotonic() - started:.2f}s")
+                return True
+        except HTTPError as e:
+            # 503 lists the checks that are still failing
+            try:
+                last_error = f"HTTP {e.code}: {e.read().decode('utf-8')}"
+            except Exception:
+                last_error = f"HTTP {e.code}"
+        except URLError as e:
+            last_error = f"Connection error: {e.reason}"
+        except Exception as e:
+            last_error = str(e)
+        time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        delay = min(delay * 2, 1.0)
+    
+    print_error(f"not ready after {timeout:.0f}s ({last_error})")
+    return False
+
 def get_auth_token():
     """Get an authentication token"""
     print("\nGetting authentication token... ", end="", flush=True)
     
     auth_data = json.dumps({
-        "username": "johndoe",
-        "password": "password123"
+        "username": "admin",
+        "password": "admin123"
     }).encode('utf-8')
     
     headers = {
@@ -92,7 +122,7 @@ def get_auth_token():
     }
     
     try:
-        request = Request(f"{AUTH_URL}/token", data=auth_data, headers=headers, method="POST")
+        request = Request(f"{AUTH_URL}/api/auth/login", data=auth_data, headers=headers, method="POST")
         response = urlopen(request, timeout=5)
         
         if response.status == 200:
@@ -158,16 +188,53 @@ def test_transaction_api(token):
         print_error(f"Error: {str(e)}")
         return False
 
+def test_create_transaction_with_offset(token):
+    """Test creating a transaction whose timestamp carries a UTC offset"""
+    print("\nTesting transaction with a timestamp offset... ", end="", flush=True)
+    
+    transaction_data = json.dumps({
+        "customer": "offset-test",
+        "vendor_id": "vendor-1",
+        "amount": 12.5,
+        "timestamp": "2025-04-02T10:23:36+02:00"
+    }).encode('utf-8')
+    
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    
+    try:
+        request = Request(f"{TRANSACTION_URL}/api/transactions", data=transaction_data, headers=headers, method="POST")
+        response = urlopen(request, timeout=5)
+        
+        if response.status == 201:
+            transaction = json.loads(response.read().decode('utf-8'))
+            print_success(f"Success! Transaction {transaction['id']} created.")
+            return True
+        else:
+            print_error(f"Unexpected status code: {response.status}")
+            return False
+    except HTTPError as e:
+        print_error(f"HTTP Error: {e.code} - {e.reason}")
+        return False
+    except URLError as e:
+        print_error(f"Connection error: {e.reason}")
+        return False
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
 def main():
     print_header("Testing Fraud Detection Services")
     
-    # Test Authentication Service
-    auth_docs_url = f"{AUTH_URL}/docs"
-    auth_service_running = test_http_endpoint("Authentication Service", auth_docs_url)
+    # Wait for the Authentication Service
+    auth_ready_url = f"{AUTH_URL}/readyz"
+    auth_service_running = wait_for_ready("Authentication Service", auth_ready_url)
     
-    # Test Transaction Service
-    transaction_docs_url = f"{TRANSACTION_URL}/docs"
-    transaction_service_running = test_http_endpoint("Transaction Service", transaction_docs_url)
+    # Wait for the Transaction Service, which is ready once it can reach the Authentication Service
+    transaction_ready_url = f"{TRANSACTION_URL}/readyz"
+    transaction_service_running = wait_for_ready("Transaction Service", transaction_ready_url)
     
     # If both services are running, test the authentication flow
     if auth_service_running and transaction_service_running:
@@ -178,10 +245,14 @@ def main():
         
         if token:
             # Test Transaction API with the token
-            test_transaction_api(token)
+            api_ok = test_transaction_api(token)
+            offset_ok = test_create_transaction_with_offset(token)
             
             print_header("Test Complete")
-            print_success("✅ All tests passed successfully!")
+            if api_ok and offset_ok:
+                print_success("✅ All tests passed successfully!")
+            else:
+                print_error("❌ Some tests failed.")
         else:
             print_header("Test Incomplete")
             print_error("❌ Authentication failed. Cannot test Transaction API.")
@@ -192,11 +263,11 @@ def main():
         # Provide hints
         if not auth_service_running:
             print_warning("  - Authentication Service is not running or accessible")
-            print_warning(f"    Try accessing: {auth_docs_url} in your browser")
+            print_warning(f"    Try accessing: {auth_ready_url} in your browser")
         
         if not transaction_service_running:
             print_warning("  - Transaction Service is not running or accessible")
-            print_warning(f"    Try accessing: {transaction_docs_url} in your browser")
+            print_warning(f"    Try accessing: {transaction_ready_url} in your browser")
         
         print("\nPlease start the services using:")
         print(f"{Colors.CYAN}python run_services.py{Colors.END}")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Storage checks for the Transaction Service, run against temporary databases.
+Each check runs in a fresh interpreter, so settings read at import time
+(COMPACT_STORAGE and friends) can differ between checks.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import subprocess
+import tempfile
+from pathlib import Path
+
+# ANSI color codes for pretty output
+class Colors:
+    CYAN = '\033[96m'
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    RED = '\033[91m'
+    BOLD = '\033[1m'
+    END = '\033[0m'
+    GRAY = '\033[90m'
+
+TRANSACTION_SERVICE_DIR = Path(__file__).resolve().parent / "transaction_service"
+
+# Writes queued together for the group commit check
+GROUP_COMMIT_WRITES = 20
+
+# Transaction with a UTC offset, created in every storage mode
+OFFSET_TRANSACTION = {
+    "customer": "customer-1",
+    "vendor_id": "vendor-1",
+    "amount": 12.5,
+    "timestamp": "2025-04-02T10:23:36+02:00"
+}
+# The same instant as naive UTC, what every storage mode should return
+OFFSET_TRANSACTION_UTC = "2025-04-02T08:23:36"
+
+def print_header(message):
+    """Print a formatted header message"""
+    print(f"\n{Colors.BOLD}{Colors.CYAN}=== {message} ==={Colors.END}\n")
+
+def print_success(message):
+    """Print a success message"""
+    print(f"{Colors.GREEN}{message}{Colors.END}")
+
+def print_error(message):
+    """Print an error message"""
+    print(f"{Colors.RED}{message}{Colors.END}")
+
+def run_check(name, env=None):
+    """Run a check in a child interpreter with its own temporary database and return its result"""
+    with tempfile.TemporaryDirectory() as directory:
+        completed = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--check", name, directory],
+            cwd=directory,
+            env={**os.environ, **(env or {})},
+            capture_output=True,
+            text=True
+        )
+        result_path = os.path.join(directory, "result.json")
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            lines = completed.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"exit code {completed.returncode}")
+        with open(result_path) as f:
+            return json.load(f)
+
+# Checks, run in the child interpreter
+
+def temporary_engine(directory, explicit_transactions=False):
+    """Engine on a fresh database in the check's directory, set up like the service's engines"""
+    from sqlalchemy import create_engine
+    from app.database import create_schema, use_explicit_transactions
+
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'transactions.db')}", connect_args={"check_same_thread": False})
+    if explicit_transactions:
+        # Like the group commit writer's engines
+        use_explicit_transactions(engine)
+    create_schema(engine)
+    return engine
+
+def check_group_commit(directory):
+    """Queue writes on a group commit writer and record the SQL SQLite ran"""
+    from sqlalchemy import event
+    from sqlalchemy.orm import sessionmaker
+    from app.database import TransactionModel
+    from app.group_commit import GroupCommitWriter
+    from app.models import TransactionStatus
+
+    engine = temporary_engine(directory, explicit_transactions=True)
+    engine.dispose()
+    statements = []
+
+    @event.listens_for(engine, "connect")
+    def trace_statements(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(statements.append)
+
+    # The window is wide enough for every write to join the first batch
+    writer = GroupCommitWriter(interval_ms=1000, max_rows=GROUP_COMMIT_WRITES, sessions=sessionmaker(bind=engine, expire_on_commit=False))
+
+    async def write_all():
+        writer.start()
+        written = await asyncio.gather(*(
+            writer.add(TransactionModel(
+                customer=f"customer-{number}",
+                vendor_id="vendor-1",
+                amount=10.0,
+                status=TransactionStatus.SUBMITTED
+            ))
+            for number in range(GROUP_COMMIT_WRITES)
+        ))
+        await writer.stop()
+        return written
+
+    written = asyncio.run(write_all())
+    return {
+        "written": len(written),
+        "begins": sum(statement.startswith("BEGIN") for statement in statements),
+        "commits": sum(statement.startswith("COMMIT") for statement in statements),
+    }
+
+def check_group_commit_response(directory):
+    """Write a transaction through the group commit writer and read it back in a new session"""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy.orm import sessionmaker
+    from app.database import TransactionModel
+    from app.group_commit import GroupCommitWriter
+    from app.main import transaction_to_dict
+    from app.models import TransactionStatus
+
+    engine = temporary_engine(directory, explicit_transactions=True)
+    sessions = sessionmaker(bind=engine, expire_on_commit=False)
+    writer = GroupCommitWriter(sessions=sessions)
+
+    async def write():
+        writer.start()
+        written = await writer.add(TransactionModel(
+            customer="customer-1",
+            vendor_id="vendor-1",
+            amount=12.345,
+            timestamp=datetime(2025, 4, 2, 10, 23, 36, tzinfo=timezone(timedelta(hours=2))),
+            status=TransactionStatus.SUBMITTED
+        ))
+        await writer.stop()
+        return written
+
+    written = transaction_to_dict(asyncio.run(write()))
+    session = sessions()
+    try:
+        stored = transaction_to_dict(session.get(TransactionModel, written["id"]))
+    finally:
+        session.close()
+    return {"returned": json.loads(json.dumps(written, default=str)), "stored": json.loads(json.dumps(stored, default=str))}
+
+def check_create_transaction(directory):
+    """Create a transaction with an offset timestamp through the API and read it back"""
+    from fastapi.testclient import TestClient
+    from sqlalchemy.orm import sessionmaker
+    from app.auth import verify_token
+    from app.database import get_db
+    from app.main import app
+
+    sessions = sessionmaker(bind=temporary_engine(directory))
+
+    def temporary_db():
+        db = sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = temporary_db
+    app.dependency_overrides[verify_token] = lambda: {"role": "admin"}
+    client = TestClient(app)
+
+    created = client.post("/api/transactions", json=OFFSET_TRANSACTION).json()
+    fetched = client.get(f"/api/transactions/{created['id']}").json()
+    return {"created": created, "fetched": {key: fetched.get(key) for key in created}}
+
+CHECKS = {
+    "group_commit": check_group_commit,
+    "group_commit_response": check_group_commit_response,
+    "create_transaction": check_create_transaction,
+}
+
+def run_child(name, directory):
+    sys.path.insert(0, str(TRANSACTION_SERVICE_DIR))
+    result = CHECKS[name](directory)
+    with open(os.path.join(directory, "result.json"), "w") as f:
+        json.dump(result, f)
+
+# Tests, run in this interpreter
+
+def test_group_commit():
+    """Writes queued together are committed by one COMMIT"""
+    print(f"Testing group commit of {GROUP_COMMIT_WRITES} writes... ", end="", flush=True)
+
+    try:
+        result = run_check("group_commit")
+    except RuntimeError as e:
+        print_error(f"Failed: {str(e)}")
+        return False
+
+    if result["written"] == GROUP_COMMIT_WRITES and result["begins"] == 1 and result["commits"] == 1:
+        print_success(f"OK ({result['begins']} BEGIN, {result['commits']} COMMIT)")
+        return True
+    print_error(f"Expected 1 BEGIN and 1 COMMIT for {GROUP_COMMIT_WRITES} writes, got {result}")
+    return False
+
+def test_group_commit_response():
+    """The group commit writer returns a transaction as a later read sees it, in both storage modes"""
+    ok = True
+    for mode, compact in (("legacy", "0"), ("compact", "1")):
+        print(f"Testing group commit response ({mode} storage)... ", end="", flush=True)
+
+        try:
+            result = run_check("group_commit_response", {"COMPACT_STORAGE": compact})
+        except RuntimeError as e:
+            print_error(f"Failed: {str(e)}")
+            ok = False
+            continue
+
+        if result["returned"] == result["stored"]:
+            print_success("OK")
+        else:
+            print_error(f"Returned {result['returned']}, stored {result['stored']}")
+            ok = False
+    return ok
+
+def test_create_transaction_storage_modes():
+    """A transaction with an offset is stored and returned the same way by legacy and compact storage"""
+    ok = True
+    for mode, compact in (("legacy", "0"), ("compact", "1")):
+        print(f"Testing offset timestamp ({mode} storage)... ", end="", flush=True)
+
+        try:
+            result = run_check("create_transaction", {"COMPACT_STORAGE": compact})
+        except RuntimeError as e:
+            print_error(f"Failed: {str(e)}")
+            ok = False
+            continue
+
+        created, fetched = result["created"], result["fetched"]
+        if created == fetched and created.get("timestamp") == OFFSET_TRANSACTION_UTC:
+            print_success(f"OK (timestamp {created['timestamp']})")
+        else:
+            print_error(f"Expected timestamp {OFFSET_TRANSACTION_UTC} on create and read, got {created} and {fetched}")
+            ok = False
+    return ok
+
+def main():
+    print_header("Testing Transaction Storage")
+
+    results = [test_group_commit(), test_group_commit_response(), test_create_transaction_storage_modes()]
+
+    print_header("Test Complete")
+    if all(results):
+        print_success("✅ All tests passed successfully!")
+    else:
+        print_error("❌ Some tests failed.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--check":
+        run_child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Reconstruct per-request waterfalls from the services' trace files.
+
+Start the services with TRACE_ENABLED=1, then run for example:
+    python trace_waterfall.py --slowest 5
+    python trace_waterfall.py --request-id 1b4e28ba-2fa1-11d2-883f-0016d3cca427
+"""
+
+import sys
+import json
+import glob
+import argparse
+from pathlib import Path
+from collections import defaultdict
+
+# Default trace files written by both services
+DEFAULT_PATTERNS = [
+    "auth_service/logs/*_trace.jsonl*",
+    "transaction_service/logs/*_trace.jsonl*",
+]
+
+
+def load_spans(paths):
+    """Span records grouped by trace (request) id"""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def trace_duration(spans):
+    start = min(span["start"] for span in spans)
+    end = max(span["start"] + span["duration_ms"] / 1000 for span in spans)
+    return (end - start) * 1000
+
+
+def ordered_spans(spans):
+    """Spans depth first, children by start time, with their depth"""
+    span_ids = {span["span_id"] for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parent_id"] in span_ids:
+            children[span["parent_id"]].append(span)
+        else:
+            # Root span, or the parent's record is missing
+            roots.append(span)
+
+    ordered = []
+
+    def visit(span, depth):
+        ordered.append((span, depth))
+        for child in sorted(children[span["span_id"]], key=lambda s: s["start"]):
+            visit(child, depth + 1)
+
+    for root in sorted(roots, key=lambda s: s["start"]):
+        visit(root, 0)
+    return ordered
+
+
+def print_waterfall(trace_id, spans, width):
+    start = min(span["start"] for span in spans)
+    total_ms = trace_duration(spans)
+    scale = width / total_ms if total_ms > 0 else 0
+    print(f"\nRequest {trace_id}  {total_ms:.1f}ms")
+
+    rows = []
+    for span, depth in ordered_spans(spans):
+        label = "  " * depth + f"{span['service']}: {span['name']}"
+        offset = int((span["start"] - start) * 1000 * scale)
+        length = max(1, int(span["duration_ms"] * scale))
+        bar = " " * offset + "#" * min(length, width - offset)
+        extra = " ".join(
+            f"{key}={value}" for key, value in span.items()
+            if key not in ("trace_id", "span_id", "parent_id", "service", "name", "start", "duration_ms")
+        )
+        rows.append((label, bar, span["duration_ms"], extra))
+
+    label_width = max(len(label) for label, _, _, _ in rows)
+    for label, bar, duration, extra in rows:
+        print(f"  {label.ljust(label_width)} |{bar.ljust(width)}| {duration:8.1f}ms {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show request waterfalls from the trace files")
+    parser.add_argument("files", nargs="*", help="trace files (default: the trace files of both services)")
+    parser.add_argument("--request-id", help="show only this request")
+    parser.add_argument("--slowest", type=int, default=10, help="show the N slowest requests (default: 10)")
+    parser.add_argument("--width", type=int, default=60, help="width of the timeline in characters")
+    args = parser.parse_args()
+
+    root = Path(__file__).resolve().parent
+    paths = args.files or sorted(
+        path for pattern in DEFAULT_PATTERNS for path in glob.glob(str(root / pattern))
+    )
+    if not paths:
+        print("No trace files found. Start the services with TRACE_ENABLED=1 first.")
+        sys.exit(1)
+
+    traces = load_spans(paths)
+    if args.request_id:
+        if args.request_id not in traces:
+            print(f"Request {args.request_id} not found in {len(paths)} trace files")
+            sys.exit(1)
+        selected = [args.request_id]
+    else:
+        selected = sorted(traces, key=lambda trace_id: trace_duration(traces[trace_id]), reverse=True)[:args.slowest]
+
+    print(f"{len(traces)} requests in {len(paths)} trace files")
+    for trace_id in selected:
+        print_waterfall(trace_id, traces[trace_id], args.width)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import glob
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, TransactionModel, ResultModel, BASE_DIR, COMPACT_STORAGE, shard_engines, create_tables, exclusive_lock
+from app.logger import get_logger
+
+# The archiver only runs in the background when enabled, the CLI works either way
+ARCHIVE_ENABLED = os.environ.get("ARCHIVE_ENABLED", "0").lower() in ("1", "true", "yes")
+# Transactions older than this are moved to the archive
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 90))
+# Rows moved per transaction, keeping write locks on the live database short
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 1000))
+# Pause between batches so live writers can take the lock
+ARCHIVE_BATCH_PAUSE_MS = int(os.environ.get("ARCHIVE_BATCH_PAUSE_MS", 50))
+# How often the background archiver runs
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get("ARCHIVE_INTERVAL_SECONDS", 3600))
+# Directory holding one SQLite file per month
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+
+# Configure logger
+logger = get_logger("transaction_service.archive")
+
+# Archive engines by file path, created on first use
+archive_engines: Dict[str, object] = {}
+
+
+def archive_path(month: datetime) -> str:
+    return os.path.join(ARCHIVE_DIR, f"transactions-{month:%Y-%m}.db")
+
+
+def get_archive_engine(path: str):
+    """Engine for an archive file, creating its schema if needed"""
+    if path not in archive_engines:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        archive_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=archive_engine)
+        archive_engines[path] = archive_engine
+    return archive_engines[path]
+
+
+def archive_files() -> List[str]:
+    """Archive files, newest month first"""
+    return sorted(glob.glob(os.path.join(ARCHIVE_DIR, "transactions-*.db")), reverse=True)
+
+
+def month_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def archive_shard(shard_engine, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE, dry_run: bool = False) -> int:
+    """
+    Move transactions older than cutoff, together with all their results,
+    from one live database into the per-month archive files.
+    """
+    moved = 0
+    transactions = TransactionModel.__table__
+    # Months before this one have already been handled
+    floor = datetime.min
+
+    with shard_engine.connect() as conn:
+        while True:
+            oldest = conn.execute(
+                select(func.min(transactions.c.timestamp))
+                .where(transactions.c.timestamp >= floor, transactions.c.timestamp < cutoff)
+            ).scalar()
+            conn.commit()
+            if oldest is None:
+                break
+
+            month = month_start(oldest)
+            end = min(next_month(month), cutoff)
+            floor = end
+
+            if dry_run:
+                count = conn.execute(
+                    select(func.count()).select_from(transactions)
+                    .where(transactions.c.timestamp >= month, transactions.c.timestamp < end)
+                ).scalar()
+                conn.commit()
+                logger.info(f"Would archive {count} transactions from {month:%Y-%m}")
+                moved += count
+                continue
+
+            path = archive_path(month)
+            get_archive_engine(path)
+            conn.exec_driver_sql("ATTACH DATABASE ? AS archive", (path,))
+            conn.commit()
+            try:
+                while True:
+                    # Each batch is its own short transaction
+                    with conn.begin():
+                        ids = conn.execute(
+                            select(transactions.c.id)
+                            .where(transactions.c.timestamp >= month, transactions.c.timestamp < end)
+                            .order_by(transactions.c.id)
+                            .limit(batch_size)
+                        ).scalars().all()
+                        if not ids:
+                            break
+                        id_list = ",".join(str(int(record_id)) for record_id in ids)
+                        conn.exec_driver_sql(f"INSERT OR IGNORE INTO archive.transactions SELECT * FROM main.transactions WHERE id IN ({id_list})")
+                        conn.exec_driver_sql(f"INSERT OR IGNORE INTO archive.results SELECT * FROM main.results WHERE transaction_id IN ({id_list})")
+                        if COMPACT_STORAGE:
+                            # Archived rows need their dictionary entries, which stay in use in the live database
+                            conn.exec_driver_sql(f"INSERT OR IGNORE INTO archive.customers SELECT * FROM main.customers WHERE id IN (SELECT customer_code FROM main.transactions WHERE id IN ({id_list}))")
+                            conn.exec_driver_sql(f"INSERT OR IGNORE INTO archive.vendors SELECT * FROM main.vendors WHERE id IN (SELECT vendor_code FROM main.transactions WHERE id IN ({id_list}))")
+                        conn.exec_driver_sql(f"DELETE FROM main.results WHERE transaction_id IN ({id_list})")
+                        conn.exec_driver_sql(f"DELETE FROM main.transactions WHERE id IN ({id_list})")
+                    moved += len(ids)
+                    time.sleep(ARCHIVE_BATCH_PAUSE_MS / 1000.0)
+            finally:
+                conn.exec_driver_sql("DETACH DATABASE archive")
+                conn.commit()
+            logger.info(f"Archived transactions from {month:%Y-%m} to {path}")
+
+    return moved
+
+
+def archive_old_rows(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE, dry_run: bool = False) -> int:
+    """Archive old transactions from every shard and return how many were moved"""
+    start = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = sum(archive_shard(shard_engine, cutoff, batch_size, dry_run) for shard_engine in shard_engines)
+    if moved:
+        logger.info(f"Archived {moved} transactions older than {cutoff.isoformat()} in {time.perf_counter() - start:.1f}s")
+    return moved
+
+
+def get_archived_transaction(transaction_id: int) -> Optional[TransactionModel]:
+    """Look a transaction up in the archive files"""
+    for path in archive_files():
+        session = sessionmaker(bind=get_archive_engine(path))()
+        try:
+            transaction = session.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
+            if transaction is not None:
+                return transaction
+        finally:
+            session.close()
+    return None
+
+
+def get_archived_results(transaction_id: int) -> List[ResultModel]:
+    """Results of an archived transaction, newest first"""
+    for path in archive_files():
+        session = sessionmaker(bind=get_archive_engine(path))()
+        try:
+            if session.query(TransactionModel.id).filter(TransactionModel.id == transaction_id).first() is None:
+                continue
+            return session.query(ResultModel).filter(
+                ResultModel.transaction_id == transaction_id
+            ).order_by(ResultModel.timestamp.desc()).all()
+        finally:
+            session.close()
+    return []
+
+
+async def archive_loop():
+    """Background task archiving old rows periodically, in one process only"""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    lock_file = exclusive_lock(os.path.join(ARCHIVE_DIR, "archive.lock"))
+    if lock_file is None:
+        logger.warning("Archiver already running in another process, not starting it here")
+        return
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(archive_old_rows)
+            except Exception as e:
+                logger.error(f"Archiver error: {str(e)}")
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+    finally:
+        lock_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old transactions and results into monthly archive files")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive transactions older than this many days")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="transactions moved per database transaction")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many transactions would be archived")
+    args = parser.parse_args()
+
+    create_tables()
+    moved = archive_old_rows(args.older_than_days, args.batch_size, args.dry_run)
+    action = "Would archive" if args.dry_run else "Archived"
+    print(f"{action} {moved} transactions older than {args.older_than_days} days")
+
+
+if __name__ == "__main__":
+    main()
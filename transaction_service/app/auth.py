@@ -1,114 +1,177 @@
 import os
-import aiohttp
+import time
+import asyncio
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.logger import get_logger
+from app.metrics import Histogram
+from app.timing import record_timing
+from app.tracing import child_span
 
 # Configure authentication settings using environment variable or default to localhost
+# "unix:/path/to/auth.sock" reaches a co-located Authentication Service over its Unix socket
 AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8080")
+if AUTH_SERVICE_URL.startswith("unix:"):
+    # unix:/tmp/auth.sock and unix:///tmp/auth.sock are the same socket
+    AUTH_SOCKET_PATH = AUTH_SERVICE_URL[len("unix:"):]
+    if AUTH_SOCKET_PATH.startswith("//"):
+        AUTH_SOCKET_PATH = AUTH_SOCKET_PATH[2:]
+    # Only the path of requests matters on a Unix socket, the host is sent in the Host header
+    AUTH_BASE_URL = "http://auth_service"
+else:
+    AUTH_SOCKET_PATH = None
+    AUTH_BASE_URL = AUTH_SERVICE_URL.rstrip("/")
 security = HTTPBearer()
 
 # Configure logger
 logger = get_logger("transaction_service.auth")
 
+# Latency of the token verification round trip, by outcome (valid, invalid, unavailable)
+auth_hop_duration = Histogram("auth_verify_duration_seconds", "Token verification round trip to the Authentication Service", ("outcome",))
+
+def auth_session():
+    """Client session for the Authentication Service, over TCP or its Unix socket"""
+    import aiohttp
+    if AUTH_SOCKET_PATH:
+        return aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=AUTH_SOCKET_PATH))
+    return aiohttp.ClientSession()
+
+# Set by the combined deployment: the Authentication Service's verify_token, called directly
+local_verifier = None
+
+def use_local_verifier(verifier):
+    """Verify tokens in this process with `verifier(token) -> Optional[dict]` instead of over HTTP"""
+    global local_verifier
+    local_verifier = verifier
+
+def local_verification(token: str) -> dict:
+    """Same result as the Authentication Service's /verify-token endpoint"""
+    token_data = local_verifier(token)
+    if not token_data:
+        return {"valid": False, "error": "Invalid token"}
+    return {"valid": True, "role": token_data["role"], "username": token_data["username"]}
+
+async def request_verification(token: str, trace_headers: dict) -> dict:
+    """Ask the Authentication Service over HTTP, falling back to the legacy endpoint"""
+    # Log the request for debugging
+    logger.info(f"Sending verification request to: {AUTH_SERVICE_URL}/verify-token")
+    
+    # Use aiohttp for asynchronous HTTP requests
+    async with auth_session() as session:
+        # First try the new endpoint with standard query parameter
+        async with session.get(
+            f"{AUTH_BASE_URL}/verify-token",
+            params={"token": token},
+            headers=trace_headers,
+            timeout=10  # Add timeout to prevent hanging
+        ) as response:
+            # Log the response for debugging
+            status_code = response.status
+            logger.info(f"Auth service response status: {status_code}")
+            
+            # Check for successful response
+            if status_code != 200:
+                logger.warning(f"Token verification failed with status {status_code}")
+                
+                # Fallback to legacy endpoint if the new one fails
+                logger.info("Trying legacy verification endpoint...")
+                
+                async with session.get(
+                    f"{AUTH_BASE_URL}/api/auth/verify",
+                    params={"token": token},
+                    headers=trace_headers,
+                    timeout=10
+                ) as legacy_response:
+                    if legacy_response.status != 200:
+                        logger.error(f"Both token verification endpoints failed")
+                        raise HTTPException(
+                            status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Invalid authentication credentials"
+                        )
+                    return await legacy_response.json()
+            else:
+                # Parse the JSON response
+                return await response.json()
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Verify token with the Authentication Service
     """
     token = credentials.credentials
-    logger.info(f"Verifying token: {token[:10] if len(token) > 10 else token}...")
+    logger.debug("Verifying token")
     
     # Fix double Bearer prefix issue
     # Remove all instances of "Bearer " from the token
     while token.startswith("Bearer "):
         token = token[7:]
     
-    logger.info(f"Clean token after removing Bearer prefix: {token[:10] if len(token) > 10 else token}")
-    
-    # Log inter-service communication details to terminal
-    print(f"\n[SERVICE-COMM] Transaction -> Auth Service | Verify Token")
-    print(f"  Token: {token[:10]}...")
+    # Imported on first use (and preloaded after startup), importing aiohttp is slow
+    import aiohttp
     
+    start = time.perf_counter()
+    outcome = "invalid"
+    # Forward the request id so the Authentication Service logs and traces under the same id
+    span = child_span()
+    trace_headers = span.headers()
     try:
-        # Log the request for debugging
-        logger.info(f"Sending verification request to: {AUTH_SERVICE_URL}/verify-token")
+        if local_verifier is not None:
+            # Combined deployment: the Authentication Service runs in this process
+            verification_result = local_verification(token)
+        else:
+            verification_result = await request_verification(token, trace_headers)
         
-        # Use aiohttp for asynchronous HTTP requests
-        async with aiohttp.ClientSession() as session:
-            # First try the new endpoint with standard query parameter
-            async with session.get(
-                f"{AUTH_SERVICE_URL}/verify-token",
-                params={"token": token},
-                timeout=10  # Add timeout to prevent hanging
-            ) as response:
-                # Log the response for debugging
-                status_code = response.status
-                logger.info(f"Auth service response status: {status_code}")
-                
-                # Print inter-service response details to terminal
-                print(f"[SERVICE-COMM] Auth Service -> Transaction | Response: {status_code}")
-                
-                # Check for successful response
-                if status_code != 200:
-                    logger.warning(f"Token verification failed with status {status_code}")
-                    
-                    # Fallback to legacy endpoint if the new one fails
-                    logger.info("Trying legacy verification endpoint...")
-                    print(f"  Fallback to legacy endpoint: {AUTH_SERVICE_URL}/api/auth/verify")
-                    
-                    async with session.get(
-                        f"{AUTH_SERVICE_URL}/api/auth/verify",
-                        params={"token": token},
-                        timeout=10
-                    ) as legacy_response:
-                        if legacy_response.status != 200:
-                            logger.error(f"Both token verification endpoints failed")
-                            print(f"  Both verification endpoints failed!")
-                            raise HTTPException(
-                                status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail="Invalid authentication credentials"
-                            )
-                        verification_result = await legacy_response.json()
-                        print(f"  Legacy response: {verification_result}")
-                else:
-                    # Parse the JSON response
-                    verification_result = await response.json()
-                
-                logger.info(f"Auth service response body: {str(verification_result)[:100]}")
-                print(f"  Verification result: {verification_result}")
-                
-                if not verification_result.get("valid", False):
-                    logger.warning("Token reported as invalid by auth service")
-                    print(f"  Token invalid: {verification_result.get('error', 'Unknown error')}")
-                    
-                    # Include any error message from the auth service
-                    error_detail = verification_result.get("error", "Invalid token")
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail=error_detail
-                    )
-                
-                # Extract role from token
-                role = verification_result.get("role")
-                
-                if not role:
-                    logger.warning("Token missing role information")
-                    print(f"  Token missing role information!")
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid token data: missing role"
-                    )
-                
-                logger.info(f"Token verified with role: {role}")
-                print(f"  Token verified successfully with role: {role}")
-                return {"role": role}
+        logger.debug(f"Auth service response body: {str(verification_result)[:100]}")
+        
+        if not verification_result.get("valid", False):
+            logger.warning("Token reported as invalid by auth service")
+            
+            # Include any error message from the auth service
+            error_detail = verification_result.get("error", "Invalid token")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=error_detail
+            )
+        
+        # Extract role from token
+        role = verification_result.get("role")
+        
+        if not role:
+            logger.warning("Token missing role information")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token data: missing role"
+            )
+        
+        logger.debug(f"Token verified with role: {role}")
+        outcome = "valid"
+        return {"role": role}
     
     except aiohttp.ClientError as e:
+        outcome = "unavailable"
         logger.error(f"Error connecting to auth service: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Authentication service unavailable"
         )
+    finally:
+        elapsed = time.perf_counter() - start
+        auth_hop_duration.observe(elapsed, outcome)
+        record_timing("auth", elapsed)
+        span.finish("transaction_service", "auth.verify_token", outcome=outcome)
+
+async def check_auth_service(timeout: float = 2.0) -> bool:
+    """True if the Authentication Service answers its liveness probe"""
+    if local_verifier is not None:
+        # Runs in this process, it is up if we are
+        return True
+    import aiohttp
+    try:
+        async with auth_session() as session:
+            async with session.get(f"{AUTH_BASE_URL}/healthz", timeout=timeout) as response:
+                return response.status == 200
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Authentication Service not reachable: {str(e) or type(e).__name__}")
+        return False
 
 def require_role(allowed_roles: list):
     """
@@ -0,0 +1,120 @@
+import os
+import re
+import glob
+import argparse
+from sqlalchemy import create_engine, inspect, insert, select
+from app.database import (
+    BASE_DIR, SHARD_ID_BITS, CompactBase, CompactTransactionModel, CompactResultModel,
+    LegacyTransactionModel, LegacyResultModel, encode_transaction_rows, seed_id_sequences
+)
+from app.archive import ARCHIVE_DIR
+
+# Dictionary ids in migrated archive files start here, above every live shard prefix,
+# so entries copied in later from live databases never collide with them
+ARCHIVE_DICTIONARY_START = 1 << 62
+
+
+def id_start_for(path: str) -> int:
+    """Where the id sequences of a migrated file start"""
+    if os.path.dirname(os.path.abspath(path)) == os.path.abspath(ARCHIVE_DIR):
+        return ARCHIVE_DICTIONARY_START
+    match = re.match(r"transactions-(\d+)\.db$", os.path.basename(path))
+    return int(match.group(1)) << SHARD_ID_BITS if match else 0
+
+
+def database_files():
+    """Live shard files and archive files"""
+    live = [
+        path for path in glob.glob(os.path.join(BASE_DIR, "transactions*.db"))
+        if re.match(r"transactions(-\d+)?\.db$", os.path.basename(path))
+    ]
+    return sorted(live) + sorted(glob.glob(os.path.join(ARCHIVE_DIR, "transactions-*.db")))
+
+
+def is_compact(path: str) -> bool:
+    source = create_engine(f"sqlite:///{path}")
+    try:
+        columns = {column["name"] for column in inspect(source).get_columns("transactions")}
+    finally:
+        source.dispose()
+    return "customer_code" in columns
+
+
+def copy_in_batches(source, target, source_table, target_table, batch_size: int, encode=None) -> int:
+    """Copy a table in id order, one target transaction per batch"""
+    copied = 0
+    last_id = None
+    with source.connect() as source_conn:
+        while True:
+            query = select(source_table).order_by(source_table.c.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(source_table.c.id > last_id)
+            rows = [dict(row._mapping) for row in source_conn.execute(query)]
+            if not rows:
+                return copied
+            with target.begin() as target_conn:
+                if encode:
+                    rows = encode(target_conn, rows)
+                target_conn.execute(insert(target_table), rows)
+            copied += len(rows)
+            last_id = rows[-1]["id"]
+
+
+def migrate_file(path: str, id_start: int, batch_size: int, keep_backup: bool = True) -> int:
+    """Rewrite one legacy database file in the compact schema"""
+    tmp_path = path + ".compact.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    source = create_engine(f"sqlite:///{path}")
+    target = create_engine(f"sqlite:///{tmp_path}")
+    try:
+        CompactBase.metadata.create_all(bind=target)
+        with target.begin() as conn:
+            seed_id_sequences(conn, CompactBase.metadata, id_start)
+
+        # Codes stay valid across batches because each batch commits
+        pending = {}
+        copied = copy_in_batches(
+            source, target, LegacyTransactionModel.__table__, CompactTransactionModel.__table__, batch_size,
+            encode=lambda conn, rows: encode_transaction_rows(conn, rows, pending=pending)
+        )
+        copy_in_batches(source, target, LegacyResultModel.__table__, CompactResultModel.__table__, batch_size)
+    finally:
+        source.dispose()
+        target.dispose()
+
+    # Swap the files only once the copy is complete
+    backup_path = path + ".legacy"
+    os.replace(path, backup_path)
+    os.replace(tmp_path, path)
+    if not keep_backup:
+        os.remove(backup_path)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite transaction databases in the compact storage schema")
+    parser.add_argument("paths", nargs="*", help="database files to migrate (default: all shard and archive files)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows copied per transaction")
+    parser.add_argument("--no-backup", action="store_true", help="delete the original files instead of keeping them as *.legacy")
+    args = parser.parse_args()
+
+    files = args.paths or database_files()
+    if not files:
+        print("No transaction databases found")
+        return
+
+    print("Stop the Transaction Service before migrating, and start it with COMPACT_STORAGE=1 afterwards")
+    for path in files:
+        if is_compact(path):
+            print(f"{path}: already compact, skipped")
+            continue
+        size_before = os.path.getsize(path)
+        copied = migrate_file(path, id_start_for(path), args.batch_size, keep_backup=not args.no_backup)
+        size_after = os.path.getsize(path)
+        print(f"{path}: {copied} transactions migrated, {size_before / 1048576:.1f}MB -> {size_after / 1048576:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,213 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Enum, text, event, select, insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, sessionmaker, relationship, column_property, attributes
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateTable, CreateIndex
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
 import os
-from datetime import datetime
+import re
+import time
+import zlib
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no advisory locks, single-process use is not enforced
+    fcntl = None
 from app.models import TransactionStatus
+from app.metrics import Histogram
+from app.timing import record_timing
+from app.logger import get_logger
 
 # Create database file path
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'transactions.db')}"
 
+# Number of SQLite files transactions are spread over (1 = single transactions.db)
+SHARD_COUNT = max(1, int(os.environ.get("TRANSACTION_SHARDS", 1)))
+# Ids carry their shard in the bits above SHARD_ID_BITS, so shard 0 keeps plain ids
+SHARD_ID_BITS = 40
+
+# Compact storage: dictionary-encoded customers and vendors, integer status, amount and timestamp
+COMPACT_STORAGE = os.environ.get("COMPACT_STORAGE", "0").lower() in ("1", "true", "yes")
+# Compact amounts are stored as integer minor units (cents by default)
+COMPACT_AMOUNT_SCALE = int(os.environ.get("COMPACT_AMOUNT_SCALE", 100))
+
+# Statements slower than this are logged with their parameters and query plan
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+
+# Configure logger
+logger = get_logger("transaction_service.database")
+
 # Create SQLAlchemy engine and session
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Shard 0 is the original transactions.db, further shards live next to it
+shard_engines = [engine] + [
+    create_engine(f"sqlite:///{os.path.join(BASE_DIR, f'transactions-{shard}.db')}", connect_args={"check_same_thread": False})
+    for shard in range(1, SHARD_COUNT)
+]
+
+
+def use_explicit_transactions(sqlite_engine):
+    """
+    Let SQLAlchemy emit BEGIN instead of pysqlite. pysqlite only begins a
+    transaction before DML, so a SAVEPOINT would start one and its RELEASE
+    would commit it. Reads then hold their lock until the session ends, so
+    this is only used for engines that write in batches.
+    """
+    @event.listens_for(sqlite_engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sqlite_engine, "begin")
+    def emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+# Query and commit latency, reported on /metrics
+db_query_duration = Histogram("db_query_duration_seconds", "SQLite statement latency by statement type", ("statement",))
+db_commit_duration = Histogram("db_commit_duration_seconds", "Session commit latency, including the final flush")
+
+
+class QueryStats:
+    """Per-statement-shape count, total, maximum and recent durations"""
+
+    # Recent durations kept per shape for percentiles
+    SAMPLES = 1000
+    # Distinct statement texts whose shape is remembered
+    MAX_CACHED_STATEMENTS = 5000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats: Dict[str, dict] = {}
+        self.shapes: Dict[str, str] = {}
+        self.plans: Dict[str, str] = {}
+
+    def shape(self, statement: str) -> str:
+        """Statement text with literals and IN lists folded, so one query is one entry"""
+        shape = self.shapes.get(statement)
+        if shape is None:
+            shape = " ".join(statement.split())
+            shape = re.sub(r"'(?:[^']|'')*'", "?", shape)
+            shape = re.sub(r"\b\d+(?:\.\d+)?\b", "?", shape)
+            shape = re.sub(r"\bIN \(\?(?:, ?\?)*\)", "IN (...)", shape, flags=re.IGNORECASE)
+            if len(self.shapes) < self.MAX_CACHED_STATEMENTS:
+                self.shapes[statement] = shape
+        return shape
+
+    def record(self, shape: str, seconds: float, slow: bool):
+        with self.lock:
+            entry = self.stats.get(shape)
+            if entry is None:
+                entry = self.stats[shape] = {"count": 0, "total": 0.0, "max": 0.0, "slow": 0, "samples": deque(maxlen=self.SAMPLES)}
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["slow"] += slow
+            entry["samples"].append(seconds)
+
+    def snapshot(self, sort: str = "total", limit: int = 20) -> list:
+        with self.lock:
+            entries = [(shape, dict(entry, samples=sorted(entry["samples"]))) for shape, entry in self.stats.items()]
+        rows = []
+        for shape, entry in entries:
+            samples = entry["samples"]
+            rows.append({
+                "statement": shape,
+                "count": entry["count"],
+                "total_ms": round(entry["total"] * 1000, 3),
+                "mean_ms": round(entry["total"] * 1000 / entry["count"], 3),
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+                "max_ms": round(entry["max"] * 1000, 3),
+                "slow": entry["slow"],
+                "plan": self.plans.get(shape),
+            })
+        rows.sort(key=lambda row: row[sort if sort in ("count", "mean_ms", "p95_ms", "max_ms", "slow") else "total_ms"], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+# Statement statistics, shown on the admin endpoint
+query_stats = QueryStats()
+
+
+def explain_query_plan(cursor, statement: str, parameters) -> str:
+    """EXPLAIN QUERY PLAN for a statement, on the connection that ran it"""
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        # executemany: explain with the first parameter set
+        parameters = parameters[0]
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            rows = plan_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+        finally:
+            plan_cursor.close()
+    except Exception as e:
+        return f"unavailable: {str(e)}"
+    return "; ".join(str(row[-1]) for row in rows)
+
+
+# Statements EXPLAIN QUERY PLAN is run for
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def log_slow_query(cursor, statement: str, parameters, shape: str, elapsed: float):
+    if shape not in query_stats.plans and statement.split(None, 1)[0].upper() in EXPLAINABLE:
+        # Plans rarely change, so each statement shape is explained once
+        query_stats.plans[shape] = explain_query_plan(cursor, statement, parameters)
+    logger.warning(
+        f"Slow query: {elapsed * 1000:.1f}ms | {' '.join(statement.split())} | "
+        f"params={repr(parameters)[:500]} | plan={query_stats.plans.get(shape, 'n/a')}"
+    )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    db_query_duration.observe(elapsed, statement.split(None, 1)[0].upper() if statement else "")
+    record_timing("db", elapsed)
+    shape = query_stats.shape(statement)
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    query_stats.record(shape, elapsed, slow)
+    if slow:
+        log_slow_query(cursor, statement, parameters, shape, elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+@event.listens_for(Session, "before_commit")
+def start_commit_timer(session):
+    session.info["commit_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def record_commit_time(session):
+    start = session.info.pop("commit_start", None)
+    if start is not None:
+        db_commit_duration.observe(time.perf_counter() - start)
 
 # Create declarative base for ORM models
 Base = declarative_base()
@@ -19,6 +215,8 @@ Base = declarative_base()
 # Define SQLAlchemy ORM models
 class TransactionModel(Base):
     __tablename__ = "transactions"
+    # AUTOINCREMENT lets each shard start its id sequence at its own prefix
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     customer = Column(String, index=True)
@@ -33,6 +231,7 @@ class TransactionModel(Base):
 
 class ResultModel(Base):
     __tablename__ = "results"
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     transaction_id = Column(Integer, ForeignKey("transactions.id"))
@@ -44,9 +243,372 @@ class ResultModel(Base):
     transaction = relationship("TransactionModel", back_populates="results")
 
 
+# Column types for the compact schema
+EPOCH = datetime(1970, 1, 1)
+STATUS_CODES = {transaction_status: code for code, transaction_status in enumerate(TransactionStatus)}
+
+
+def utc_naive(value: datetime) -> datetime:
+    """Timestamps with an offset as naive UTC, the form stored in the database"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class EpochMicros(TypeDecorator):
+    """UTC datetime stored as integer microseconds since the epoch"""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return (utc_naive(value) - EPOCH) // timedelta(microseconds=1)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else EPOCH + timedelta(microseconds=value)
+
+
+class MinorUnits(TypeDecorator):
+    """Amount stored as an integer number of minor currency units"""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else round(value * COMPACT_AMOUNT_SCALE)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / COMPACT_AMOUNT_SCALE
+
+
+class StatusCode(TypeDecorator):
+    """TransactionStatus stored as a small integer"""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else STATUS_CODES[TransactionStatus(value)]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else list(TransactionStatus)[value]
+
+
+# Compact schema, used instead of the models above when COMPACT_STORAGE is set
+CompactBase = declarative_base()
+
+class CustomerModel(CompactBase):
+    __tablename__ = "customers"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, index=True)
+
+
+class VendorModel(CompactBase):
+    __tablename__ = "vendors"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, index=True)
+
+
+class CompactTransactionModel(CompactBase):
+    __tablename__ = "transactions"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    customer_code = Column(Integer, index=True)
+    timestamp = Column(EpochMicros, default=datetime.utcnow)
+    status = Column(StatusCode, default=TransactionStatus.SUBMITTED)
+    vendor_code = Column(Integer, index=True)
+    amount = Column(MinorUnits)
+    
+    # Decoded names; new transactions set these and get their codes on flush
+    customer = column_property(select(CustomerModel.name).where(CustomerModel.id == customer_code).scalar_subquery(), expire_on_flush=False)
+    vendor_id = column_property(select(VendorModel.name).where(VendorModel.id == vendor_code).scalar_subquery(), expire_on_flush=False)
+    
+    # Relationship to results
+    results = relationship("CompactResultModel", back_populates="transaction")
+
+
+class CompactResultModel(CompactBase):
+    __tablename__ = "results"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), index=True)
+    timestamp = Column(EpochMicros, default=datetime.utcnow)
+    is_fraud = Column(Boolean)
+    confidence = Column(Float)
+    
+    # Relationship to transaction
+    transaction = relationship("CompactTransactionModel", back_populates="results")
+
+
+# The rest of the service works with whichever schema is active
+LegacyBase, LegacyTransactionModel, LegacyResultModel = Base, TransactionModel, ResultModel
+if COMPACT_STORAGE:
+    Base, TransactionModel, ResultModel = CompactBase, CompactTransactionModel, CompactResultModel
+
+
+# Shard routing
+def shard_for_customer(customer: str) -> int:
+    """Stable shard number for a customer"""
+    return zlib.crc32((customer or "").encode("utf-8")) % SHARD_COUNT
+
+
+def shard_for_id(record_id: int) -> int:
+    """Shard number encoded in a transaction or result id"""
+    return min(int(record_id) >> SHARD_ID_BITS, SHARD_COUNT - 1)
+
+
+# Dictionary codes known to be committed, by (shard, table, value)
+dictionary_codes: Dict[tuple, int] = {}
+
+
+def dictionary_code(execute, table, value: str, shard: str, pending: dict) -> int:
+    """
+    Code for a customer or vendor name in one shard's lookup table, adding
+    it if needed. Codes created in an open transaction go to pending until
+    that transaction commits.
+    """
+    key = (shard, table.name, value)
+    code = dictionary_codes.get(key) or pending.get(key)
+    if code is None:
+        code = execute(select(table.c.id).where(table.c.name == value).order_by(table.c.id).limit(1)).scalar()
+        if code is None:
+            code = execute(insert(table).values(name=value)).inserted_primary_key[0]
+        pending[key] = code
+    return code
+
+
+def encode_transaction_rows(conn, rows: list, shard: str = "0", pending: dict = None) -> list:
+    """Replace customer and vendor names with their compact codes for Core inserts"""
+    pending = {} if pending is None else pending
+    encoded = []
+    for row in rows:
+        row = dict(row)
+        row["customer_code"] = dictionary_code(conn.execute, CustomerModel.__table__, row.pop("customer"), shard, pending)
+        row["vendor_code"] = dictionary_code(conn.execute, VendorModel.__table__, row.pop("vendor_id"), shard, pending)
+        encoded.append(row)
+    return encoded
+
+
+if COMPACT_STORAGE:
+    @event.listens_for(Session, "before_flush")
+    def encode_dictionary_columns(session, flush_context, instances):
+        """Resolve customer and vendor names to codes before rows are written"""
+        pending = session.info.setdefault("dictionary_codes", {})
+        for instance in list(session.new) + list(session.dirty):
+            if not isinstance(instance, CompactTransactionModel):
+                continue
+            shard = str(shard_for_customer(instance.customer))
+            execute = lambda statement: session.execute(statement, bind_arguments={"shard_id": shard})
+            if instance.customer_code is None or attributes.get_history(instance, "customer").has_changes():
+                instance.customer_code = dictionary_code(execute, CustomerModel.__table__, instance.customer, shard, pending)
+            if instance.vendor_code is None or attributes.get_history(instance, "vendor_id").has_changes():
+                instance.vendor_code = dictionary_code(execute, VendorModel.__table__, instance.vendor_id, shard, pending)
+
+    @event.listens_for(Session, "after_commit")
+    def remember_dictionary_codes(session):
+        dictionary_codes.update(session.info.pop("dictionary_codes", {}))
+
+    @event.listens_for(Session, "after_rollback")
+    def forget_dictionary_codes(session):
+        session.info.pop("dictionary_codes", None)
+
+
+# Columns whose values identify the shard a query needs
+SHARD_KEY_COLUMNS = {("transactions", "id"), ("results", "id"), ("results", "transaction_id")}
+
+
+def shard_chooser(mapper, instance, clause=None):
+    """Pick the shard a new row is written to"""
+    if isinstance(instance, ResultModel):
+        return str(shard_for_id(instance.transaction_id))
+    return str(shard_for_customer(instance.customer))
+
+
+def identity_chooser(mapper, primary_key, *, lazy_loaded_from, execution_options, bind_arguments, **kw):
+    """Pick the shard holding a row from its primary key"""
+    return [str(shard_for_id(primary_key[0]))]
+
+
+def execute_chooser(context):
+    """
+    Pick the shards a query runs on. Equality on an id column routes to a
+    single shard, anything else goes to every shard.
+    """
+    shards = set()
+
+    def visit_binary(binary):
+        column = binary.left
+        if (
+            binary.operator is operators.eq
+            and isinstance(binary.right, BindParameter)
+            and (getattr(getattr(column, "table", None), "name", None), getattr(column, "name", None)) in SHARD_KEY_COLUMNS
+        ):
+            shards.add(str(shard_for_id(binary.right.effective_value)))
+
+    whereclause = getattr(context.statement, "whereclause", None)
+    if whereclause is not None and not any(
+        element.operator is operators.or_ for element in visitors.iterate(whereclause) if hasattr(element, "operator")
+    ):
+        visitors.traverse(whereclause, {}, {"binary": visit_binary})
+
+    return list(shards) or [str(shard) for shard in range(SHARD_COUNT)]
+
+
+def session_factory(engines=None, **options):
+    """Session factory for the configured storage layout, on the given engines (one per shard)"""
+    engines = shard_engines if engines is None else engines
+    if SHARD_COUNT == 1:
+        return sessionmaker(autocommit=False, autoflush=False, bind=engines[0], **options)
+    return sessionmaker(
+        class_=ShardedSession,
+        autocommit=False,
+        autoflush=False,
+        shards={str(shard): shard_engine for shard, shard_engine in enumerate(engines)},
+        shard_chooser=shard_chooser,
+        identity_chooser=identity_chooser,
+        execute_chooser=execute_chooser,
+        **options
+    )
+
+
+SessionLocal = session_factory()
+
+# Plain sessions per shard and a pool for parallel fan-out
+shard_sessions = [sessionmaker(autocommit=False, autoflush=False, bind=shard_engine) for shard_engine in shard_engines]
+shard_pool = ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix="shard") if SHARD_COUNT > 1 else None
+
+
+def scatter(query_fn):
+    """Run query_fn(session) on every shard in parallel and return the per-shard results"""
+    def run(shard):
+        session = shard_sessions[shard]()
+        try:
+            return query_fn(session)
+        finally:
+            session.close()
+
+    if shard_pool is None:
+        return [run(0)]
+    return list(shard_pool.map(run, range(SHARD_COUNT)))
+
+
+def list_transactions(db, skip: int = 0, limit: int = 100, status=None):
+    """
+    Page through transactions ordered by (timestamp, id). With several shards
+    each shard returns its first skip + limit rows and the pages are merged.
+    """
+    def ordered(session):
+        query = session.query(TransactionModel)
+        if status:
+            query = query.filter(TransactionModel.status == status)
+        return query.order_by(TransactionModel.timestamp, TransactionModel.id)
+
+    if SHARD_COUNT == 1:
+        return ordered(db).offset(skip).limit(limit).all()
+
+    def shard_page(session):
+        return ordered(session).limit(skip + limit).all()
+
+    merged = heapq.merge(*scatter(shard_page), key=lambda transaction: (transaction.timestamp, transaction.id))
+    return list(itertools.islice(merged, skip, skip + limit))
+
+
+def count_transactions(db, status=None) -> int:
+    """Count transactions across all shards"""
+    def shard_count(session):
+        query = session.query(TransactionModel)
+        if status:
+            query = query.filter(TransactionModel.status == status)
+        return query.count()
+
+    if SHARD_COUNT == 1:
+        return shard_count(db)
+    return sum(scatter(shard_count))
+
+
+def seed_id_sequences(conn, metadata, start: int):
+    """Start the AUTOINCREMENT sequences of every table at the given value"""
+    for table in metadata.tables:
+        conn.execute(
+            text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+            ),
+            {"name": table, "seq": start}
+        )
+
+
+def create_schema(shard_engine, attempts: int = 5):
+    """create_all, tolerating other worker processes creating the same tables"""
+    for attempt in range(attempts):
+        try:
+            Base.metadata.create_all(bind=shard_engine)
+            return
+        except OperationalError as e:
+            # Another worker created a table between the check and the CREATE
+            if "already exists" not in str(e) or attempt == attempts - 1:
+                raise
+
+
+def schema_fingerprint() -> int:
+    """Checksum of the table and index definitions, kept in SQLite's user_version"""
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(engine)))
+        statements.extend(str(CreateIndex(index).compile(engine)) for index in sorted(table.indexes, key=lambda index: index.name))
+    return zlib.crc32("\n".join(statements).encode("utf-8")) & 0x7FFFFFFF
+
+
 # Create database tables
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+def create_tables() -> int:
+    """Create missing tables, skipping shards whose schema is already current. Returns the shards updated."""
+    fingerprint = schema_fingerprint()
+    updated = 0
+    for shard, shard_engine in enumerate(shard_engines):
+        with shard_engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA user_version").scalar() == fingerprint:
+                continue
+        create_schema(shard_engine)
+        with shard_engine.begin() as conn:
+            if shard > 0:
+                # Start this shard's id sequences at its prefix
+                seed_id_sequences(conn, Base.metadata, shard << SHARD_ID_BITS)
+            conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+        updated += 1
+    return updated
+
+
+def check_database() -> bool:
+    """True if every shard's SQLite file can be queried"""
+    try:
+        for shard_engine in shard_engines:
+            with shard_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.error(f"Database check failed: {str(e)}")
+        return False
+
+
+def exclusive_lock(path: str):
+    """
+    Take an exclusive lock on a file without waiting. Returns the open file,
+    which holds the lock until it is closed, or None if another process holds it.
+    """
+    lock_file = open(path, "a")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
 
 
 # Get database session
@@ -55,4 +617,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
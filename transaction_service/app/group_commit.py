@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import session_factory, shard_engines, use_explicit_transactions
+from app.logger import get_logger
+
+# Group commit is opt-in: every write keeps its own commit unless enabled
+GROUP_COMMIT_ENABLED = os.environ.get("GROUP_COMMIT_ENABLED", "0").lower() in ("1", "true", "yes")
+# Maximum time a write waits for companions before its batch is committed
+GROUP_COMMIT_INTERVAL_MS = int(os.environ.get("GROUP_COMMIT_INTERVAL_MS", 5))
+# Maximum number of writes committed together
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get("GROUP_COMMIT_MAX_ROWS", 500))
+
+# The writer has its own connections, with one BEGIN per batch so the savepoints nest inside it
+writer_engines = [
+    create_engine(shard_engine.url, connect_args={"check_same_thread": False})
+    for shard_engine in shard_engines
+]
+for writer_engine in writer_engines:
+    use_explicit_transactions(writer_engine)
+
+# Objects must stay readable after the batch commit, so they are not expired
+WriterSession = session_factory(writer_engines, expire_on_commit=False)
+
+# Configure logger
+logger = get_logger("transaction_service.group_commit")
+
+
+class GroupCommitWriter:
+    """
+    Single-writer task that collects writes from concurrent requests and
+    commits them in one SQLite transaction.
+
+    Each submitted operation runs inside its own savepoint, so a failing
+    operation only fails its own request. The future returned to the caller
+    resolves once the whole batch has been committed.
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = GROUP_COMMIT_INTERVAL_MS,
+        max_rows: int = GROUP_COMMIT_MAX_ROWS,
+        sessions: sessionmaker = WriterSession
+    ):
+        self.interval = interval_ms / 1000.0
+        self.max_rows = max_rows
+        self.sessions = sessions
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """Start the writer task on the running event loop"""
+        if self.running:
+            return
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"Group commit writer started: interval={self.interval * 1000:.0f}ms, max_rows={self.max_rows}")
+
+    async def stop(self):
+        """Commit everything still queued, then stop the writer task"""
+        if not self.running:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+        logger.info("Group commit writer stopped")
+
+    async def submit(self, operation: Callable[[Session], Any]) -> Any:
+        """
+        Queue an operation for the next batch and wait until it is durable.
+
+        The operation receives the writer's session and should return the
+        value handed back to the caller (usually the ORM object it wrote).
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((operation, future))
+        return await future
+
+    async def add(self, instance):
+        """Insert an ORM object and return it once committed, with the values as stored"""
+        def operation(session: Session):
+            session.add(instance)
+            session.flush()
+            # Objects are not expired on commit, so read back what the columns stored
+            session.refresh(instance)
+            return instance
+        return await self.submit(operation)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+
+            # Gather more writes until the batch is full or the window closes
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = await asyncio.wait_for(self.queue.get(), remaining)
+                    else:
+                        item = self.queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._commit(batch)
+
+    async def _commit(self, batch: List[Tuple[Callable, asyncio.Future]]):
+        start = time.perf_counter()
+        try:
+            outcomes = await asyncio.to_thread(self._apply, [operation for operation, _ in batch])
+        except Exception as e:
+            # The commit itself failed, so nothing in the batch is durable
+            logger.error(f"Group commit of {len(batch)} writes failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        logger.info(f"Group commit: {len(batch)} writes in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def _apply(self, operations: List[Callable[[Session], Any]]) -> List[Tuple[bool, Any]]:
+        """Run the batch in one transaction on a worker thread"""
+        outcomes = []
+        session = self.sessions()
+        try:
+            for operation in operations:
+                savepoint = session.begin_nested()
+                try:
+                    value = operation(session)
+                    savepoint.commit()
+                    outcomes.append((True, value))
+                except Exception as e:
+                    savepoint.rollback()
+                    outcomes.append((False, e))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return outcomes
+
+
+# Shared writer used by the API endpoints when group commit is enabled
+group_writer = GroupCommitWriter()
@@ -0,0 +1,309 @@
+import os
+import json
+import glob
+import time
+import struct
+import zlib
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, insert
+from app.database import engine, SessionLocal, exclusive_lock, utc_naive, TransactionModel, BASE_DIR, SHARD_COUNT, COMPACT_STORAGE, encode_transaction_rows
+from app.models import TransactionStatus
+from app.logger import get_logger
+
+# Ingest log mode is opt-in: transactions are inserted directly unless enabled
+INGEST_LOG_ENABLED = os.environ.get("INGEST_LOG_ENABLED", "0").lower() in ("1", "true", "yes")
+# Directory holding segment files and the materializer checkpoint
+INGEST_LOG_DIR = os.environ.get("INGEST_LOG_DIR", os.path.join(BASE_DIR, "ingest_log"))
+# A new segment file is started once the current one reaches this size
+INGEST_SEGMENT_BYTES = int(os.environ.get("INGEST_SEGMENT_BYTES", 64 * 1024 * 1024))
+# How often the materializer replays new records into SQLite
+INGEST_MATERIALIZE_INTERVAL_MS = int(os.environ.get("INGEST_MATERIALIZE_INTERVAL_MS", 200))
+# Maximum number of records inserted per materializer transaction
+INGEST_MATERIALIZE_BATCH = int(os.environ.get("INGEST_MATERIALIZE_BATCH", 5000))
+
+# Record layout: header (payload length, crc32 of payload) followed by the payload
+# Payload: id, amount, timestamp in epoch microseconds, customer and vendor_id lengths, then the two strings
+HEADER = struct.Struct("<II")
+FIXED = struct.Struct("<qdqHH")
+EPOCH = datetime(1970, 1, 1)
+
+# Configure logger
+logger = get_logger("transaction_service.ingest_log")
+
+
+def encode_record(record: dict) -> bytes:
+    customer = record["customer"].encode("utf-8")
+    vendor_id = record["vendor_id"].encode("utf-8")
+    micros = (utc_naive(record["timestamp"]) - EPOCH) // timedelta(microseconds=1)
+    payload = FIXED.pack(record["id"], record["amount"], micros, len(customer), len(vendor_id)) + customer + vendor_id
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_record(payload: bytes) -> dict:
+    record_id, amount, micros, customer_len, vendor_len = FIXED.unpack_from(payload)
+    start = FIXED.size
+    customer = payload[start:start + customer_len].decode("utf-8")
+    vendor_id = payload[start + customer_len:start + customer_len + vendor_len].decode("utf-8")
+    return {
+        "id": record_id,
+        "customer": customer,
+        "timestamp": EPOCH + timedelta(microseconds=micros),
+        "status": TransactionStatus.SUBMITTED,
+        "vendor_id": vendor_id,
+        "amount": amount
+    }
+
+
+def read_segment(path: str, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Tuple[dict, int]], int]:
+    """
+    Read complete records from a segment starting at offset, at most limit of them.
+
+    Returns (record, end offset) pairs and the offset just past the last
+    valid record. A torn or corrupt tail stops the scan.
+    """
+    records = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while limit is None or len(records) < limit:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            length, crc = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset += HEADER.size + length
+            records.append((decode_record(payload), offset))
+    return records, offset
+
+
+class IngestLog:
+    """
+    Append-only log of new transactions with asynchronous materialization.
+
+    create_transaction appends a record and fsyncs the segment before
+    returning. A background task replays segments into the transactions
+    table in large batches and checkpoints how far it got. Records that are
+    logged but not yet in SQLite stay visible through an in-memory overlay.
+    """
+
+    def __init__(self, directory: str = INGEST_LOG_DIR):
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+        self.lock = threading.Lock()
+        self.materialize_lock = threading.Lock()
+        self.overlay: Dict[int, dict] = {}
+        self.next_id = 1
+        self.segment = 0
+        self.file = None
+        self.lock_file = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:08d}.log")
+
+    def _segments(self) -> List[int]:
+        paths = glob.glob(os.path.join(self.directory, "segment-*.log"))
+        return sorted(int(os.path.basename(p)[8:16]) for p in paths)
+
+    def _read_checkpoint(self) -> Tuple[int, int]:
+        if not os.path.exists(self.checkpoint_path):
+            return 0, 0
+        with open(self.checkpoint_path) as f:
+            data = json.load(f)
+        return data["segment"], data["offset"]
+
+    def _write_checkpoint(self, segment: int, offset: int):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def recover(self):
+        """Reload unmaterialized records from the last checkpoint and reopen the log"""
+        os.makedirs(self.directory, exist_ok=True)
+        checkpoint_segment, checkpoint_offset = self._read_checkpoint()
+        segments = self._segments()
+        max_id = 0
+
+        for number in segments:
+            if number < checkpoint_segment:
+                continue
+            path = self._segment_path(number)
+            offset = checkpoint_offset if number == checkpoint_segment else 0
+            records, end = read_segment(path, offset)
+            for record, _ in records:
+                self.overlay[record["id"]] = record
+                max_id = max(max_id, record["id"])
+            if end < os.path.getsize(path):
+                # Drop a torn write left behind by a crash
+                logger.warning(f"Truncating corrupt tail of {path} at offset {end}")
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+
+        db = SessionLocal()
+        try:
+            max_db_id = db.query(func.max(TransactionModel.id)).scalar() or 0
+        finally:
+            db.close()
+
+        self.next_id = max(max_id, max_db_id) + 1
+        self.segment = segments[-1] if segments else max(checkpoint_segment, 0)
+        self.file = open(self._segment_path(self.segment), "ab")
+        logger.info(f"Ingest log recovered: {len(self.overlay)} pending records, next id {self.next_id}")
+
+    def _append(self, transaction) -> dict:
+        with self.lock:
+            record = {
+                "id": self.next_id,
+                "customer": transaction.customer,
+                # Pending records read back the same as materialized ones
+                "timestamp": utc_naive(transaction.timestamp),
+                "status": TransactionStatus.SUBMITTED,
+                "vendor_id": transaction.vendor_id,
+                "amount": transaction.amount
+            }
+            data = encode_record(record)
+            if self.file.tell() > 0 and self.file.tell() + len(data) > INGEST_SEGMENT_BYTES:
+                self.file.close()
+                self.segment += 1
+                self.file = open(self._segment_path(self.segment), "ab")
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.next_id += 1
+            self.overlay[record["id"]] = record
+        return record
+
+    async def append(self, transaction) -> dict:
+        """Durably log a new transaction and return it with its assigned id"""
+        return await asyncio.to_thread(self._append, transaction)
+
+    def materialize(self) -> int:
+        """Replay the next batch of logged records into SQLite and checkpoint"""
+        with self.materialize_lock:
+            checkpoint_segment, checkpoint_offset = self._read_checkpoint()
+            with self.lock:
+                current_segment = self.segment
+            batch = []
+            position = (checkpoint_segment, checkpoint_offset)
+
+            for number in self._segments():
+                if number < checkpoint_segment:
+                    continue
+                offset = checkpoint_offset if number == checkpoint_segment else 0
+                # Only the records that fit in this batch are decoded
+                remaining = INGEST_MATERIALIZE_BATCH - len(batch)
+                records, _ = read_segment(self._segment_path(number), offset, remaining)
+                batch.extend(record for record, _ in records)
+                if records:
+                    position = (number, records[-1][1])
+                if len(records) == remaining or number >= current_segment:
+                    break
+                # Closed segment fully consumed, continue at the start of the next one
+                position = (number + 1, 0)
+
+            if not batch and position == (checkpoint_segment, checkpoint_offset):
+                return 0
+
+            if batch:
+                rows = [
+                    {key: record[key] for key in ("id", "customer", "timestamp", "status", "vendor_id", "amount")}
+                    for record in batch
+                ]
+                # OR IGNORE makes replay idempotent if we crashed between commit and checkpoint
+                with engine.begin() as conn:
+                    if COMPACT_STORAGE:
+                        rows = encode_transaction_rows(conn, rows)
+                    conn.execute(insert(TransactionModel).prefix_with("OR IGNORE"), rows)
+
+            self._write_checkpoint(*position)
+
+            with self.lock:
+                for record in batch:
+                    self.overlay.pop(record["id"], None)
+
+            # Segments before the checkpoint are fully in SQLite
+            for number in self._segments():
+                if number < position[0]:
+                    os.remove(self._segment_path(number))
+
+            return len(batch)
+
+    async def materialize_now(self) -> int:
+        """Materialize everything logged so far"""
+        total = 0
+        while True:
+            count = await asyncio.to_thread(self.materialize)
+            total += count
+            if count < INGEST_MATERIALIZE_BATCH:
+                return total
+
+    def get(self, transaction_id: int) -> Optional[dict]:
+        """Return a logged transaction that is not yet in SQLite"""
+        return self.overlay.get(transaction_id)
+
+    def pending(self, status: Optional[TransactionStatus] = None) -> List[dict]:
+        """Unmaterialized transactions in list order (timestamp, id), optionally filtered by status"""
+        with self.lock:
+            records = list(self.overlay.values())
+        if status:
+            records = [record for record in records if record["status"] == status]
+        return sorted(records, key=lambda record: (record["timestamp"], record["id"]))
+
+    def start(self):
+        """Recover the log and start the background materializer"""
+        if self.running:
+            return
+        if SHARD_COUNT > 1:
+            # Ids are allocated from a single sequence, which sharded storage cannot share
+            raise RuntimeError("The ingest log does not support sharded transaction storage")
+        os.makedirs(self.directory, exist_ok=True)
+        # Ids, segments and the checkpoint belong to one process
+        self.lock_file = exclusive_lock(os.path.join(self.directory, "ingest.lock"))
+        if self.lock_file is None:
+            raise RuntimeError("The ingest log is open in another process, run the Transaction Service with a single worker")
+        self.recover()
+
+        async def materialize_loop():
+            while True:
+                try:
+                    start = time.perf_counter()
+                    count = await self.materialize_now()
+                    if count:
+                        logger.info(f"Materialized {count} transactions in {(time.perf_counter() - start) * 1000:.1f}ms")
+                except Exception as e:
+                    logger.error(f"Materializer error: {str(e)}")
+                await asyncio.sleep(INGEST_MATERIALIZE_INTERVAL_MS / 1000.0)
+
+        self.task = asyncio.create_task(materialize_loop())
+
+    async def stop(self):
+        """Stop the materializer after draining the log into SQLite"""
+        if not self.running:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        await self.materialize_now()
+        with self.lock:
+            self.file.close()
+        self.lock_file.close()
+        self.lock_file = None
+        logger.info("Ingest log stopped")
+
+
+# Shared ingest log used by the API endpoints when enabled
+ingest_log = IngestLog()
@@ -1,8 +1,19 @@
+import atexit
+import copy
+import json
 import logging
 import os
+import queue
 import sys
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+# Log records are written by a background thread so request handlers never block on I/O
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Maximum number of records written between two flushes
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 256))
+# What happens when the queue is full: "drop" (count and discard) or "block" (wait for space)
+LOG_OVERFLOW_POLICY = os.environ.get("LOG_OVERFLOW_POLICY", "drop").lower()
 
 # Configure formatter with detailed information and defaults for optional fields
 class SafeFormatter(logging.Formatter):
@@ -17,9 +28,181 @@ formatter = SafeFormatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s - [%(source)s:%(destination)s]'
 )
 
+
+class LazyJson:
+    """Log argument serialized to JSON only when the record is actually written"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value)
+
+
+class BatchFlushMixin:
+    """Handler mixin that leaves flushing to the log writer, once per batch"""
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class BatchRotatingFileHandler(BatchFlushMixin, RotatingFileHandler):
+    pass
+
+
+class PipelineQueueHandler(QueueHandler):
+    """
+    Queue handler feeding the log writer thread. Records carry the handlers
+    they are meant for, so one writer serves every logger.
+    """
+    def __init__(self, log_queue, targets):
+        super().__init__(log_queue)
+        self.targets = targets
+        self.dropped = 0
+        self.reported_dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now, the rest of the formatting happens on the writer thread.
+        # LazyJson arguments are left for the writer thread to serialize.
+        if record.args and not (
+            isinstance(record.args, tuple) and all(isinstance(arg, LazyJson) for arg in record.args)
+        ):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        if not log_writer.running:
+            # Writer stopped (e.g. after shutdown): write synchronously instead
+            log_writer.write(self.targets, [record])
+            log_writer.flush(self.targets)
+            return
+        if LOG_OVERFLOW_POLICY == "block":
+            self.queue.put((self, record))
+            return
+        try:
+            self.queue.put_nowait((self, record))
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """Background thread writing queued log records in batches"""
+    def __init__(self, maxsize=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.queue_handlers = []
+        self.thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Write everything still queued, flush the handlers and stop the thread"""
+        with self.lock:
+            if not self.running:
+                return
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def write(self, targets, records):
+        for record in records:
+            for handler in targets:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def flush(self, targets):
+        for handler in targets:
+            handler.flush_batch()
+
+    def stats(self):
+        """Queue depth and dropped record count, for monitoring"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": sum(handler.dropped for handler in self.queue_handlers),
+        }
+
+    def _report_dropped(self, touched):
+        for queue_handler in self.queue_handlers:
+            dropped = queue_handler.dropped - queue_handler.reported_dropped
+            if dropped:
+                queue_handler.reported_dropped += dropped
+                record = logging.LogRecord(
+                    "logger", logging.WARNING, __file__, 0,
+                    f"Dropped {dropped} log records because the log queue was full", None, None
+                )
+                self.write(queue_handler.targets, [record])
+                touched.update(queue_handler.targets)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self.queue.get()]
+            # Drain whatever else is waiting, up to one batch
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            touched = set()
+            for item in items:
+                if item is None:
+                    stopping = True
+                    continue
+                queue_handler, record = item
+                try:
+                    self.write(queue_handler.targets, [record])
+                except Exception:
+                    pass
+                touched.update(queue_handler.targets)
+            self._report_dropped(touched)
+            self.flush(touched)
+
+
+log_writer = LogWriter()
+
+
+def start_log_writer():
+    """Start the background log writer (safe to call more than once)"""
+    log_writer.start()
+
+
+def stop_log_writer():
+    """Flush pending log records and stop the background writer"""
+    log_writer.stop()
+
+
+atexit.register(stop_log_writer)
+
+
 def get_logger(name, log_file=None):
     """
-    Create and configure a logger with both console and file handlers
+    Create and configure a logger with both console and file handlers.
+    Records are handed to a background writer thread through a queue.
     """
     logger = logging.getLogger(name)
     
@@ -30,9 +213,9 @@ def get_logger(name, log_file=None):
     logger.setLevel(logging.INFO)
     
     # Add console handler
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = BatchStreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    targets = [console_handler]
     
     # Add file handler if specified
     if log_file:
@@ -43,13 +226,18 @@ def get_logger(name, log_file=None):
         
         log_path = os.path.join(logs_dir, log_file)
         
-        file_handler = RotatingFileHandler(
+        file_handler = BatchRotatingFileHandler(
             log_path,
             maxBytes=10485760,  # 10MB
             backupCount=5
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        targets.append(file_handler)
+    
+    queue_handler = PipelineQueueHandler(log_writer.queue, targets)
+    log_writer.queue_handlers.append(queue_handler)
+    logger.addHandler(queue_handler)
+    start_log_writer()
     
     return logger
 
@@ -1,25 +1,49 @@
 import os
-import uuid
-import json
+import time
+
+# Startup is timed from here, so the report includes importing the service's modules
+STARTUP_STARTED = time.perf_counter()
+
+import heapq
+import asyncio
+import itertools
 from typing import List, Optional
-from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
+from fastapi import FastAPI, Depends, HTTPException, status, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from contextlib import asynccontextmanager
 
 try:
     # First try relative imports for running as module
     from app.models import Transaction, TransactionCreate, TransactionInDB, Prediction, PredictionCreate, TransactionStatus
-    from app.database import get_db, create_tables, TransactionModel, ResultModel
-    from app.auth import verify_token, require_role
-    from app.logger import get_logger, RequestResponseFilter
+    from app.database import get_db, create_tables, check_database, list_transactions, query_stats, SLOW_QUERY_MS, TransactionModel, ResultModel, utc_naive
+    from app.auth import verify_token, require_role, check_auth_service
+    from app.logger import get_logger, start_log_writer, stop_log_writer
+    from app.request_logging import load_request_log_policy, RequestLoggingMiddleware
+    from app.metrics import MetricsMiddleware, render_metrics
+    from app.profiling import create_profiling_router
+    from app.loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+    from app.startup import StartupTimer, warm_imports
+    from app.timing import ServerTimingMiddleware, TimedRoute
+    from app.group_commit import group_writer, GROUP_COMMIT_ENABLED
+    from app.ingest_log import ingest_log, INGEST_LOG_ENABLED
+    from app.archive import archive_loop, get_archived_transaction, get_archived_results, ARCHIVE_ENABLED
 except ImportError:
     # Fall back to direct imports for running directly
     from models import Transaction, TransactionCreate, TransactionInDB, Prediction, PredictionCreate, TransactionStatus
-    from database import get_db, create_tables, TransactionModel, ResultModel
-    from auth import verify_token, require_role
-    from logger import get_logger, RequestResponseFilter
+    from database import get_db, create_tables, check_database, list_transactions, query_stats, SLOW_QUERY_MS, TransactionModel, ResultModel, utc_naive
+    from auth import verify_token, require_role, check_auth_service
+    from logger import get_logger, start_log_writer, stop_log_writer
+    from request_logging import load_request_log_policy, RequestLoggingMiddleware
+    from metrics import MetricsMiddleware, render_metrics
+    from profiling import create_profiling_router
+    from loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+    from startup import StartupTimer, warm_imports
+    from timing import ServerTimingMiddleware, TimedRoute
+    from group_commit import group_writer, GROUP_COMMIT_ENABLED
+    from ingest_log import ingest_log, INGEST_LOG_ENABLED
+    from archive import archive_loop, get_archived_transaction, get_archived_results, ARCHIVE_ENABLED
 
 # Create logs directory if it doesn't exist
 os.makedirs("logs", exist_ok=True)
@@ -27,12 +51,57 @@ os.makedirs("logs", exist_ok=True)
 # Define lifespan context manager for FastAPI startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Create database tables
-    create_tables()
-    logger.info("Transaction Service started and database initialized")
+    startup = StartupTimer(STARTUP_STARTED)
+    startup.mark("imports")
+    
+    # Write log records from the background thread
+    start_log_writer()
+    
+    # Watch the event loop for lag and blocking calls
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    startup.mark("monitoring")
+    
+    # Startup: Create database tables, unless the schema is already current
+    with startup.phase("schema"):
+        updated_shards = create_tables()
+    logger.info(f"Transaction Service started and database initialized ({updated_shards} shards updated)")
+    
+    # Start the group commit writer if enabled
+    if GROUP_COMMIT_ENABLED:
+        group_writer.start()
+    
+    # Recover the ingest log and start materializing it if enabled
+    if INGEST_LOG_ENABLED:
+        with startup.phase("ingest_log"):
+            ingest_log.start()
+    
+    # Move old transactions to the monthly archives in the background
+    archive_task = None
+    if ARCHIVE_ENABLED:
+        archive_task = asyncio.create_task(archive_loop())
+    
+    startup.report("Transaction Service")
+    # The HTTP client is only needed for token verification, load it in the background
+    warmup_task = asyncio.create_task(warm_imports(["aiohttp"]))
+    
     yield
-    # Shutdown: Any cleanup can go here if needed
+    
+    warmup_task.cancel()
+    if archive_task:
+        archive_task.cancel()
+        try:
+            await archive_task
+        except asyncio.CancelledError:
+            pass
+    # Shutdown: Commit any writes still waiting in the group commit queue
+    await group_writer.stop()
+    # Drain the ingest log into the database
+    await ingest_log.stop()
+    await loop_monitor.stop()
     logger.info("Transaction Service shutting down")
+    # Flush queued log records before exiting
+    stop_log_writer()
 
 # Create and configure the application
 app = FastAPI(
@@ -43,6 +112,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Routes time their endpoint body and serialization when a request asks for Server-Timing
+app.router.route_class = TimedRoute
+
 # Setup CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -55,55 +127,73 @@ app.add_middleware(
 # Configure logger
 logger = get_logger("transaction_service", "transaction_service.log")
 
+# Decides which requests are logged and in how much detail
+request_log_policy = load_request_log_policy("/healthz=off,/readyz=errors")
+
+# Per-request phase timing, added before the request logger so the log sees the result
+app.add_middleware(ServerTimingMiddleware)
+
 # Middleware for request/response logging
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    request_id = str(uuid.uuid4())
-    client_host = request.client.host if request.client else "unknown"
-    
-    # Log request path and method without reading the body
-    port = os.environ.get("TRANSACTION_PORT", 8081)
-    
-    # Prepare request logging data
-    log_data = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "request_id": request_id,
-        "source": client_host,
-        "destination": f"transaction_service:{port}{request.url.path}",
-        "method": request.method,
-        "path": request.url.path,
-        "query_params": dict(request.query_params),
-        "headers": dict(request.headers),
-    }
-    
-    # Print detailed request log to terminal
-    print(f"\n[TRANS-REQUEST] {datetime.utcnow().isoformat()} | {request.method} {request.url.path}")
-    print(f"  Source: {client_host}")
-    print(f"  Headers: {json.dumps(dict(request.headers), indent=2)}")
-    print(f"  Query params: {json.dumps(dict(request.query_params), indent=2)}")
-    
-    # Also log to file
-    logger.info(f"Request: {json.dumps(log_data)}")
-    
-    # Process the request without trying to read/reconstruct the body
-    response = await call_next(request)
-    
-    # Create a response log
-    response_log = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "request_id": request_id,
-        "statusCode": response.status_code,
-        "headers": dict(response.headers),
+app.add_middleware(
+    RequestLoggingMiddleware,
+    logger=logger,
+    service="transaction_service",
+    port=os.environ.get("TRANSACTION_PORT", 8081),
+    policy=request_log_policy
+)
+
+# Request latency and in-flight metrics
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: the database is open and the Authentication Service is reachable"""
+    database_ok, auth_ok = await asyncio.gather(asyncio.to_thread(check_database), check_auth_service())
+    checks = {"database": database_ok, "auth_service": auth_ok}
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
+
+def transaction_to_dict(transaction) -> dict:
+    """Convert a SQLAlchemy transaction row to a dict for proper serialization"""
+    return {
+        "id": transaction.id,
+        "customer": transaction.customer,
+        "timestamp": transaction.timestamp,
+        "status": transaction.status,
+        "vendor_id": transaction.vendor_id,
+        "amount": transaction.amount
     }
-    
-    # Print response log to terminal
-    print(f"[TRANS-RESPONSE] {datetime.utcnow().isoformat()} | Status: {response.status_code}")
-    print(f"  Headers: {json.dumps(dict(response.headers), indent=2)}")
-    
-    # Also log to file
-    logger.info(f"Response: {json.dumps(response_log)}")
-    
-    return response
+
+def transaction_page(db: Session, skip: int, limit: int, status: Optional[TransactionStatus]) -> list:
+    """A page of transactions ordered by (timestamp, id), including logged ones that are not materialized yet"""
+    pending = ingest_log.pending(status) if ingest_log.running else []
+    if not pending:
+        return [transaction_to_dict(db_transaction) for db_transaction in list_transactions(db, skip, limit, status)]
+    
+    # Pending records can sort anywhere, so rows are read from the first page on and merged before the page is cut
+    transactions = [transaction_to_dict(db_transaction) for db_transaction in list_transactions(db, 0, skip + limit, status)]
+    seen = {transaction["id"] for transaction in transactions}
+    pending = [dict(record) for record in pending if record["id"] not in seen]
+    merged = heapq.merge(transactions, pending, key=lambda transaction: (transaction["timestamp"], transaction["id"]))
+    return list(itertools.islice(merged, skip, skip + limit))
+
+async def materialize_if_pending(transaction_id: int):
+    """Make sure a logged transaction is in the database before it is modified"""
+    if ingest_log.running and ingest_log.get(transaction_id) is not None:
+        await ingest_log.materialize_now()
 
 # Transaction endpoints
 @app.post("/api/transactions", response_model=Transaction, status_code=status.HTTP_201_CREATED)
@@ -116,6 +206,15 @@ async def create_transaction(
         # Log the incoming transaction data for debugging
         logger.info(f"Creating transaction: {transaction.dict()}")
         
+        # Offsets are converted here, so every storage mode stores and returns the same naive UTC time
+        transaction.timestamp = utc_naive(transaction.timestamp)
+        
+        # In ingest log mode the transaction is only appended to the log
+        if ingest_log.running:
+            transaction_dict = await ingest_log.append(transaction)
+            logger.info(f"Transaction logged: ID={transaction_dict['id']}, Customer={transaction.customer}")
+            return transaction_dict
+        
         # Create transaction object
         db_transaction = TransactionModel(
             customer=transaction.customer,
@@ -126,19 +225,15 @@ async def create_transaction(
         )
         
         # Save to database
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
+        if group_writer.running:
+            db_transaction = await group_writer.add(db_transaction)
+        else:
+            db.add(db_transaction)
+            db.commit()
+            db.refresh(db_transaction)
         
         # Convert SQLAlchemy model to dict for proper serialization
-        transaction_dict = {
-            "id": db_transaction.id,
-            "customer": db_transaction.customer,
-            "timestamp": db_transaction.timestamp,
-            "status": db_transaction.status,
-            "vendor_id": db_transaction.vendor_id,
-            "amount": db_transaction.amount
-        }
+        transaction_dict = transaction_to_dict(db_transaction)
         
         logger.info(f"Transaction created: ID={db_transaction.id}, Customer={transaction.customer}")
         return transaction_dict
@@ -159,25 +254,8 @@ async def read_transactions_simple(
     db: Session = Depends(get_db),
     user_data: dict = Depends(verify_token)
 ):
-    query = db.query(TransactionModel)
-    
-    # Apply status filter if provided
-    if status:
-        query = query.filter(TransactionModel.status == status)
-    
-    db_transactions = query.offset(skip).limit(limit).all()
-    
-    # Convert SQLAlchemy models to dicts for proper serialization
-    transactions = []
-    for db_transaction in db_transactions:
-        transactions.append({
-            "id": db_transaction.id,
-            "customer": db_transaction.customer,
-            "timestamp": db_transaction.timestamp,
-            "status": db_transaction.status,
-            "vendor_id": db_transaction.vendor_id,
-            "amount": db_transaction.amount
-        })
+    # Apply status filter if provided, gathering from every shard and the ingest log
+    transactions = transaction_page(db, skip, limit, status)
     
     logger.info(f"Retrieved {len(transactions)} transactions")
     return transactions
@@ -190,25 +268,8 @@ async def read_transactions(
     db: Session = Depends(get_db),
     user_data: dict = Depends(verify_token)
 ):
-    query = db.query(TransactionModel)
-    
-    # Apply status filter if provided
-    if status:
-        query = query.filter(TransactionModel.status == status)
-    
-    db_transactions = query.offset(skip).limit(limit).all()
-    
-    # Convert SQLAlchemy models to dicts for proper serialization
-    transactions = []
-    for db_transaction in db_transactions:
-        transactions.append({
-            "id": db_transaction.id,
-            "customer": db_transaction.customer,
-            "timestamp": db_transaction.timestamp,
-            "status": db_transaction.status,
-            "vendor_id": db_transaction.vendor_id,
-            "amount": db_transaction.amount
-        })
+    # Apply status filter if provided, gathering from every shard and the ingest log
+    transactions = transaction_page(db, skip, limit, status)
     
     logger.info(f"Retrieved {len(transactions)} transactions")
     return transactions
@@ -221,23 +282,28 @@ async def read_transaction(
 ):
     transaction = db.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
     
-    if transaction is None:
-        logger.warning(f"Transaction not found: ID={transaction_id}")
-        raise HTTPException(status_code=404, detail="Transaction not found")
+    # Fall back to logged transactions that are not materialized yet
+    if transaction is None and ingest_log.running:
+        pending = ingest_log.get(transaction_id)
+        if pending is not None:
+            logger.info(f"Retrieved pending transaction: ID={transaction_id}")
+            return dict(pending)
     
-    # Get the latest prediction for this transaction if it exists
-    result = db.query(ResultModel).filter(
-        ResultModel.transaction_id == transaction_id
-    ).order_by(ResultModel.timestamp.desc()).first()
-    
-    transaction_dict = {
-        "id": transaction.id,
-        "customer": transaction.customer,
-        "timestamp": transaction.timestamp,
-        "status": transaction.status,
-        "vendor_id": transaction.vendor_id,
-        "amount": transaction.amount
-    }
+    if transaction is None:
+        # Fall back to the monthly archives
+        transaction = get_archived_transaction(transaction_id)
+        if transaction is None:
+            logger.warning(f"Transaction not found: ID={transaction_id}")
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        archived_results = get_archived_results(transaction_id)
+        result = archived_results[0] if archived_results else None
+    else:
+        # Get the latest prediction for this transaction if it exists
+        result = db.query(ResultModel).filter(
+            ResultModel.transaction_id == transaction_id
+        ).order_by(ResultModel.timestamp.desc()).first()
+    
+    transaction_dict = transaction_to_dict(transaction)
     
     # Add prediction data if available
     if result:
@@ -254,26 +320,31 @@ async def update_transaction(
     db: Session = Depends(get_db),
     user_data: dict = Depends(require_role(["admin", "agent"]))
 ):
-    transaction = db.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
+    await materialize_if_pending(transaction_id)
+    
+    if group_writer.running:
+        # Load and update inside the writer's batch
+        def apply_update(session):
+            row = session.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
+            if row is not None:
+                row.status = status
+                session.flush()
+            return row
+        transaction = await group_writer.submit(apply_update)
+    else:
+        transaction = db.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
+        if transaction is not None:
+            # Update status
+            transaction.status = status
+            db.commit()
+            db.refresh(transaction)
     
     if transaction is None:
         logger.warning(f"Transaction not found for update: ID={transaction_id}")
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Update status
-    transaction.status = status
-    db.commit()
-    db.refresh(transaction)
-    
     # Convert SQLAlchemy model to dict for proper serialization
-    transaction_dict = {
-        "id": transaction.id,
-        "customer": transaction.customer,
-        "timestamp": transaction.timestamp,
-        "status": transaction.status,
-        "vendor_id": transaction.vendor_id,
-        "amount": transaction.amount
-    }
+    transaction_dict = transaction_to_dict(transaction)
     
     logger.info(f"Updated transaction status: ID={transaction_id}, Status={status}")
     return transaction_dict
@@ -286,6 +357,8 @@ async def create_prediction(
     db: Session = Depends(get_db),
     user_data: dict = Depends(require_role(["admin", "agent"]))
 ):
+    await materialize_if_pending(transaction_id)
+    
     # Check if transaction exists
     transaction = db.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
     if not transaction:
@@ -300,9 +373,12 @@ async def create_prediction(
     )
     
     # Save to database
-    db.add(db_result)
-    db.commit()
-    db.refresh(db_result)
+    if group_writer.running:
+        db_result = await group_writer.add(db_result)
+    else:
+        db.add(db_result)
+        db.commit()
+        db.refresh(db_result)
     
     # Convert to response model
     result_dict = {
@@ -322,17 +398,22 @@ async def read_transaction_results(
     db: Session = Depends(get_db),
     user_data: dict = Depends(require_role(["admin", "agent"]))
 ):
+    await materialize_if_pending(transaction_id)
+    
     # Check if transaction exists
     transaction = db.query(TransactionModel).filter(TransactionModel.id == transaction_id).first()
-    if not transaction:
+    if transaction:
+        # Get all results for the transaction
+        results = db.query(ResultModel).filter(
+            ResultModel.transaction_id == transaction_id
+        ).order_by(ResultModel.timestamp.desc()).all()
+    elif get_archived_transaction(transaction_id):
+        # Archived transactions keep their results in the same archive file
+        results = get_archived_results(transaction_id)
+    else:
         logger.warning(f"Transaction not found for results retrieval: ID={transaction_id}")
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Get all results for the transaction
-    results = db.query(ResultModel).filter(
-        ResultModel.transaction_id == transaction_id
-    ).order_by(ResultModel.timestamp.desc()).all()
-    
     # Convert to response model
     results_list = []
     for result in results:
@@ -347,6 +428,24 @@ async def read_transaction_results(
     logger.info(f"Retrieved {len(results)} predictions for transaction: ID={transaction_id}")
     return results_list
 
+@app.get("/admin/db/stats", include_in_schema=False)
+async def read_query_stats(
+    sort: str = "total_ms",
+    limit: int = 20,
+    user_data: dict = Depends(require_role(["admin"]))
+):
+    """Per-statement timing statistics, slowest in total first"""
+    return {"slow_query_ms": SLOW_QUERY_MS, "statements": query_stats.snapshot(sort, limit)}
+
+@app.post("/admin/db/stats/reset", include_in_schema=False)
+async def reset_query_stats(user_data: dict = Depends(require_role(["admin"]))):
+    query_stats.reset()
+    logger.info("Query statistics reset")
+    return {"detail": "Query statistics reset"}
+
+# Admin-only profiling endpoints, idle until a session is started
+app.include_router(create_profiling_router(require_role(["admin"])))
+
 if __name__ == "__main__":
     import uvicorn
     # Get port from environment variable or use default 8081
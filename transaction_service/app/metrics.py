@@ -0,0 +1,235 @@
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Tuple
+from app.logger import log_writer
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every metric, in the order it is rendered
+registry: List["Metric"] = []
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """
+    Base class for metrics. Each thread updates its own shard without taking
+    a lock, and the shards are only added up when /metrics is scraped.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.shards: List[dict] = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self.local.shard
+        except AttributeError:
+            # First update from this thread
+            shard = {}
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+            return shard
+
+    def _snapshots(self) -> List[list]:
+        with self.lock:
+            shards = list(self.shards)
+        snapshots = []
+        for shard in shards:
+            while True:
+                try:
+                    snapshots.append([(key, list(value) if isinstance(value, list) else value) for key, value in shard.items()])
+                    break
+                except RuntimeError:
+                    # The owning thread added a series while we were copying
+                    continue
+        return snapshots
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def values(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for snapshot in self._snapshots():
+            for key, value in snapshot:
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        values = self.values()
+        if not values and not self.labels:
+            values = {(): 0}
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, such as the number of requests in flight"""
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class CallbackGauge(Metric):
+    """Gauge read from a callback at scrape time, for state kept elsewhere"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, callback: Callable[[], float]):
+        super().__init__(name, description)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {format_value(self.callback())}"]
+
+
+class Histogram(Metric):
+    """Distribution of observed values per label set, in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        shard = self._shard()
+        series = shard.get(label_values)
+        if series is None:
+            # One count per bucket plus +Inf, then the sum
+            series = shard[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self) -> int:
+        """Number of observations over all label sets"""
+        return sum(sum(series[:-1]) for snapshot in self._snapshots() for _, series in snapshot)
+
+    def time(self, *label_values) -> "Timer":
+        """Context manager observing the duration of its block"""
+        return Timer(self, label_values)
+
+    def render(self) -> List[str]:
+        totals: Dict[Tuple, list] = {}
+        for snapshot in self._snapshots():
+            for key, series in snapshot:
+                total = totals.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+
+        lines = []
+        for key, series in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else format_value(bound)
+                bucket_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, bucket_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(series[-1])}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, label_values: Tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# HTTP metrics recorded by MetricsMiddleware
+request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by method, route and status",
+    ("method", "route", "status")
+)
+requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+
+# Logging pipeline state
+CallbackGauge("log_queue_depth", "Log records waiting for the writer thread", lambda: log_writer.stats()["queue_depth"])
+CallbackGauge("log_records_dropped", "Log records dropped because the queue was full", lambda: log_writer.stats()["dropped"])
+
+
+def route_label(scope) -> str:
+    """Route template of a handled request, keeping label cardinality bounded"""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "other")
+    if "endpoint" not in scope:
+        return "unmatched"
+    # Older Starlette versions do not record the route, rebuild the template from the path parameters
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and requests in flight"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec()
+            request_duration.observe(time.perf_counter() - start, scope["method"], route_label(scope), status_code)
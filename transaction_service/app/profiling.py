@@ -0,0 +1,266 @@
+import io
+import os
+import sys
+import time
+import pstats
+import marshal
+import asyncio
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from app.metrics import request_duration
+from app.logger import get_logger
+
+# Longest profiling session that can be requested
+PROFILE_MAX_SECONDS = int(os.environ.get("PROFILE_MAX_SECONDS", 300))
+
+# Configure logger
+logger = get_logger("transaction_service.profiling")
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Background thread recording the stacks of all other threads at a fixed interval"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format used by flame graph tools"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def text(self, limit: int = 50) -> str:
+        total = sum(self.stacks.values()) or 1
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        lines = [f"{total} samples, {self.interval * 1000:.1f}ms interval", ""]
+        lines += [f"{count * 100.0 / total:6.2f}%  {count:8d}  {leaf}" for leaf, count in leaves.most_common(limit)]
+        return "\n".join(lines) + "\n"
+
+
+class ProfileSession:
+    """
+    One profiling session at a time, limited by time and/or request count.
+
+    cProfile sessions profile the event loop thread, where all async
+    endpoints run. Sampling sessions record every thread. Nothing is
+    instrumented while no session is running.
+    """
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.seconds = 0
+        self.requests = 0
+        self.profile: Optional[cProfile.Profile] = None
+        self.sampler: Optional[SamplingProfiler] = None
+        self.task: Optional[asyncio.Task] = None
+        self.result: Optional[dict] = None
+        self.last_snapshot = None
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None or self.sampler is not None
+
+    def start(self, mode: str, seconds: int, requests: int, interval_ms: float):
+        """Start a session; must be called on the event loop thread"""
+        if self.running:
+            raise RuntimeError("A profiling session is already running")
+        if mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif mode == "sampling":
+            self.sampler = SamplingProfiler(interval_ms / 1000.0)
+            self.sampler.start()
+        else:
+            raise ValueError(f"Unknown profiling mode '{mode}'")
+
+        self.mode = mode
+        self.started_at = datetime.utcnow()
+        self.seconds = seconds
+        self.requests = requests
+        self.task = asyncio.create_task(self._stop_when_done(seconds, requests))
+        logger.info(f"Profiling started: mode={mode}, seconds={seconds}, requests={requests}")
+
+    async def _stop_when_done(self, seconds: int, requests: int):
+        deadline = time.monotonic() + seconds
+        target = request_duration.count() + requests if requests else None
+        while time.monotonic() < deadline:
+            if target is not None and request_duration.count() >= target:
+                break
+            await asyncio.sleep(0.1)
+        self.stop()
+
+    def stop(self):
+        """Stop the running session and keep its result"""
+        if not self.running:
+            return
+        result = {
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": round((datetime.utcnow() - self.started_at).total_seconds(), 3),
+        }
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.create_stats()
+            # Serialize first: pstats.Stats takes the stats over from the profile
+            result["pstats"] = marshal.dumps(self.profile.stats)
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(50)
+            result["text"] = stream.getvalue()
+            self.profile = None
+        if self.sampler is not None:
+            self.sampler.stop()
+            result["collapsed"] = self.sampler.collapsed()
+            result["text"] = self.sampler.text()
+            self.sampler = None
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
+        self.result = result
+        logger.info(f"Profiling stopped after {result['duration_seconds']}s")
+
+    def status(self) -> dict:
+        if self.running:
+            return {
+                "running": True,
+                "mode": self.mode,
+                "started_at": self.started_at.isoformat(),
+                "seconds": self.seconds,
+                "requests": self.requests,
+            }
+        formats = [name for name in ("pstats", "collapsed", "text") if self.result and name in self.result]
+        return {
+            "running": False,
+            "last_session": {key: self.result[key] for key in ("mode", "started_at", "duration_seconds")} if self.result else None,
+            "formats": formats,
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
+
+    def memory_snapshot(self, top: int) -> dict:
+        """Largest allocation sites, and the change since the previous snapshot"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        response = {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [str(stat) for stat in snapshot.statistics("lineno")[:top]],
+            "diff": [str(stat) for stat in snapshot.compare_to(self.last_snapshot, "lineno")[:top]] if self.last_snapshot else None,
+        }
+        self.last_snapshot = snapshot
+        return response
+
+
+# Shared session used by the admin endpoints
+profile_session = ProfileSession()
+
+
+def create_profiling_router(admin_dependency) -> APIRouter:
+    """Admin-only profiling endpoints under /admin/profile"""
+    router = APIRouter(prefix="/admin/profile", dependencies=[Depends(admin_dependency)], include_in_schema=False)
+
+    @router.get("")
+    async def profile_status():
+        return profile_session.status()
+
+    @router.post("/start")
+    async def start_profile(
+        mode: str = "sampling",
+        seconds: int = Query(30, gt=0, le=PROFILE_MAX_SECONDS),
+        requests: int = Query(0, ge=0),
+        interval_ms: float = Query(5.0, gt=0)
+    ):
+        """Profile for at most `seconds`, or until `requests` more requests have completed"""
+        try:
+            profile_session.start(mode, seconds, requests, interval_ms)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        return profile_session.status()
+
+    @router.post("/stop")
+    async def stop_profile():
+        profile_session.stop()
+        return profile_session.status()
+
+    @router.get("/result")
+    async def profile_result(format: str = "text"):
+        """Download the last session as pstats, collapsed stacks or text"""
+        result = profile_session.result
+        if result is None or format not in result or format in ("mode", "started_at", "duration_seconds"):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No {format} result available")
+        if format == "pstats":
+            return Response(
+                content=result["pstats"], media_type="application/octet-stream",
+                headers={"Content-Disposition": "attachment; filename=profile.pstats"}
+            )
+        if format == "collapsed":
+            return Response(
+                content=result["collapsed"], media_type="text/plain",
+                headers={"Content-Disposition": "attachment; filename=profile.collapsed"}
+            )
+        return Response(content=result["text"], media_type="text/plain")
+
+    @router.post("/memory/start")
+    async def start_memory_tracing(frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            profile_session.last_snapshot = None
+            logger.info(f"tracemalloc started with {frames} frames")
+        return {"tracemalloc": True}
+
+    @router.post("/memory/snapshot")
+    async def memory_snapshot(top: int = 20):
+        try:
+            # Taking a snapshot can take a while, keep it off the event loop
+            return await asyncio.to_thread(profile_session.memory_snapshot, top)
+        except RuntimeError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    @router.post("/memory/stop")
+    async def stop_memory_tracing():
+        tracemalloc.stop()
+        profile_session.last_snapshot = None
+        logger.info("tracemalloc stopped")
+        return {"tracemalloc": False}
+
+    return router
@@ -0,0 +1,195 @@
+import os
+import time
+import random
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+from app.logger import LazyJson
+from app.metrics import route_label
+from app.tracing import Span, current_span, read_trace_headers
+
+# Request logging modes, from cheapest to most detailed
+REQUEST_LOG_MODES = ("off", "errors", "sampled", "full")
+# Mode used for paths without an override
+REQUEST_LOG_MODE = os.environ.get("REQUEST_LOG_MODE", "full").lower()
+# Fraction of requests logged in "sampled" mode
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", 0.01))
+# Per-path overrides such as "/verify-token=errors,/docs=off". A path also covers
+# everything below it and the longest match wins. Replaces the service defaults when set.
+REQUEST_LOG_PATHS = os.environ.get("REQUEST_LOG_PATHS")
+
+# Paths whose resolved mode is remembered, bounded because paths can contain ids
+MAX_CACHED_PATHS = 10000
+
+
+def parse_path_modes(spec: str) -> Dict[str, str]:
+    """Parse "path=mode" pairs separated by commas"""
+    path_modes = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        path, _, mode = entry.partition("=")
+        mode = mode.strip().lower()
+        if mode not in REQUEST_LOG_MODES:
+            raise ValueError(f"Unknown request log mode '{mode}' for path {path}")
+        path_modes[path.strip().rstrip("/") or "/"] = mode
+    return path_modes
+
+
+class RequestLogPolicy:
+    """
+    Decides how much of each request is logged.
+
+    off logs nothing, errors logs requests that raise or return a 4xx/5xx
+    status once the response is known, sampled logs a random fraction of
+    requests in full plus the errors among the rest, and full logs every
+    request.
+    """
+
+    def __init__(self, mode: str = REQUEST_LOG_MODE, sample_rate: float = REQUEST_LOG_SAMPLE_RATE,
+                 path_modes: Optional[Dict[str, str]] = None):
+        if mode not in REQUEST_LOG_MODES:
+            raise ValueError(f"Unknown request log mode '{mode}'")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.path_modes = path_modes or {}
+        self.cache: Dict[str, str] = {}
+
+    def mode_for(self, path: str) -> str:
+        """Configured mode for a path"""
+        mode = self.cache.get(path)
+        if mode is not None:
+            return mode
+
+        mode = self.mode
+        longest = -1
+        for prefix, prefix_mode in self.path_modes.items():
+            if len(prefix) > longest and (path == prefix or path.startswith(prefix.rstrip("/") + "/")):
+                mode = prefix_mode
+                longest = len(prefix)
+
+        if len(self.cache) < MAX_CACHED_PATHS:
+            self.cache[path] = mode
+        return mode
+
+    def request_mode(self, path: str) -> Optional[str]:
+        """
+        How to log one request: "full" to log it as it happens, "errors" to
+        log it only if it fails, None to skip logging altogether.
+        """
+        mode = self.mode_for(path)
+        if mode == "full":
+            return "full"
+        if mode == "sampled":
+            return "full" if random.random() < self.sample_rate else "errors"
+        if mode == "errors":
+            return "errors"
+        return None
+
+
+def load_request_log_policy(default_paths: str = "") -> RequestLogPolicy:
+    """Build the policy from the environment, with the service's default path overrides"""
+    spec = REQUEST_LOG_PATHS if REQUEST_LOG_PATHS is not None else default_paths
+    return RequestLogPolicy(path_modes=parse_path_modes(spec))
+
+
+def decode_headers(raw_headers) -> Dict[str, str]:
+    """ASGI header pairs as a dict, keeping the first value of repeated headers"""
+    headers = {}
+    for name, value in raw_headers:
+        headers.setdefault(name.decode("latin-1"), value.decode("latin-1"))
+    return headers
+
+
+class RequestLoggingMiddleware:
+    """
+    ASGI middleware assigning each request an id (taken from X-Request-ID or
+    traceparent when the caller sends one), recording its server span and
+    logging the request and its response according to a RequestLogPolicy.
+
+    It only wraps the send callable, so responses, including streaming ones,
+    pass through without an extra task or buffer.
+    """
+
+    def __init__(self, app, logger, service: str, port, policy: RequestLogPolicy):
+        self.app = app
+        self.logger = logger
+        self.service = service
+        self.port = port
+        self.policy = policy
+
+    def log_request(self, scope, request_id: str, received_at: datetime):
+        client = scope.get("client")
+        # Serialized by the log writer, only if the record is written
+        self.logger.info("Request: %s", LazyJson({
+            "timestamp": received_at.isoformat(),
+            "request_id": request_id,
+            "source": client[0] if client else "unknown",
+            "destination": f"{self.service}:{self.port}{scope['path']}",
+            "method": scope["method"],
+            "path": scope["path"],
+            "query_params": dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)),
+            "headers": decode_headers(scope.get("headers", [])),
+        }))
+
+    def log_response(self, scope, request_id: str, message, duration: float):
+        entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "request_id": request_id,
+            "statusCode": message["status"],
+            # Time until the response headers were sent
+            "duration_ms": round(duration * 1000, 3),
+            "headers": decode_headers(message.get("headers", [])),
+        }
+        # Phase breakdown left by the Server-Timing middleware, if the request was timed
+        timings = scope.get("state", {}).get("timings")
+        if timings is not None:
+            entry["timing"] = timings.as_dict()
+        self.logger.info("Response: %s", LazyJson(entry))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Reuse the caller's request id, so both services log the same id for one request
+        request_id, parent_id = read_trace_headers(scope.get("headers", []))
+        # Endpoints can read the id from request.state.request_id
+        scope.setdefault("state", {})["request_id"] = request_id
+        span = Span(request_id, parent_id)
+        span_token = current_span.set(span)
+
+        mode = self.policy.request_mode(scope["path"])
+        received_at = datetime.utcnow()
+        started = time.perf_counter()
+        request_logged = False
+        status_code = 500
+        if mode == "full":
+            self.log_request(scope, request_id, received_at)
+            request_logged = True
+
+        async def send_with_logging(message):
+            nonlocal request_logged, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]}
+                if mode == "full" or (mode is not None and status_code >= 400):
+                    if not request_logged:
+                        self.log_request(scope, request_id, received_at)
+                        request_logged = True
+                    self.log_response(scope, request_id, message, time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_logging)
+        except Exception as e:
+            if mode is not None:
+                if not request_logged:
+                    self.log_request(scope, request_id, received_at)
+                duration_ms = (time.perf_counter() - started) * 1000
+                self.logger.error(f"Request failed: request_id={request_id}, duration_ms={duration_ms:.3f}, error={str(e)}")
+            raise
+        finally:
+            current_span.reset(span_token)
+            span.finish(self.service, f"{scope['method']} {route_label(scope)}", status=status_code)
@@ -0,0 +1,58 @@
+import time
+import asyncio
+import importlib
+from contextlib import contextmanager
+from typing import Dict, Iterable
+from app.metrics import Gauge
+from app.logger import get_logger
+
+# Configure logger
+logger = get_logger("transaction_service.startup")
+
+# Startup phases, reported on /metrics
+startup_phase_duration = Gauge("startup_phase_seconds", "Time spent in each startup phase", ("phase",))
+
+
+class StartupTimer:
+    """Per-phase durations of one service start, from the first import to ready"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.last = started
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str):
+        """Close a phase at the current time: everything since the previous mark"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self.last
+        self.last = now
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Time a block as one phase, leaving any gap before it to the next mark"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] = self.phases.get(phase, 0.0) + time.perf_counter() - start
+            self.last = time.perf_counter()
+
+    def report(self, service: str):
+        total = time.perf_counter() - self.started
+        for phase, seconds in self.phases.items():
+            startup_phase_duration.inc(phase, amount=seconds)
+        startup_phase_duration.inc("total", amount=total)
+        breakdown = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in self.phases.items())
+        logger.info(f"{service} ready in {total * 1000:.1f}ms ({breakdown})")
+
+
+async def warm_imports(modules: Iterable[str]):
+    """
+    Import modules that are only needed on first use in a worker thread, so
+    startup does not wait for them and the first request does not pay for them.
+    """
+    for module in modules:
+        try:
+            await asyncio.to_thread(importlib.import_module, module)
+        except Exception as e:
+            logger.warning(f"Could not preload {module}: {str(e)}")
@@ -0,0 +1,512 @@
+"""
+Storage benchmarks on a synthetic transactions database, without HTTP.
+
+Generates a database in the service's schema (legacy or compact, following
+COMPACT_STORAGE) with skewed customers and vendors, then measures inserts,
+point lookups, offset and keyset pagination, results lookups and aggregates.
+Each is run under several PRAGMA sets, through the ORM and SQLAlchemy Core,
+and with readers running during writes. Run from the transaction_service
+directory:
+    python -m app.storage_bench --rows 1000000
+    python -m app.storage_bench --rows 10000000 --pragmas default,wal --json storage.json
+"""
+
+import os
+
+# Slow query logging would report the benchmark's own deep scans
+os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, inspect, select, insert, delete, func, Integer, type_coerce
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import (
+    BASE_DIR, COMPACT_STORAGE, STATUS_CODES, COMPACT_AMOUNT_SCALE, EPOCH, Base,
+    TransactionModel, ResultModel, CustomerModel, encode_transaction_rows
+)
+from app.models import TransactionStatus
+
+# PRAGMA sets compared by the benchmarks
+PRAGMA_SETS = {
+    # What the service runs with today: SQLite's defaults
+    "default": {"journal_mode": "DELETE", "synchronous": "FULL"},
+    "wal": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+    "wal-tuned": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -65536, "mmap_size": 268435456, "temp_store": "MEMORY"},
+}
+
+# Rows written per transaction while generating the database
+GENERATE_BATCH = 50000
+# Rows per page for the pagination benchmarks, as the API's default page
+PAGE_SIZE = 100
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def cumulative_zipf(count: int, exponent: float) -> list:
+    """Cumulative weights where rank r is drawn in proportion to 1 / r^exponent"""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def bench_engine(path: str, pragmas: dict):
+    """Engine for the benchmark database, applying the PRAGMA set on every connection"""
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
+def summarize(latencies: list, rows_per_call: int = 1) -> dict:
+    """Throughput and latency percentiles of one benchmark"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    total = sum(ordered)
+
+    def percentile(p):
+        return round(ordered[min(count - 1, int(count * p / 100))] * 1000, 3) if count else 0.0
+
+    return {
+        "calls": count,
+        "per_second": round(count * rows_per_call / total, 1) if total else 0.0,
+        "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+def measure(operation, count: int, max_seconds: float) -> list:
+    """Call operation(i) up to count times, stopping early after max_seconds"""
+    latencies = []
+    deadline = time.perf_counter() + max_seconds
+    for i in range(count):
+        started = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - started)
+        if started > deadline:
+            break
+    return latencies
+
+
+class SyntheticData:
+    """Skewed customers and vendors, and rows in the layout of the active schema"""
+
+    def __init__(self, args):
+        self.random = random.Random(args.seed)
+        self.customers = args.customers or max(100, args.rows // 50)
+        self.vendors = args.vendors
+        self.customer_weights = cumulative_zipf(self.customers, args.skew)
+        self.vendor_weights = cumulative_zipf(self.vendors, args.skew)
+        self.customer_range = range(1, self.customers + 1)
+        self.vendor_range = range(1, self.vendors + 1)
+
+    def customer_numbers(self, count: int) -> list:
+        return self.random.choices(self.customer_range, cum_weights=self.customer_weights, k=count)
+
+    def vendor_numbers(self, count: int) -> list:
+        return self.random.choices(self.vendor_range, cum_weights=self.vendor_weights, k=count)
+
+    def new_row(self) -> dict:
+        """A new transaction as the API would create it, for the insert benchmarks"""
+        return {
+            "customer": f"customer-{self.customer_numbers(1)[0]}",
+            "vendor_id": f"vendor-{self.vendor_numbers(1)[0]}",
+            "amount": round(self.random.lognormvariate(3.5, 1.2), 2),
+            "timestamp": datetime.utcnow(),
+            "status": TransactionStatus.SUBMITTED,
+        }
+
+    def generate(self, engine, rows: int, results_ratio: float, days: int):
+        """Bulk load the database through the driver, building the secondary indexes afterwards"""
+        Base.metadata.create_all(bind=engine)
+        indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+        for index in indexes:
+            index.drop(bind=engine)
+
+        start = datetime.utcnow() - timedelta(days=days)
+        step = timedelta(days=days) / rows
+        statuses = [TransactionStatus.ACCEPTED] * 9 + [TransactionStatus.REJECTED]
+        # The newest transactions have not been reviewed yet
+        submitted_from = int(rows * 0.98)
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("PRAGMA journal_mode = OFF")
+            cursor.execute("PRAGMA synchronous = OFF")
+            if COMPACT_STORAGE:
+                cursor.executemany("INSERT INTO customers (id, name) VALUES (?, ?)", ((n, f"customer-{n}") for n in self.customer_range))
+                cursor.executemany("INSERT INTO vendors (id, name) VALUES (?, ?)", ((n, f"vendor-{n}") for n in self.vendor_range))
+                transaction_sql = "INSERT INTO transactions (id, customer_code, timestamp, status, vendor_code, amount) VALUES (?, ?, ?, ?, ?, ?)"
+            else:
+                transaction_sql = "INSERT INTO transactions (id, customer, timestamp, status, vendor_id, amount) VALUES (?, ?, ?, ?, ?, ?)"
+            result_sql = "INSERT INTO results (id, transaction_id, timestamp, is_fraud, confidence) VALUES (?, ?, ?, ?, ?)"
+
+            result_id = 0
+            for first in range(1, rows + 1, GENERATE_BATCH):
+                ids = range(first, min(rows, first + GENERATE_BATCH - 1) + 1)
+                customers = self.customer_numbers(len(ids))
+                vendors = self.vendor_numbers(len(ids))
+                transactions = []
+                results = []
+                for transaction_id, customer, vendor in zip(ids, customers, vendors):
+                    timestamp = start + step * transaction_id + timedelta(seconds=self.random.random())
+                    status = TransactionStatus.SUBMITTED if transaction_id > submitted_from else self.random.choice(statuses)
+                    amount = round(self.random.lognormvariate(3.5, 1.2), 2)
+                    reviewed = self.random.random() < results_ratio
+                    if COMPACT_STORAGE:
+                        transactions.append((
+                            transaction_id, customer, (timestamp - EPOCH) // timedelta(microseconds=1),
+                            STATUS_CODES[status], vendor, round(amount * COMPACT_AMOUNT_SCALE)
+                        ))
+                    else:
+                        transactions.append((
+                            transaction_id, f"customer-{customer}", timestamp.strftime(DATETIME_FORMAT),
+                            status.name, f"vendor-{vendor}", amount
+                        ))
+                    if reviewed:
+                        result_id += 1
+                        result_time = timestamp + timedelta(minutes=self.random.randrange(1, 600))
+                        results.append((
+                            result_id, transaction_id,
+                            (result_time - EPOCH) // timedelta(microseconds=1) if COMPACT_STORAGE else result_time.strftime(DATETIME_FORMAT),
+                            int(self.random.random() < 0.02), round(self.random.random(), 3)
+                        ))
+                cursor.executemany(transaction_sql, transactions)
+                cursor.executemany(result_sql, results)
+                connection.commit()
+                print(f"  {ids[-1]}/{rows} transactions", end="\r", flush=True)
+            print()
+            cursor.execute("PRAGMA journal_mode = DELETE")
+            cursor.close()
+        finally:
+            connection.close()
+
+        print("  Building indexes...")
+        for index in indexes:
+            index.create(bind=engine)
+
+
+class StorageBench:
+    """The benchmarks for one PRAGMA set, against an existing database"""
+
+    def __init__(self, engine, data: SyntheticData, args):
+        self.engine = engine
+        self.Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        self.data = data
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.transactions = TransactionModel.__table__
+        self.results = ResultModel.__table__
+        with engine.connect() as conn:
+            self.max_id = conn.execute(select(func.max(self.transactions.c.id))).scalar() or 0
+            self.max_result_id = conn.execute(select(func.max(self.results.c.id))).scalar() or 0
+
+    def run(self, apis: list) -> dict:
+        results = {}
+        try:
+            for api in apis:
+                results[f"{api} insert.single"] = summarize(measure(getattr(self, f"{api}_insert")(1), self.args.writes, self.args.max_seconds))
+                batch = self.args.batch_size
+                results[f"{api} insert.batched[{batch}]"] = summarize(
+                    measure(getattr(self, f"{api}_insert")(batch), self.args.batches, self.args.max_seconds), rows_per_call=batch
+                )
+                self.cleanup()
+                results[f"{api} lookup.point"] = summarize(self.point_lookups(api))
+                for depth in self.depths():
+                    results[f"{api} page.offset[{depth}]"] = summarize(self.pages(api, depth, keyset=False))
+                    results[f"{api} page.keyset[{depth}]"] = summarize(self.pages(api, depth, keyset=True))
+                results[f"{api} results.latest"] = summarize(self.latest_results(api))
+            for name, query in self.aggregates().items():
+                results[f"core aggregate.{name}"] = summarize(self.repeat_query(query))
+            results.update(self.mixed())
+        finally:
+            self.cleanup()
+        return results
+
+    def cleanup(self):
+        """Remove rows written by the benchmarks, so every run sees the generated database"""
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.results).where(self.results.c.id > self.max_result_id))
+            conn.execute(delete(self.transactions).where(self.transactions.c.id > self.max_id))
+
+    def depths(self) -> list:
+        """Page offsets from the first page to the last"""
+        last = max(0, self.max_id - PAGE_SIZE)
+        return sorted({0, min(1000, last), last // 10, last // 2, last})
+
+    def random_ids(self, count: int) -> list:
+        return [self.random.randint(1, self.max_id) for _ in range(count)]
+
+    # Inserts: one row per commit, or a batch of rows per commit
+
+    def core_insert(self, batch: int):
+        def operation(i):
+            rows = [self.data.new_row() for _ in range(batch)]
+            with self.engine.begin() as conn:
+                if COMPACT_STORAGE:
+                    rows = encode_transaction_rows(conn, rows)
+                conn.execute(insert(self.transactions), rows)
+        return operation
+
+    def orm_insert(self, batch: int):
+        def operation(i):
+            session = self.Session()
+            try:
+                session.add_all([TransactionModel(**self.data.new_row()) for _ in range(batch)])
+                session.commit()
+            finally:
+                session.close()
+        return operation
+
+    # Reads
+
+    def point_lookups(self, api: str) -> list:
+        ids = self.random_ids(self.args.lookups)
+        if api == "core":
+            with self.engine.connect() as conn:
+                query = lambda i: conn.execute(select(self.transactions).where(self.transactions.c.id == ids[i])).first()
+                return measure(query, len(ids), self.args.max_seconds)
+        session = self.Session()
+        try:
+            def query(i):
+                session.query(TransactionModel).filter(TransactionModel.id == ids[i]).first()
+                # A fresh identity map, as each request gets its own session
+                session.expunge_all()
+            return measure(query, len(ids), self.args.max_seconds)
+        finally:
+            session.close()
+
+    def pages(self, api: str, depth: int, keyset: bool) -> list:
+        """One page at an offset, or the same page found from the last id seen (ids start at 1)"""
+        if api == "core":
+            statement = select(self.transactions).order_by(self.transactions.c.id).limit(PAGE_SIZE)
+            statement = statement.where(self.transactions.c.id > depth) if keyset else statement.offset(depth)
+            with self.engine.connect() as conn:
+                return measure(lambda i: conn.execute(statement).all(), self.args.page_repeats, self.args.max_seconds)
+        session = self.Session()
+        try:
+            query = session.query(TransactionModel).order_by(TransactionModel.id)
+            query = query.filter(TransactionModel.id > depth) if keyset else query.offset(depth)
+            query = query.limit(PAGE_SIZE)
+
+            def fetch(i):
+                query.all()
+                session.expunge_all()
+            return measure(fetch, self.args.page_repeats, self.args.max_seconds)
+        finally:
+            session.close()
+
+    def latest_results(self, api: str) -> list:
+        """The latest result of a transaction, as read with each transaction"""
+        ids = self.random_ids(self.args.lookups)
+        if api == "core":
+            with self.engine.connect() as conn:
+                def query(i):
+                    conn.execute(
+                        select(self.results).where(self.results.c.transaction_id == ids[i]).order_by(self.results.c.timestamp.desc()).limit(1)
+                    ).first()
+                return measure(query, len(ids), self.args.max_seconds)
+        session = self.Session()
+        try:
+            def query(i):
+                session.query(ResultModel).filter(ResultModel.transaction_id == ids[i]).order_by(ResultModel.timestamp.desc()).first()
+                session.expunge_all()
+            return measure(query, len(ids), self.args.max_seconds)
+        finally:
+            session.close()
+
+    def aggregates(self) -> dict:
+        t = self.transactions
+        vendor = t.c.vendor_code if COMPACT_STORAGE else t.c.vendor_id
+        if COMPACT_STORAGE:
+            hot_customer = t.c.customer_code == select(CustomerModel.id).where(CustomerModel.name == "customer-1").scalar_subquery()
+            day = type_coerce(t.c.timestamp, Integer) // 86400000000
+        else:
+            hot_customer = t.c.customer == "customer-1"
+            day = func.date(t.c.timestamp)
+        return {
+            "count_by_status": select(t.c.status, func.count()).group_by(t.c.status),
+            "top_vendors": select(vendor, func.sum(t.c.amount), func.count()).group_by(vendor).order_by(func.sum(t.c.amount).desc()).limit(10),
+            "hot_customer_total": select(func.count(), func.sum(t.c.amount)).where(hot_customer),
+            "daily_volume_30d": select(day, func.count(), func.sum(t.c.amount)).where(
+                t.c.timestamp >= datetime.utcnow() - timedelta(days=30)
+            ).group_by(day),
+        }
+
+    def repeat_query(self, statement) -> list:
+        with self.engine.connect() as conn:
+            return measure(lambda i: conn.execute(statement).all(), self.args.aggregate_repeats, self.args.max_seconds)
+
+    # Readers during writes
+
+    def mixed(self) -> dict:
+        """Point lookups from reader threads while the main thread writes batches"""
+        stop = threading.Event()
+        reader_latencies = []
+        reader_errors = [0]
+        lock = threading.Lock()
+
+        def reader(seed):
+            rng = random.Random(seed)
+            latencies = []
+            with self.engine.connect() as conn:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        conn.execute(select(self.transactions).where(self.transactions.c.id == rng.randint(1, self.max_id))).first()
+                        conn.rollback()
+                    except OperationalError:
+                        with lock:
+                            reader_errors[0] += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+            with lock:
+                reader_latencies.extend(latencies)
+
+        threads = [threading.Thread(target=reader, args=(self.args.seed + n,), daemon=True) for n in range(self.args.readers)]
+        for thread in threads:
+            thread.start()
+        write = self.core_insert(self.args.batch_size)
+        writer_latencies = []
+        writer_errors = 0
+        deadline = time.perf_counter() + self.args.mixed_seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                write(0)
+            except OperationalError:
+                writer_errors += 1
+                continue
+            writer_latencies.append(time.perf_counter() - started)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        readers = f"[{self.args.readers} readers]"
+        return {
+            f"core mixed.writes{readers}": {**summarize(writer_latencies, rows_per_call=self.args.batch_size), "errors": writer_errors},
+            f"core mixed.reads{readers}": {**summarize(reader_latencies), "errors": reader_errors[0]},
+        }
+
+
+def generated_rows(engine):
+    """Transactions in an existing benchmark database, None if it is missing or in the other schema"""
+    inspector = inspect(engine)
+    if not inspector.has_table("transactions"):
+        return None
+    if {column["name"] for column in inspector.get_columns("transactions")} != set(TransactionModel.__table__.c.keys()):
+        return None
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(TransactionModel.__table__.c.id))).scalar()
+
+
+def print_results(pragmas: str, results: dict):
+    print(f"\nPRAGMA set: {pragmas} ({', '.join(f'{name}={value}' for name, value in PRAGMA_SETS[pragmas].items())})")
+    columns = ["calls", "per_second", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    width = max(len(name) for name in results)
+    print("  " + "".ljust(width) + "".join(column.rjust(11) for column in columns))
+    for name, summary in results.items():
+        errors = f"  errors={summary['errors']}" if summary.get("errors") else ""
+        print("  " + name.ljust(width) + "".join(str(summary[column]).rjust(11) for column in columns) + errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transaction storage layer on a synthetic database")
+    parser.add_argument("--db", default=os.path.join(BASE_DIR, "storage_bench.db"), help="benchmark database, generated if missing")
+    parser.add_argument("--rows", type=int, default=1000000, help="transactions to generate (default: 1000000)")
+    parser.add_argument("--customers", type=int, help="distinct customers (default: rows / 50)")
+    parser.add_argument("--vendors", type=int, default=500, help="distinct vendors (default: 500)")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of customer and vendor popularity (default: 1.1)")
+    parser.add_argument("--results-ratio", type=float, default=0.5, help="fraction of transactions with a result (default: 0.5)")
+    parser.add_argument("--days", type=int, default=365, help="days the transactions are spread over (default: 365)")
+    parser.add_argument("--regenerate", action="store_true", help="generate the database even if it exists")
+    parser.add_argument("--pragmas", default=",".join(PRAGMA_SETS), help=f"PRAGMA sets to compare (default: {','.join(PRAGMA_SETS)})")
+    parser.add_argument("--api", default="orm,core", help="orm, core or both (default: orm,core)")
+    parser.add_argument("--writes", type=int, default=200, help="single-row inserts (default: 200)")
+    parser.add_argument("--batches", type=int, default=20, help="batched inserts (default: 20)")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per batched insert (default: 500)")
+    parser.add_argument("--lookups", type=int, default=2000, help="point and results lookups (default: 2000)")
+    parser.add_argument("--page-repeats", type=int, default=20, help="fetches of each page (default: 20)")
+    parser.add_argument("--aggregate-repeats", type=int, default=5, help="runs of each aggregate query (default: 5)")
+    parser.add_argument("--readers", type=int, default=4, help="reader threads during writes (default: 4)")
+    parser.add_argument("--mixed-seconds", type=float, default=5, help="duration of the readers-during-writes run (default: 5)")
+    parser.add_argument("--max-seconds", type=float, default=10, help="time limit of each benchmark (default: 10)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    pragma_names = [name for name in args.pragmas.split(",") if name]
+    for name in pragma_names:
+        if name not in PRAGMA_SETS:
+            parser.error(f"unknown PRAGMA set '{name}', choose from {', '.join(PRAGMA_SETS)}")
+    apis = [api for api in args.api.split(",") if api]
+    if any(api not in ("orm", "core") for api in apis):
+        parser.error("--api takes orm, core or both")
+
+    data = SyntheticData(args)
+    schema = "compact" if COMPACT_STORAGE else "legacy"
+    engine = bench_engine(args.db, {})
+    if args.regenerate or generated_rows(engine) != args.rows:
+        engine.dispose()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        engine = bench_engine(args.db, {})
+        print(f"Generating {args.rows} transactions ({schema} schema) in {args.db}...")
+        started = time.perf_counter()
+        data.generate(engine, args.rows, args.results_ratio, args.days)
+        print(f"  Done in {time.perf_counter() - started:.1f}s, {os.path.getsize(args.db) / 1048576:.1f}MB")
+    else:
+        print(f"Using {args.db}: {args.rows} transactions ({schema} schema)")
+    engine.dispose()
+
+    report = {
+        "config": {
+            "rows": args.rows,
+            "schema": schema,
+            "customers": data.customers,
+            "vendors": data.vendors,
+            "skew": args.skew,
+            "results_ratio": args.results_ratio,
+            "batch_size": args.batch_size,
+            "readers": args.readers,
+        },
+        "pragmas": {},
+    }
+    for pragmas in pragma_names:
+        engine = bench_engine(args.db, PRAGMA_SETS[pragmas])
+        try:
+            results = StorageBench(engine, data, args).run(apis)
+        finally:
+            engine.dispose()
+        report["pragmas"][pragmas] = results
+        print_results(pragmas, results)
+
+    # Leave the file in rollback journal mode, as the service opens it
+    engine = bench_engine(args.db, {"journal_mode": "DELETE"})
+    with engine.connect():
+        pass
+    engine.dispose()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
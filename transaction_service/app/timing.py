@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import functools
+from contextvars import ContextVar
+from typing import Dict, Optional
+from fastapi.routing import APIRoute
+
+# When to time requests: "header" (only requests sending SERVER_TIMING_HEADER), "always" or "off"
+SERVER_TIMING_MODE = os.environ.get("SERVER_TIMING_MODE", "header").lower()
+# Request header asking for a timing breakdown, e.g. "X-Debug-Timing: 1"
+SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", "x-debug-timing").lower().encode("latin-1")
+
+# Phases in the order they appear in the Server-Timing header, with their descriptions
+PHASES = {
+    "auth": "Token verification",
+    "db": "SQLite",
+    "app": "Endpoint",
+    "serialize": "Response validation and serialization",
+    "total": "Total",
+}
+
+
+class RequestTimings:
+    """Time spent per phase of one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, phase: str, seconds: float):
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    def finish(self):
+        self.durations["total"] = time.perf_counter() - self.start
+
+    def as_dict(self) -> Dict[str, float]:
+        """Phase durations in milliseconds"""
+        return {phase: round(self.durations[phase] * 1000, 3) for phase in PHASES if phase in self.durations}
+
+    def header_value(self) -> str:
+        entries = []
+        for phase, duration in self.as_dict().items():
+            description = PHASES[phase]
+            if phase == "db":
+                queries = self.counts["db"]
+                description += f" ({queries} {'query' if queries == 1 else 'queries'})"
+            entries.append(f'{phase};dur={duration};desc="{description}"')
+        return ", ".join(entries)
+
+
+# Timings of the current request, None unless timing was requested
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_timing(phase: str, seconds: float):
+    """Add to a phase of the current request, if it is being timed"""
+    timings = request_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class timing the endpoint body and everything around it in the
+    route handler, which is mostly response validation and serialization.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **endpoint_kwargs):
+                if request_timings.get() is None:
+                    return await original(*args, **endpoint_kwargs)
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **endpoint_kwargs)
+                finally:
+                    record_timing("app", time.perf_counter() - start)
+
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = request_timings.get()
+            if timings is None:
+                return await handler(request)
+            start = time.perf_counter()
+            response = await handler(request)
+            # Whatever the handler spent outside auth and the endpoint body
+            elapsed = time.perf_counter() - start
+            timings.add("serialize", max(0.0, elapsed - timings.durations.get("auth", 0.0) - timings.durations.get("app", 0.0)))
+            return response
+
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware enabling per-request phase timing. The breakdown is sent
+    back in a Server-Timing header and left in scope["state"]["timings"] for
+    the request log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or SERVER_TIMING_MODE == "off":
+            await self.app(scope, receive, send)
+            return
+        if SERVER_TIMING_MODE != "always" and not any(name == SERVER_TIMING_HEADER for name, _ in scope.get("headers", [])):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        scope.setdefault("state", {})["timings"] = timings
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings.finish()
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header_value().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = request_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
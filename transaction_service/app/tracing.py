@@ -0,0 +1,115 @@
+import os
+import re
+import hashlib
+import time
+import uuid
+import logging
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from app.logger import BatchRotatingFileHandler, PipelineQueueHandler, LazyJson, log_writer
+
+# Span records are only written when enabled, request ids are propagated either way
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+# Directory of the per-service trace files (<service>_trace.jsonl)
+TRACE_DIR = os.environ.get("TRACE_DIR", os.path.join(os.getcwd(), "logs"))
+
+# Incoming request ids are reused only if they look like ids
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# W3C trace context: version-trace_id-parent_id-flags
+TRACEPARENT_PATTERN = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# Trace loggers by service name
+trace_loggers: Dict[str, logging.Logger] = {}
+
+
+def get_trace_logger(service: str) -> logging.Logger:
+    """Logger writing span records as JSON lines, through the background log writer"""
+    if service not in trace_loggers:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        file_handler = BatchRotatingFileHandler(
+            os.path.join(TRACE_DIR, f"{service}_trace.jsonl"),
+            maxBytes=10485760,  # 10MB
+            backupCount=5
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        queue_handler = PipelineQueueHandler(log_writer.queue, [file_handler])
+        log_writer.queue_handlers.append(queue_handler)
+
+        trace_logger = logging.getLogger(f"{service}.trace")
+        trace_logger.setLevel(logging.INFO)
+        # Spans must not end up in the service log
+        trace_logger.propagate = False
+        trace_logger.addHandler(queue_handler)
+        trace_loggers[service] = trace_logger
+    return trace_loggers[service]
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+class Span:
+    """One timed operation of a request, identified by its request (trace) id"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "start", "started")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.started = time.perf_counter()
+
+    def child(self) -> "Span":
+        return Span(self.trace_id, self.span_id)
+
+    def finish(self, service: str, name: str, **attributes):
+        """Write the span record if tracing is enabled"""
+        if not TRACE_ENABLED:
+            return
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": service,
+            "name": name,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+        }
+        record.update(attributes)
+        get_trace_logger(service).info("%s", LazyJson(record))
+
+    def headers(self) -> Dict[str, str]:
+        """Headers propagating this span to a downstream service"""
+        trace_hex = self.trace_id.replace("-", "")
+        if len(trace_hex) != 32 or any(c not in "0123456789abcdef" for c in trace_hex):
+            # Not a uuid: traceparent needs 32 hex digits, X-Request-ID still carries the id
+            trace_hex = hashlib.md5(self.trace_id.encode("utf-8")).hexdigest()
+        return {"X-Request-ID": self.trace_id, "traceparent": f"00-{trace_hex}-{self.span_id}-01"}
+
+
+# Span of the operation currently running in this context
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def read_trace_headers(raw_headers) -> Tuple[str, Optional[str]]:
+    """Request id and parent span id from incoming ASGI headers, or a new request id"""
+    request_id = None
+    parent_id = None
+    for name, value in raw_headers:
+        if name == b"x-request-id":
+            candidate = value.decode("latin-1").strip()
+            if REQUEST_ID_PATTERN.match(candidate):
+                request_id = candidate
+        elif name == b"traceparent":
+            match = TRACEPARENT_PATTERN.match(value.decode("latin-1").strip())
+            if match:
+                parent_id = match.group(2)
+                if request_id is None:
+                    request_id = str(uuid.UUID(match.group(1)))
+    return request_id or str(uuid.uuid4()), parent_id
+
+
+def child_span() -> Span:
+    """New span below the current one, or a new trace outside of a request"""
+    parent = current_span.get()
+    return parent.child() if parent is not None else Span(str(uuid.uuid4()))